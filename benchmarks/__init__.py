@@ -0,0 +1,6 @@
+"""Benchmarks of HG502 on synthetic save folders.
+
+Run from the repository root:
+
+    python -m benchmarks.run --output benchmarks.jsonl
+"""
@@ -0,0 +1,370 @@
+"""Runs the benchmarks and records the results.
+
+Each stage of collecting statistics is timed separately on a generated save
+folder: finding the files, parsing them with d2lib and with the fast
+scanner, canonicalizing the items, aggregating the statistics, filling
+the item lists of a new GUI window and updating them between two refreshes.
+A run is appended to the output file as one JSON line, so runs of different
+versions can be compared; the previous run of the file with the same folder
+parameters is printed next to the current one.
+"""
+
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+from functools import lru_cache
+from pathlib import Path
+
+from benchmarks.saves import (
+    add_folder_args,
+    generate_save_folder,
+    get_folder_params,
+)
+from hg502_tracker import __version__
+from hg502_tracker.folders import scan_save_files
+from hg502_tracker.hg502 import HG502, _read_items
+from hg502_tracker.scanner import scan_items
+
+ROOT_PATH = Path(__file__).absolute().parent.parent
+STAGES = (
+    'scan_folder',
+    'parse_d2lib',
+    'parse_fast',
+    'filter_items',
+    'aggregate_stat',
+    'fill_gui',
+    'update_gui',
+)
+GUI_STAGES = ('fill_gui', 'update_gui')
+# Number of found items that the previous refresh of update_gui did not have.
+NEW_FINDS = 3
+
+
+def _time(func, repeat, setup=None):
+    """Calls a function several times and measures each call.
+
+    :type func: function
+    :type repeat: int
+    :param setup: Function called before each call that is not measured,
+    its result is passed to func
+    :type setup: function or None
+    :return: Timings in seconds and the result of the last call
+    :rtype: tuple
+    """
+    timings = []
+    result = None
+    for _ in range(repeat):
+        args = () if setup is None else (setup(),)
+        start = time.perf_counter()
+        result = func(*args)
+        timings.append(time.perf_counter() - start)
+    return timings, result
+
+
+def _summarize(timings):
+    """Makes the recorded summary of timings.
+
+    :type timings: list
+    :rtype: dict
+    """
+    return {
+        'min': min(timings),
+        'median': statistics.median(timings),
+        'max': max(timings),
+        'runs': len(timings),
+    }
+
+
+def _get_commit():
+    """Returns the current git commit or None outside of a repository.
+
+    :rtype: str or None
+    """
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'],
+            cwd=str(ROOT_PATH),
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+            check=True,
+            universal_newlines=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _aggregate(backend):
+    """Collects the statistics of the cached files.
+
+    The statistics of the previous call are forgotten first, otherwise every
+    call after the first one would return them without aggregating.
+
+    :type backend: hg502_tracker.hg502.HG502
+    :rtype: hg502_tracker.stat.GrailStat
+    """
+    backend._last_stat = None
+    return backend.get_cached_stat(with_counts=True)
+
+
+def _get_previous_stat(backend, stats):
+    """Returns the statistics as if the last few items were not found yet.
+
+    :type backend: hg502_tracker.hg502.HG502
+    :param stats: Current statistics of the backend
+    :type stats: hg502_tracker.stat.GrailStat
+    :rtype: hg502_tracker.stat.GrailStat
+    """
+    state = stats.state
+    layout = state.layout
+    new_finds = layout.make_state(
+        unique_ids=state.get_unique_ids()[-NEW_FINDS:]
+    )
+    backend._user_items = state - new_finds
+    try:
+        return backend._get_hg502_stat()
+    finally:
+        backend._user_items = state
+
+
+@lru_cache(maxsize=None)
+def _get_qapp():
+    """Returns the application of the windows, it is kept for all of them.
+
+    :rtype: QApplication
+    """
+    os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+    from PyQt5.QtWidgets import QApplication
+
+    return QApplication.instance() or QApplication([])
+
+
+def _new_gui():
+    """Creates an enabled main window.
+
+    :rtype: hg502_tracker.gui.HG502GUI
+    """
+    _get_qapp()
+    from hg502_tracker.gui import HG502GUI
+
+    # The *.ui files are found relative to the package directory.
+    cwd = os.getcwd()
+    os.chdir(str(ROOT_PATH.joinpath('hg502_tracker')))
+    try:
+        gui = HG502GUI()
+    finally:
+        os.chdir(cwd)
+    gui.set_widgets_status('enable')
+    return gui
+
+
+def _fill_gui(gui, stats):
+    """Fills the item lists of a main window, all tabs are shown once.
+
+    :type gui: hg502_tracker.gui.HG502GUI
+    :param stats: Result of HG502.get_hg502_stat with counts
+    :type stats: hg502_tracker.stat.GrailStat
+    """
+    _, set_stat, unique_stat = stats
+    gui.fill_set_items_list(
+        set_stat['found_items'], set_stat['remaining_items']
+    )
+    gui.fill_unique_items_list(
+        unique_stat['found_items'], unique_stat['remaining_items']
+    )
+    gui.fill_all_items_list((stats.all_found,), (stats.all_remaining,))
+    gui.fill_duplicates_list(
+        (set_stat['duplicates'], unique_stat['duplicates'])
+    )
+    # All tabs are shown once, so the lazy ones are filled too.
+    for tab_index in range(gui._items_tab.count()):
+        gui._items_tab.setCurrentIndex(tab_index)
+        _get_qapp().processEvents()
+    gui._items_tab.setCurrentIndex(0)
+
+
+def _update_gui(stats, previous_stats):
+    """Returns a function that updates a filled window between two states.
+
+    Each call shows the other statistics, so every call applies the rows
+    of the items found since the previous refresh or removes them.
+
+    :type stats: hg502_tracker.stat.GrailStat
+    :type previous_stats: hg502_tracker.stat.GrailStat
+    :rtype: function
+    """
+    gui = _new_gui()
+    _fill_gui(gui, stats)
+    states = [previous_stats, stats]
+
+    def update():
+        states.reverse()
+        _fill_gui(gui, states[1])
+
+    return update
+
+
+def run_benchmarks(folder, repeat=5, with_gui=True):
+    """Times each stage of collecting statistics of a save folder.
+
+    :param folder: Diablo 2 save folder
+    :type folder: str
+    :param repeat: Number of measurements of each stage
+    :type repeat: int
+    :param with_gui: Also time filling and updating the GUI lists, needs
+    PyQt5
+    :type with_gui: bool
+    :return: Dictionary {stage: summary}, see STAGES and _summarize
+    :rtype: dict
+    """
+    backend = HG502()
+    results = {}
+
+    timings, files = _time(lambda: scan_save_files(folder), repeat)
+    results['scan_folder'] = _summarize(timings)
+    file_paths = sorted(files)
+
+    timings, records = _time(
+        lambda: [_read_items(file_path) for file_path in file_paths], repeat
+    )
+    results['parse_d2lib'] = _summarize(timings)
+    timings, _ = _time(
+        lambda: [scan_items(file_path) for file_path in file_paths], repeat
+    )
+    results['parse_fast'] = _summarize(timings)
+
+    filter_items = backend._filter_items
+    timings, _ = _time(
+        lambda: [filter_items(file_records) for file_records in records],
+        repeat,
+    )
+    results['filter_items'] = _summarize(timings)
+
+    # The files are parsed once, aggregation works on the per-file cache.
+    backend.get_hg502_stat(folder)
+    timings, stats = _time(lambda: _aggregate(backend), repeat)
+    results['aggregate_stat'] = _summarize(timings)
+
+    if with_gui:
+        timings, _ = _time(
+            lambda gui: _fill_gui(gui, stats), repeat, setup=_new_gui
+        )
+        results['fill_gui'] = _summarize(timings)
+        previous_stats = _get_previous_stat(backend, stats)
+        timings, _ = _time(_update_gui(stats, previous_stats), repeat)
+        results['update_gui'] = _summarize(timings)
+    return results
+
+
+def _load_last_run(output_path, folder):
+    """Returns the last run recorded in the output file for the same folder.
+
+    :type output_path: str
+    :param folder: Parameters of the generated folder, see main
+    :type folder: dict
+    :rtype: dict or None
+    """
+    try:
+        with open(output_path, 'r') as output_file:
+            lines = output_file.read().splitlines()
+    except OSError:
+        return None
+    for line in reversed(lines):
+        try:
+            run = json.loads(line)
+        except ValueError:
+            continue
+        if run.get('folder') == folder:
+            return run
+    return None
+
+
+def _print_results(results, last_run):
+    """Prints the medians of the stages and of the previous run.
+
+    :type results: dict
+    :type last_run: dict or None
+    """
+    last_results = (last_run or {}).get('results', {})
+    print(f'{"stage":<16}{"median, ms":>12}{"previous, ms":>14}{"ratio":>8}')
+    for stage in STAGES:
+        if stage not in results:
+            continue
+        median = results[stage]['median'] * 1000
+        line = f'{stage:<16}{median:>12.2f}'
+        last_stage = last_results.get(stage)
+        if last_stage is not None:
+            last_median = last_stage['median'] * 1000
+            line += f'{last_median:>14.2f}{median / last_median:>8.2f}'
+        print(line)
+
+
+def _parse_args(argv):
+    """Parses command line arguments.
+
+    :type argv: list or None
+    :rtype: argparse.Namespace
+    """
+    parser = argparse.ArgumentParser(
+        prog='python -m benchmarks.run',
+        description='Times the stages of collecting HG502 statistics on a '
+        'synthetic save folder.',
+    )
+    parser.add_argument(
+        '-o',
+        '--output',
+        metavar='PATH',
+        help='JSON lines file to which the run is appended',
+    )
+    parser.add_argument(
+        '-r',
+        '--repeat',
+        type=int,
+        default=5,
+        help='measurements of each stage (default: 5)',
+    )
+    parser.add_argument(
+        '--no-gui', action='store_true', help='do not time the GUI lists'
+    )
+    add_folder_args(parser)
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    """Runs the benchmarks.
+
+    :type argv: list or None
+    :rtype: int
+    """
+    args = _parse_args(argv)
+    folder_params = get_folder_params(args)
+    with tempfile.TemporaryDirectory() as folder:
+        file_paths = generate_save_folder(folder, **folder_params)
+        results = run_benchmarks(folder, args.repeat, not args.no_gui)
+
+    run = {
+        'time': datetime.now(timezone.utc).isoformat(),
+        'version': __version__,
+        'commit': _get_commit(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'folder': dict(folder_params, files=len(file_paths)),
+        'results': results,
+    }
+    last_run = None
+    if args.output:
+        last_run = _load_last_run(args.output, run['folder'])
+        with open(args.output, 'a') as output_file:
+            output_file.write(json.dumps(run) + '\n')
+    _print_results(results, last_run)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
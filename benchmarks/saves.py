@@ -0,0 +1,266 @@
+"""Generator of synthetic but valid Diablo 2 save folders.
+
+Items are not encoded from scratch: the byte blocks of the items of sample
+PlugY stashes are cut out together with the items socketed into them and
+are laid out on as many new stash pages as needed. Characters are copies of
+a sample .d2s file. The generated files are parsed by d2lib and by the fast
+scanner like real ones.
+
+A socketed item has its inserted items right after it, the format has no
+deeper nesting, so "deeply socketed" means filled sockets of many items.
+"""
+
+import argparse
+import random
+import sys
+from pathlib import Path
+
+from d2lib.files import SSSFile
+from d2lib.item import Item
+
+from hg502_tracker.scanner import (
+    _ITEMS_HEADER,
+    _ITEMS_HEADER_VALUE,
+    _BitReader,
+    _ItemsData,
+    _read_int,
+    _scan_item,
+)
+
+SAMPLE_PATH = Path(__file__).absolute().parent.parent.joinpath('tests', 'data')
+SAMPLE_D2S = 'test_d2s.d2s'
+SAMPLE_D2X = 'test_d2x.d2x'
+SAMPLE_SSS = 'test_sss.sss'
+SHARED_STASH_NAME = '_LOD_SharedStashSave.sss'
+
+
+class SampleStash(object):
+    """Header, page header and item blocks of a sample PlugY stash."""
+
+    def __init__(self, file_path):
+        """Initializes an instance.
+
+        :param file_path: Path to .d2x or .sss file
+        :type file_path: str or pathlib.Path
+        """
+        data = Path(file_path).read_bytes()
+        if Path(file_path).suffix == '.sss':
+            version = _read_int(data, 4, 2)
+            page_count_offset = 6 if version == SSSFile._VERSION_1 else 10
+        else:
+            page_count_offset = 10
+        self.header = data[:page_count_offset]
+        self.page_header = None
+        # Byte blocks of top-level items with their socketed items.
+        self.items = []
+        self.socketed_items = []
+
+        page_count = _read_int(data, page_count_offset, 4)
+        offset = page_count_offset + 4
+        for _ in range(page_count):
+            items_offset = data.index(_ITEMS_HEADER, offset)
+            if self.page_header is None:
+                self.page_header = data[offset:items_offset]
+            offset = self._read_page(data, items_offset)
+
+    def _read_page(self, data, offset):
+        """Cuts out the items of a page.
+
+        :type data: bytes
+        :param offset: Offset of the item list header
+        :type offset: int
+        :return: Offset of the next page
+        :rtype: int
+        """
+        items_data = _ItemsData.get()
+        reader = _BitReader(data, offset * 8)
+        if reader.read(16) != _ITEMS_HEADER_VALUE:
+            raise ValueError('Invalid items header')
+        items_count = reader.read(16)
+        block_start = reader.offset
+        inserted_count = 0
+        while items_count:
+            item_start = reader.offset
+            location_id, inserted, _ = _scan_item(reader, items_data)
+            if location_id != Item.LOC_SOCKETED:
+                self._add_item(data[block_start:item_start], inserted_count)
+                block_start = item_start
+                inserted_count = 0
+                items_count += inserted
+            else:
+                inserted_count += 1
+            items_count -= 1
+        block_end = reader.offset
+        self._add_item(data[block_start:block_end], inserted_count)
+        return block_end
+
+    def _add_item(self, block, inserted_count):
+        """Adds the block of an item and its socketed items.
+
+        :type block: bytes
+        :type inserted_count: int
+        """
+        if not block:
+            return None
+        self.items.append(block)
+        if inserted_count:
+            self.socketed_items.append(block)
+
+    def build(self, pages):
+        """Builds a stash file of the same kind as the sample.
+
+        :param pages: Lists of item blocks, one list per page
+        :type pages: list
+        :rtype: bytes
+        """
+        chunks = [self.header, len(pages).to_bytes(4, 'little')]
+        for page_items in pages:
+            chunks.append(self.page_header)
+            chunks.append(_ITEMS_HEADER)
+            chunks.append(len(page_items).to_bytes(2, 'little'))
+            chunks.extend(page_items)
+        return b''.join(chunks)
+
+    def make_pages(self, page_count, items_per_page, socketed_ratio, rng):
+        """Fills pages with random items of the sample.
+
+        :type page_count: int
+        :type items_per_page: int
+        :param socketed_ratio: Share of items with filled sockets
+        :type socketed_ratio: float
+        :type rng: random.Random
+        :rtype: list
+        """
+        pages = []
+        for _ in range(page_count):
+            page_items = []
+            for _ in range(items_per_page):
+                if self.socketed_items and rng.random() < socketed_ratio:
+                    page_items.append(rng.choice(self.socketed_items))
+                else:
+                    page_items.append(rng.choice(self.items))
+            pages.append(page_items)
+        return pages
+
+
+def generate_save_folder(
+    folder,
+    characters=8,
+    shared_pages=300,
+    personal_pages=50,
+    items_per_page=20,
+    socketed_ratio=0.3,
+    seed=0,
+    sample_path=SAMPLE_PATH,
+):
+    """Generates a save folder with characters and PlugY stashes.
+
+    :param folder: Directory to write the files to, it is created if missing
+    :type folder: str or pathlib.Path
+    :param characters: Number of characters, each has a .d2s and a .d2x file
+    :type characters: int
+    :param shared_pages: Number of pages of the shared stash
+    :type shared_pages: int
+    :param personal_pages: Number of pages of each personal stash
+    :type personal_pages: int
+    :param items_per_page: Number of top-level items per stash page
+    :type items_per_page: int
+    :param socketed_ratio: Share of stash items with filled sockets
+    :type socketed_ratio: float
+    :param seed: Seed of the item choice, the same parameters give the same
+    files
+    :type seed: int
+    :param sample_path: Directory with the sample files
+    :type sample_path: str or pathlib.Path
+    :return: Paths to the generated files
+    :rtype: list
+    """
+    folder = Path(folder)
+    sample_path = Path(sample_path)
+    folder.mkdir(parents=True, exist_ok=True)
+    rng = random.Random(seed)
+    d2s_data = sample_path.joinpath(SAMPLE_D2S).read_bytes()
+    personal_stash = SampleStash(sample_path.joinpath(SAMPLE_D2X))
+    shared_stash = SampleStash(sample_path.joinpath(SAMPLE_SSS))
+    # Personal stashes take the items of both samples.
+    personal_stash.items += shared_stash.items
+    personal_stash.socketed_items += shared_stash.socketed_items
+
+    file_paths = []
+    for number in range(characters):
+        d2s_path = folder.joinpath(f'char{number:03}.d2s')
+        d2s_path.write_bytes(d2s_data)
+        d2x_path = d2s_path.with_suffix('.d2x')
+        pages = personal_stash.make_pages(
+            personal_pages, items_per_page, socketed_ratio, rng
+        )
+        d2x_path.write_bytes(personal_stash.build(pages))
+        file_paths += [d2s_path, d2x_path]
+
+    sss_path = folder.joinpath(SHARED_STASH_NAME)
+    pages = shared_stash.make_pages(
+        shared_pages, items_per_page, socketed_ratio, rng
+    )
+    sss_path.write_bytes(shared_stash.build(pages))
+    file_paths.append(sss_path)
+    return [str(file_path) for file_path in file_paths]
+
+
+def _parse_args(argv):
+    """Parses command line arguments.
+
+    :type argv: list or None
+    :rtype: argparse.Namespace
+    """
+    parser = argparse.ArgumentParser(
+        prog='python -m benchmarks.saves',
+        description='Generates a synthetic Diablo 2 save folder.',
+    )
+    parser.add_argument('folder', help='directory to write the files to')
+    add_folder_args(parser)
+    return parser.parse_args(argv)
+
+
+def add_folder_args(parser):
+    """Adds the parameters of generate_save_folder to a parser.
+
+    :type parser: argparse.ArgumentParser
+    """
+    parser.add_argument('--characters', type=int, default=8)
+    parser.add_argument('--shared-pages', type=int, default=300)
+    parser.add_argument('--personal-pages', type=int, default=50)
+    parser.add_argument('--items-per-page', type=int, default=20)
+    parser.add_argument('--socketed-ratio', type=float, default=0.3)
+    parser.add_argument('--seed', type=int, default=0)
+
+
+def get_folder_params(args):
+    """Returns the parameters of generate_save_folder from parsed args.
+
+    :type args: argparse.Namespace
+    :rtype: dict
+    """
+    return {
+        'characters': args.characters,
+        'shared_pages': args.shared_pages,
+        'personal_pages': args.personal_pages,
+        'items_per_page': args.items_per_page,
+        'socketed_ratio': args.socketed_ratio,
+        'seed': args.seed,
+    }
+
+
+def main(argv=None):
+    """Generates a save folder.
+
+    :type argv: list or None
+    :rtype: int
+    """
+    args = _parse_args(argv)
+    file_paths = generate_save_folder(args.folder, **get_folder_params(args))
+    print(f'{len(file_paths)} files written to {args.folder}')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -6,8 +6,12 @@ from tarfile import TarFile
 from zipfile import ZIP_DEFLATED, ZipFile
 
 import PyInstaller.__main__
+from PyQt5 import uic
 
 from hg502_tracker import __app_name__, __version__
+from hg502_tracker.catalog import BASES_PATH, CATALOG_PATH, load_catalog
+from hg502_tracker.gui import UI_MODULE_PREFIX
+from hg502_tracker.hg502 import HG502
 
 BUILD_DIR = 'build'
 DIST_DIR = 'dist'
@@ -26,6 +30,19 @@ def retrieve_file_paths(directory):
     return file_list
 
 
+def compile_ui():
+    """Compiles *.ui files to modules that are imported instead of them."""
+    package, module_prefix = UI_MODULE_PREFIX.split('.')
+    hidden_imports = []
+    for ui_path in Path(UI_DIR).glob('*.ui'):
+        module_name = f'{module_prefix}{ui_path.stem}'
+        module_path = Path(package).joinpath(f'{module_name}.py')
+        with module_path.open('w') as module_file:
+            uic.compileUi(str(ui_path), module_file)
+        hidden_imports.append(f'--hidden-import={package}.{module_name}')
+    return hidden_imports
+
+
 def build_package():
     build_path = Path(BUILD_DIR)
     build_path.mkdir(exist_ok=True)
@@ -37,15 +54,23 @@ def build_package():
         if Path(path).stem == 'site-packages':
             site_packages_path = path
 
+    path_sep = ';' if sys.platform == 'win32' else ':'
+
     items_data = 'd2lib/items_data'
     items_data_path = Path(site_packages_path).joinpath(items_data)
 
+    # Writes the precompiled catalog of the HG 502 rules, the rules HG502
+    # loads it with, if it is missing or outdated.
+    load_catalog(CATALOG_PATH, HG502.get_rules())
+    catalog_data = f'{CATALOG_PATH}{path_sep}hg502_tracker'
+    bases_data = f'{BASES_PATH}{path_sep}hg502_tracker'
+
+    hidden_imports = compile_ui()
+
     ui_path = Path(UI_DIR).absolute()
     static_path = Path(STATIC_DIR).absolute()
     icon_path = static_path.joinpath(ICON_NAME).absolute()
 
-    path_sep = ';' if sys.platform == 'win32' else ':'
-
     _items_data = f'{items_data_path}{path_sep}{items_data}'
     ui_data = f'{ui_path}{path_sep}{UI_DIR}'
     static_data = f'{static_path}{path_sep}{STATIC_DIR}'
@@ -63,7 +88,10 @@ def build_package():
             f'--add-data={_items_data}',
             f'--add-data={ui_data}',
             f'--add-data={static_data}',
+            f'--add-data={catalog_data}',
+            f'--add-data={bases_data}',
             f'--icon={icon_path}',
+            *hidden_imports,
             SCRIPT_PATH,
         ]
     )
@@ -1,7 +1,8 @@
+import sqlite3
 import sys
 from pathlib import Path
 
-import qdarkstyle
+from PyQt5 import QtCore
 
 from hg502_tracker import (
     __app_name__,
@@ -11,27 +12,255 @@ from hg502_tracker import (
     __license__,
     __version__,
 )
-from hg502_tracker.hg502 import FileParseError
+from hg502_tracker.folders import SaveScanner, find_save_folders
+from hg502_tracker.hg502 import ParseInterrupted
+from hg502_tracker.history import HistoryStore
+from hg502_tracker.metrics import (
+    format_details,
+    format_summary,
+    profile_thread,
+)
+from hg502_tracker.search import SearchIndex
+
+
+class _RefreshCancelled(Exception):
+    """Used to stop parsing when a refresh is cancelled."""
+
+    pass
+
+
+class _RefreshWorker(QtCore.QThread):
+    """Collects statistics in a background thread.
+
+    The results are posted to the GUI thread through signals.
+    """
+
+    progress = QtCore.pyqtSignal(int, int)
+    succeeded = QtCore.pyqtSignal(list, object)
+    failed = QtCore.pyqtSignal(list, object)
+
+    def __init__(self, backend, save_paths):
+        """Initializes an instance.
+
+        :type backend: src.hg502_tracker.HG502
+        :type save_paths: list
+        """
+        super(_RefreshWorker, self).__init__()
+        self._backend = backend
+        self._save_paths = save_paths
+
+    def _progress(self, parsed, total):
+        """Reports the progress and stops parsing if it was cancelled.
+
+        :type parsed: int
+        :type total: int
+        :raises _RefreshCancelled:
+        """
+        if self.isInterruptionRequested():
+            raise _RefreshCancelled
+        self.progress.emit(parsed, total)
+
+    def cancel(self):
+        """Stops collecting statistics.
+
+        A file that is being parsed by a worker process is not waited for,
+        so a file that hangs the parser does not delay the cancellation.
+        """
+        self.requestInterruption()
+        self._backend.interrupt()
+
+    def run(self):
+        """Collects statistics."""
+        try:
+            with profile_thread():
+                stats = self._backend.get_hg502_stat(
+                    self._save_paths,
+                    progress=self._progress,
+                    with_counts=True,
+                )
+        except (_RefreshCancelled, ParseInterrupted):
+            return None
+        except FileNotFoundError as err:
+            self.failed.emit(self._save_paths, err)
+            return None
+        self.succeeded.emit(self._save_paths, stats)
+
+
+class _FolderWatcher(QtCore.QObject):
+    """Watches save folders and reports changes once they settle down.
+
+    The game writes a file in several steps on save, so a change is reported
+    only after there were no events for _DEBOUNCE_MSEC. Where change
+    notifications are not supported (for example on some network mounts) the
+    folder is polled, the polling interval grows while nothing changes.
+
+    While notifications work, a scan stats only the files of the directories
+    that have changed, the changed files are reported to the scanner.
+    """
+
+    changed = QtCore.pyqtSignal()
+
+    _DEBOUNCE_MSEC = 500
+    _MIN_POLL_MSEC = 1000
+    _MAX_POLL_MSEC = 16000
+
+    def __init__(self):
+        """Initializes an instance."""
+        super(_FolderWatcher, self).__init__()
+        self._save_paths = []
+        self._files = {}
+        self._scanner = SaveScanner(watched=True)
+        self._is_polling = False
+        self._poll_msec = self._MIN_POLL_MSEC
+
+        self._watcher = QtCore.QFileSystemWatcher()
+        self._watcher.directoryChanged.connect(self._event_handler)
+        self._watcher.fileChanged.connect(self._event_handler)
+
+        self._debounce_timer = QtCore.QTimer()
+        self._debounce_timer.setSingleShot(True)
+        self._debounce_timer.setInterval(self._DEBOUNCE_MSEC)
+        self._debounce_timer.timeout.connect(self._debounce_handler)
+
+        self._poll_timer = QtCore.QTimer()
+        self._poll_timer.setSingleShot(True)
+        self._poll_timer.timeout.connect(self._poll_handler)
+
+    def _scan(self, restat=False):
+        """Returns the save files of all folders.
+
+        :param restat: Stat all files, not only the files of the directories
+        that have changed
+        :type restat: bool
+        :rtype: dict
+        """
+        if restat or self._is_polling:
+            self._scanner.forget_files()
+        files = {}
+        for save_path in self._save_paths:
+            try:
+                files.update(self._scanner.scan(save_path))
+            except OSError:
+                pass
+        return files
+
+    def watch(self, save_paths):
+        """Starts watching the folders instead of the previous ones.
+
+        :type save_paths: list
+        """
+        self.stop()
+        self._save_paths = save_paths
+        self._files = self._scan(restat=True)
+        failed_paths = self._watcher.addPaths(save_paths)
+        self._is_polling = bool(failed_paths)
+        if not self._is_polling:
+            self._watch_files()
+        self._poll_msec = self._MIN_POLL_MSEC
+        self._start_polling()
+
+    def stop(self):
+        """Stops watching."""
+        watched = self._watcher.directories() + self._watcher.files()
+        if watched:
+            self._watcher.removePaths(watched)
+        self._debounce_timer.stop()
+        self._poll_timer.stop()
+        self._save_paths = []
+        self._files = {}
+
+    def _watch_files(self):
+        """Adds the files that are not watched yet.
+
+        Files replaced on save are dropped by QFileSystemWatcher, so they are
+        added again after each change.
+        """
+        new_files = set(self._files).difference(self._watcher.files())
+        if new_files:
+            self._watcher.addPaths(list(new_files))
+
+    def _start_polling(self):
+        """Schedules the next poll.
+
+        If change notifications work the folder is still polled with the
+        longest interval in case they are silently lost.
+        """
+        if self._is_polling:
+            self._poll_timer.start(self._poll_msec)
+        else:
+            self._poll_timer.start(self._MAX_POLL_MSEC)
+
+    def _event_handler(self, path):
+        """Postpones the change report while events keep coming.
+
+        :param path: Path to the changed file or directory
+        :type path: str
+        """
+        self._scanner.mark_changed(path)
+        self._debounce_timer.start()
+
+    def _debounce_handler(self):
+        """Reports the change if the save files have changed."""
+        files = self._scan()
+        if files == self._files:
+            return None
+        self._files = files
+        if not self._is_polling:
+            self._watch_files()
+        self.changed.emit()
+
+    def _poll_handler(self):
+        """Checks the save files and adjusts the polling interval.
+
+        All files are stat'ed in case notifications were lost.
+        """
+        if self._scan(restat=True) != self._files:
+            self._poll_msec = self._MIN_POLL_MSEC
+            self._debounce_timer.start()
+        else:
+            self._poll_msec = min(self._poll_msec * 2, self._MAX_POLL_MSEC)
+        self._start_polling()
 
 
 class HG502App(object):
     """This class is a presenter. Manages the backend and GUI."""
 
-    def __init__(self, gui, backend, q_app):
+    # Time the running refresh is given to stop when the window is closed.
+    _EXIT_WAIT_MSEC = 5000
+
+    def __init__(self, gui, backend, q_app, metrics=None):
         """Initializes an instance.
 
         :type gui: src.gui.HG502GUI
         :type backend: src.hg502_tracker.HG502
         :type q_app: QApplication
+        :param metrics: Counters of the backend, each refresh is reported to
+        its sinks and shown in the status bar
+        :type metrics: hg502_tracker.metrics.Metrics or None
         """
         self._gui = gui
         self._backend = backend
         self._q_app = q_app
+        self._metrics = metrics
+        if self._metrics is not None:
+            self._metrics.add_sink(self._show_metrics)
         self._home_path = Path().home()
         self._settings_path = self._home_path.joinpath('.hg502')
-        self._save_path = None
+        self._cache_path = self._home_path.joinpath('.hg502_cache')
+        self._history_path = self._home_path.joinpath('.hg502_history')
+        # Searched when the folder dialog is shown the first time.
+        self._found_save_paths = None
+        # Opened on the first record, False if it could not be opened.
+        self._history = None
+        self._save_paths = []
+        self._stored_save_paths = []
+        self._worker = None
+        self._is_refresh_pending = False
+        # The statistics shown in the widgets, see _fill_widgets.
+        self._shown_stats = None
+        self._watcher = _FolderWatcher()
+        self._watcher.changed.connect(self._start_refresh)
 
-        self._q_app.setStyleSheet(qdarkstyle.load_stylesheet())
         self._gui.set_about_data(
             __app_name__,
             __version__,
@@ -43,17 +272,41 @@ class HG502App(object):
             f'<span style=" text-decoration: underline; color:#ffffff;">'
             f'{__home_page__}</span></a></p></body></html>',
         )
+        self._gui.set_search_index(
+            SearchIndex(
+                self._backend.get_item_names(),
+                self._backend.get_item_aliases(),
+            )
+        )
+        self._gui.set_item_tooltip_func(self._get_item_tooltip)
         self._gui.action_handler_register(
             '_action_folder', self._open_folder_handler
         )
+        self._gui.action_handler_register(
+            '_action_add_folder', self._add_folder_handler
+        )
+        self._gui.action_handler_register(
+            '_action_auto_refresh', self._auto_refresh_handler
+        )
         self._gui.action_handler_register('_action_exit', self._exit_handler)
         self._gui.clicked_handler_register(
             '_refresh_button', self._refresh_handler
         )
+        self._gui.clicked_handler_register(
+            '_cancel_button', self._cancel_handler
+        )
 
         if self._settings_path.exists():
-            self._save_path = self._settings_path.read_text()
-            self._show_stat()
+            # One folder per line.
+            self._save_paths = self._settings_path.read_text().splitlines()
+            self._stored_save_paths = self._save_paths
+            # The last known statistics are shown immediately, the files are
+            # revalidated in the background.
+            if self._backend.load_cache(str(self._cache_path)) == (
+                self._save_paths
+            ):
+                self._show_cached_stat()
+            self._start_refresh()
 
     @staticmethod
     def _prepare_stat(stat_dict):
@@ -71,42 +324,230 @@ class HG502App(object):
         stat.append(f'{stat_dict["progress"]:.2f}%')
         return stat
 
-    def _show_stat(self):
-        """Displays statistics in a GUI.
+    def _get_item_tooltip(self, name):
+        """Returns where the found copies of an item are.
+
+        :type name: str
+        :rtype: str or None
+        """
+        if self._worker is not None:
+            # The location index is being updated by the refresh.
+            return None
+        locations = self._backend.get_item_locations(name)
+        if not locations:
+            return None
+        return '\n'.join(
+            f'{Path(file_path).name}: {location}'
+            for file_path, location in locations
+        )
+
+    def _show_cached_stat(self):
+        """Displays statistics from the cache without reading the files."""
+        try:
+            stats = self._backend.get_cached_stat(with_counts=True)
+        except FileNotFoundError:
+            return None
+        self._fill_widgets(stats)
+        self._enable_gui()
+        self._report_metrics()
+
+    def _report_metrics(self):
+        """Reports the counters of the last refresh if they are enabled."""
+        if self._metrics is not None:
+            self._metrics.report()
+
+    def _show_metrics(self, snapshot):
+        """Shows a report of the metrics in the status bar.
+
+        :param snapshot: See hg502_tracker.metrics.Metrics.snapshot.__doc__
+        :type snapshot: dict
+        """
+        self._gui.set_metrics_text(
+            format_summary(snapshot), format_details(snapshot)
+        )
+
+    def _get_folders_text(self):
+        """Returns the current folders for the status bar.
+
+        :rtype: str
+        """
+        if len(self._save_paths) == 1:
+            return f'Current folder: {self._save_paths[0]}'
+        return f'Current folders: {"; ".join(self._save_paths)}'
+
+    def _enable_gui(self):
+        """Shows the current folders and enables widgets.
 
-        :rtype: bool
+        The files that could not be parsed and the folders that do not exist
+        are counted in the status bar and listed in its tooltip.
         """
-        if not self._push_stat():
-            return False
-        self._gui.set_status_bar_text(f'Current folder: {self._save_path}')
+        text = self._get_folders_text()
+        tooltip = []
+        missing_folders = self._backend.get_missing_folders()
+        if missing_folders:
+            text = f'{text} (missing folders: {len(missing_folders)})'
+            tooltip.extend(
+                f'{save_path}: folder not found'
+                for save_path in missing_folders
+            )
+        errors = self._backend.get_file_errors()
+        if errors:
+            text = f'{text} (skipped files: {len(errors)})'
+            tooltip.extend(errors.values())
+        self._gui.set_status_bar_text(text, '\n'.join(tooltip))
         if not self._gui.is_enabled_widgets:
             self._gui.set_widgets_status('enable')
-        return True
 
-    def _push_stat(self):
-        """Fills widgets with necessary data.
+    def _start_refresh(self, cancel_running=False):
+        """Starts collecting statistics in the background.
+
+        If a refresh is already running, a single new one is started after
+        it finishes regardless of how many times this method was called.
 
-        :rtype: bool
+        :param cancel_running: Cancel the running refresh, for example if
+        the folders have changed and its results are no longer needed
+        :type cancel_running: bool
         """
+        if self._worker is not None:
+            self._is_refresh_pending = True
+            if cancel_running:
+                self._worker.cancel()
+            return None
+
+        self._is_refresh_pending = False
+        self._worker = _RefreshWorker(self._backend, self._save_paths)
+        self._worker.progress.connect(self._refresh_progress_handler)
+        self._worker.succeeded.connect(self._refresh_succeeded_handler)
+        self._worker.failed.connect(self._refresh_failed_handler)
+        self._worker.finished.connect(self._refresh_finished_handler)
+        self._gui.set_cancel_visible(True)
+        self._worker.start()
+
+    def _refresh_progress_handler(self, parsed, total):
+        """Shows the parsing progress in the status bar.
+
+        :type parsed: int
+        :type total: int
+        """
+        self._gui.set_status_bar_text(f'Parsed {parsed}/{total}')
+
+    def _refresh_succeeded_handler(self, save_paths, stats):
+        """Fills widgets with the collected statistics.
+
+        :type save_paths: list
+        :type stats: hg502_tracker.stat.GrailStat
+        """
+        if save_paths != self._save_paths:
+            # The folders have changed while parsing.
+            return None
+
+        self._fill_widgets(stats)
+        self._enable_gui()
+        self._report_metrics()
         try:
-            total_stat, set_stat, unique_stat = self._backend.get_hg502_stat(
-                self._save_path
+            self._backend.save_cache(str(self._cache_path))
+        except OSError:
+            pass
+        self._record_history(save_paths)
+        if save_paths != self._stored_save_paths:
+            self._settings_path.write_text('\n'.join(save_paths))
+            self._stored_save_paths = save_paths
+
+    def _record_history(self, save_paths):
+        """Appends the changes of the found items to the history.
+
+        Nothing is written if no item was found or lost since the previous
+        refresh. While some files or folders cannot be read, for example a
+        save that is being written, their items are missing from the state,
+        so only the new items are recorded and no item is lost. The history
+        is disabled if the database cannot be used.
+
+        :type save_paths: list
+        """
+        if self._history is False:
+            return None
+
+        state = self._backend.get_grail_state()
+        is_partial = any(
+            (
+                self._backend.get_file_errors(),
+                self._backend.get_missing_folders(),
             )
-        except FileNotFoundError:
-            self._gui.show_info_message(
-                'Info',
-                'Files not found',
-                f'{self._save_path} does not contain Diablo 2 files',
+        )
+        try:
+            if self._history is None:
+                self._history = HistoryStore(
+                    str(self._history_path), state.layout
+                )
+            # The folders are the key of the grail, the same way they are
+            # stored in the settings file.
+            self._history.record(
+                '\n'.join(save_paths), state, partial=is_partial
             )
-            return False
-        except FileParseError as err:
-            self._gui.show_error_message('Error', 'File parse error', f'{err}')
-            return False
-
-        stats = []
-        for stat_dict in (set_stat, unique_stat, total_stat):
-            stats.append(self._prepare_stat(stat_dict))
-        self._gui.fill_stat_table(stats)
+        except sqlite3.Error:
+            if self._history:
+                self._history.close()
+            self._history = False
+
+    def _refresh_failed_handler(self, save_paths, err):
+        """Shows the reason why statistics could not be collected.
+
+        :type save_paths: list
+        :type err: Exception
+        """
+        if save_paths != self._save_paths:
+            return None
+
+        self._gui.set_status_bar_text('')
+        self._gui.show_info_message(
+            'Info',
+            'Files not found',
+            f'{"; ".join(save_paths)} does not contain Diablo 2 files',
+        )
+
+    def _refresh_finished_handler(self):
+        """Starts the pending refresh if there is one."""
+        is_cancelled = self._worker.isInterruptionRequested()
+        self._worker = None
+        self._gui.set_cancel_visible(False)
+        if self._is_refresh_pending:
+            self._start_refresh()
+        elif is_cancelled and self._gui.is_enabled_widgets:
+            self._gui.set_status_bar_text(
+                f'{self._get_folders_text()} (refresh cancelled)'
+            )
+
+    def _fill_widgets(self, stats):
+        """Fills widgets with statistics.
+
+        Nothing is updated if the statistics are the ones already shown, the
+        backend returns the same object while the found items do not change.
+
+        :type stats: hg502_tracker.stat.GrailStat
+        """
+        if stats is self._shown_stats:
+            return None
+        self._shown_stats = stats
+        if self._metrics is None:
+            self._fill_lists(stats)
+            return None
+        with self._metrics.measure('fill_widgets'):
+            self._fill_lists(stats)
+
+    def _fill_lists(self, stats):
+        """Fills the table and the item lists, see _fill_widgets.
+
+        The widgets apply only the differences from the shown statistics.
+
+        :type stats: hg502_tracker.stat.GrailStat
+        """
+        total_stat, set_stat, unique_stat = stats
+        self._gui.fill_stat_table(
+            [
+                self._prepare_stat(stat_dict)
+                for stat_dict in (set_stat, unique_stat, total_stat)
+            ]
+        )
         self._gui.fill_set_items_list(
             set_stat['found_items'], set_stat['remaining_items']
         )
@@ -114,32 +555,82 @@ class HG502App(object):
             unique_stat['found_items'], unique_stat['remaining_items']
         )
 
-        all_found = set_stat['found_items'].copy()
-        all_found.extend(unique_stat['found_items'].copy())
-        all_remaining = set_stat['remaining_items'].copy()
-        all_remaining.extend(unique_stat['remaining_items'].copy())
+        self._gui.fill_all_items_list(
+            (stats.all_found,), (stats.all_remaining,)
+        )
+        self._gui.fill_duplicates_list(
+            (set_stat['duplicates'], unique_stat['duplicates'])
+        )
+
+    def _set_save_paths(self, save_paths):
+        """Replaces the current folders and starts a refresh.
+
+        :type save_paths: list
+        """
+        self._save_paths = save_paths
+        self._start_refresh(cancel_running=True)
+        if self._gui.is_action_checked('_action_auto_refresh'):
+            self._watcher.watch(self._save_paths)
+
+    def _get_dialog_directory(self):
+        """Returns the directory the folder dialog starts in.
 
-        self._gui.fill_all_items_list(all_found, all_remaining)
+        It is the first usual save folder with save files that is not opened
+        yet if one is found, otherwise the home directory.
 
-        return True
+        :rtype: str
+        """
+        if self._found_save_paths is None:
+            self._found_save_paths = find_save_folders(self._home_path)
+        for save_path in self._found_save_paths:
+            if save_path not in self._save_paths:
+                return save_path
+        return str(self._home_path)
 
     def _open_folder_handler(self):
         """`Folder...` button event handler.
 
-        Displays the explorer for directory selection and calls _show_stat
+        Displays the explorer for directory selection and starts a refresh
         if input was received.
         """
         folder_path = self._gui.show_open_folder_dialog(
-            'Diablo 2 save folder', directory=str(self._home_path)
+            'Diablo 2 save folder', directory=self._get_dialog_directory()
         )
         if folder_path:
-            self._save_path = folder_path
-            if self._show_stat():
-                self._settings_path.write_text(self._save_path)
+            self._set_save_paths([folder_path])
+
+    def _add_folder_handler(self):
+        """`Add folder...` button event handler.
+
+        Items of the added folder are counted together with the items of the
+        current folders.
+        """
+        folder_path = self._gui.show_open_folder_dialog(
+            'Diablo 2 save folder', directory=self._get_dialog_directory()
+        )
+        if folder_path and folder_path not in self._save_paths:
+            self._set_save_paths(self._save_paths + [folder_path])
 
     def _refresh_handler(self):
         """`Refresh` button event handler."""
-        self._push_stat()
+        self._start_refresh()
+
+    def _auto_refresh_handler(self):
+        """`Auto refresh` menu item event handler.
+
+        Refreshes statistics each time the save files change.
+        """
+        if not self._gui.is_action_checked('_action_auto_refresh'):
+            self._watcher.stop()
+        elif self._save_paths:
+            self._watcher.watch(self._save_paths)
+            self._start_refresh()
+
+    def _cancel_handler(self):
+        """`Cancel` button event handler."""
+        if self._worker is not None:
+            self._is_refresh_pending = False
+            self._worker.cancel()
 
     def _exit_handler(self):
         """`Exit` button event handler."""
@@ -148,4 +639,16 @@ class HG502App(object):
     def run(self):
         """Displays GUI."""
         self._gui.show()
-        sys.exit(self._q_app.exec_())
+        exit_code = self._q_app.exec_()
+        self._watcher.stop()
+        if self._worker is not None:
+            self._worker.cancel()
+            if not self._worker.wait(self._EXIT_WAIT_MSEC):
+                # The application exits anyway.
+                self._worker.terminate()
+                self._worker.wait(self._EXIT_WAIT_MSEC)
+        # The workers may be busy if the refresh did not stop.
+        self._backend.close(kill=True)
+        if self._history:
+            self._history.close()
+        sys.exit(exit_code)
@@ -0,0 +1,319 @@
+"""Precompiled catalog of set's and unique items.
+
+The catalog is derived from d2lib items data by ItemRules: excluded items
+are removed and display names are resolved. The base item name of each
+item, e.g. Shako of Harlequin Crest, is resolved from the base item codes of
+BASES_PATH, a copy of the game tables SetItems.txt and UniqueItems.txt that
+d2lib does not have. It is stored as a compact JSON file that is read at once
+instead of loading all d2lib data files.
+
+The catalog of the default rules is shipped with the package as
+CATALOG_PATH, it is written by build.py and setup.py and only read at
+runtime. If it is missing or outdated, or other rules are used, the catalog
+is built and stored in the user directory CATALOG_CACHE_DIR, one file per
+rules. A file is rebuilt automatically if it was made by another catalog
+format, another version of d2lib or with other rules.
+"""
+
+import hashlib
+import json
+import os
+import tempfile
+from pathlib import Path
+
+from d2lib import __version__ as d2lib_version
+
+from hg502_tracker.scanner import SET_ITEM, UNIQUE_ITEM
+
+CATALOG_VERSION = 3
+CATALOG_PATH = str(Path(__file__).with_name('catalog.json'))
+BASES_PATH = str(Path(__file__).with_name('bases.json'))
+CATALOG_CACHE_DIR = str(Path.home().joinpath('.hg502_catalogs'))
+ITEM_KINDS = (SET_ITEM, UNIQUE_ITEM)
+
+
+class ItemRules(object):
+    """Declares how the items of d2lib data are counted in the grail.
+
+    By default each set's and unique item has its own grail slot. An item
+    can be excluded or counted as another item, the slot ID, and the name
+    of a slot can get a suffix.
+    """
+
+    def __init__(self):
+        """Initializes an instance."""
+        # {kind: set of item IDs}
+        self._excluded = {kind: set() for kind in ITEM_KINDS}
+        # {kind: {item_id: slot_id}}
+        self._equivalents = {kind: {} for kind in ITEM_KINDS}
+        # {kind: {slot_id: suffix}}
+        self._suffixes = {kind: {} for kind in ITEM_KINDS}
+
+    def exclude(self, kind, item_ids):
+        """Excludes items from the grail.
+
+        :param kind: SET_ITEM or UNIQUE_ITEM
+        :type kind: str
+        :type item_ids: iterable
+        """
+        self._excluded[kind].update(item_ids)
+
+    def add_equivalent(self, kind, slot_id, item_id):
+        """Counts an item as another one, it has no slot of its own.
+
+        :param kind: SET_ITEM or UNIQUE_ITEM
+        :type kind: str
+        :param slot_id: ID of the item that has the slot
+        :type slot_id: int
+        :type item_id: int
+        """
+        self._equivalents[kind][item_id] = slot_id
+
+    def set_suffix(self, kind, slot_id, suffix):
+        """Adds a suffix to the name of a slot.
+
+        :param kind: SET_ITEM or UNIQUE_ITEM
+        :type kind: str
+        :type slot_id: int
+        :type suffix: str
+        """
+        self._suffixes[kind][slot_id] = suffix
+
+    def to_list(self):
+        """Returns the rules in the form stored in JSON files.
+
+        :rtype: list
+        """
+        return [
+            [
+                kind,
+                sorted(self._excluded[kind]),
+                sorted(map(list, self._equivalents[kind].items())),
+                sorted(map(list, self._suffixes[kind].items())),
+            ]
+            for kind in ITEM_KINDS
+        ]
+
+    def apply(self, kind, items_dict):
+        """Makes the dictionary of grail slots from d2lib items.
+
+        :param kind: SET_ITEM or UNIQUE_ITEM
+        :type kind: str
+        :param items_dict: Dictionary {item_id: name} of d2lib items
+        :type items_dict: dict
+        :return: Dictionary {slot_id: display name}
+        :rtype: dict
+        """
+        slots = {}
+        excluded = self._excluded[kind]
+        equivalents = self._equivalents[kind]
+        suffixes = self._suffixes[kind]
+        for item_id, name in items_dict.items():
+            if item_id in excluded or item_id in equivalents:
+                continue
+            suffix = suffixes.get(item_id)
+            slots[item_id] = f'{name} {suffix}' if suffix else name
+        return slots
+
+    def get_excluded(self, kind):
+        """Returns the IDs of the excluded items.
+
+        :type kind: str
+        :rtype: set
+        """
+        return self._excluded[kind]
+
+    def get_equivalents(self, kind):
+        """Returns the dictionary {item_id: slot_id} of equivalent items.
+
+        :type kind: str
+        :rtype: dict
+        """
+        return self._equivalents[kind]
+
+
+def _get_base_name(item_storage, code):
+    """Returns the name of a base item.
+
+    :type item_storage: d2lib.items_storage.ItemsDataStorage
+    :type code: str
+    :rtype: str or None
+    """
+    for get_name in (
+        item_storage.get_armor_name,
+        item_storage.get_shield_name,
+        item_storage.get_weapon_name,
+        item_storage.get_misc_name,
+    ):
+        name = get_name(code)
+        if name is not None:
+            return name
+    return None
+
+
+def build_catalog(rules=None):
+    """Builds the catalog from d2lib items data.
+
+    :type rules: ItemRules or None
+    :return: Two dictionaries {item_id: name}, set's and unique items, and
+    two dictionaries {item_id: base item name} of their slots
+    :rtype: tuple
+    """
+    # Loading all d2lib data files is the cost that the catalog file saves.
+    from d2lib.items_storage import ItemsDataStorage
+
+    rules = rules or ItemRules()
+    item_storage = ItemsDataStorage()
+    with open(BASES_PATH, 'r') as bases_file:
+        base_codes = json.load(bases_file)
+    slot_dicts = (
+        rules.apply(SET_ITEM, item_storage.get_set_dict()),
+        rules.apply(UNIQUE_ITEM, item_storage.get_unique_dict()),
+    )
+    base_dicts = []
+    for kind, slots in zip(ITEM_KINDS, slot_dicts):
+        base_dict = {}
+        for item_id, code in base_codes[kind]:
+            base_name = _get_base_name(item_storage, code)
+            if item_id in slots and base_name is not None:
+                base_dict[item_id] = base_name
+        base_dicts.append(base_dict)
+    return (*slot_dicts, *base_dicts)
+
+
+def build_canonical_table(set_dict, unique_dict, rules, layout):
+    """Builds the table that canonicalizes item IDs found in save files.
+
+    :param set_dict: Set's items of the catalog
+    :type set_dict: dict
+    :param unique_dict: Unique items of the catalog
+    :type unique_dict: dict
+    :param rules: Rules the catalog was built with
+    :type rules: ItemRules
+    :type layout: hg502_tracker.grail.GrailLayout
+    :return: Dictionary {(kind, item_id): slot} where slot is a tuple
+    (slot_id, name, bit) and bit is the slot bitset in the layout, or None
+    if the item is excluded
+    :rtype: dict
+    """
+    table = {}
+    for kind, items_dict, get_bit in (
+        (SET_ITEM, set_dict, layout.get_set_bit),
+        (UNIQUE_ITEM, unique_dict, layout.get_unique_bit),
+    ):
+        for slot_id, name in items_dict.items():
+            table[kind, slot_id] = (slot_id, name, get_bit(slot_id))
+        for item_id, slot_id in rules.get_equivalents(kind).items():
+            table[kind, item_id] = table[kind, slot_id]
+        for item_id in rules.get_excluded(kind):
+            table[kind, item_id] = None
+    return table
+
+
+def get_catalog_cache_path(rules, cache_dir=None):
+    """Returns the path to the catalog file of rules in the user directory.
+
+    :type rules: ItemRules
+    :param cache_dir: Directory of the files, defaults to CATALOG_CACHE_DIR
+    :type cache_dir: str or None
+    :rtype: str
+    """
+    cache_dir = CATALOG_CACHE_DIR if cache_dir is None else cache_dir
+    rules_key = json.dumps(rules.to_list()).encode()
+    digest = hashlib.sha1(rules_key).hexdigest()[:16]
+    return str(Path(cache_dir).joinpath(f'catalog-{digest}.json'))
+
+
+def save_catalog(catalog_path, set_dict, unique_dict, rules, base_dicts):
+    """Saves the catalog file, its directory is created if it is missing.
+
+    The file is written under a unique temporary name and then renamed, so
+    several processes can save it at the same time.
+
+    :type catalog_path: str
+    :type set_dict: dict
+    :type unique_dict: dict
+    :type rules: ItemRules
+    :param base_dicts: Dictionaries {item_id: base item name} of set's and
+    unique items
+    :type base_dicts: tuple
+    """
+    set_bases, unique_bases = base_dicts
+    catalog = {
+        'version': CATALOG_VERSION,
+        'd2lib': d2lib_version,
+        'rules': rules.to_list(),
+        'set': list(set_dict.items()),
+        'unique': list(unique_dict.items()),
+        'set_bases': list(set_bases.items()),
+        'unique_bases': list(unique_bases.items()),
+    }
+    catalog_path = Path(catalog_path)
+    catalog_path.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(
+        suffix='.tmp', prefix=f'{catalog_path.name}.', dir=catalog_path.parent
+    )
+    try:
+        with open(fd, 'w') as catalog_file:
+            json.dump(catalog, catalog_file, separators=(',', ':'))
+        os.replace(tmp_path, catalog_path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
+def _read_catalog(catalog_path, header):
+    """Reads a catalog file if it was made with the given header.
+
+    :type catalog_path: str
+    :param header: (catalog version, d2lib version, rules list)
+    :type header: tuple
+    :return: See load_catalog.__doc__ or None if the file is missing or
+    outdated
+    :rtype: tuple or None
+    """
+    try:
+        with open(catalog_path, 'r') as catalog_file:
+            catalog = json.load(catalog_file)
+        if (catalog['version'], catalog['d2lib'], catalog['rules']) == header:
+            return tuple(
+                dict(catalog[field])
+                for field in ('set', 'unique', 'set_bases', 'unique_bases')
+            )
+    except (OSError, ValueError, KeyError, TypeError):
+        pass
+    return None
+
+
+def load_catalog(catalog_path=None, rules=None):
+    """Loads the catalog file, rebuilds it if it is missing or outdated.
+
+    The catalog is still returned if the rebuilt file cannot be written.
+
+    :param catalog_path: Path to the catalog file, by default the shipped
+    file CATALOG_PATH is read and the catalog file of the rules in
+    CATALOG_CACHE_DIR is read and rebuilt
+    :type catalog_path: str or None
+    :type rules: ItemRules or None
+    :return: See build_catalog.__doc__
+    :rtype: tuple
+    """
+    rules = rules or ItemRules()
+    header = (CATALOG_VERSION, d2lib_version, rules.to_list())
+    if catalog_path is None:
+        catalog_paths = (CATALOG_PATH, get_catalog_cache_path(rules))
+    else:
+        catalog_paths = (catalog_path,)
+    for path in catalog_paths:
+        catalog = _read_catalog(path, header)
+        if catalog is not None:
+            return catalog
+
+    set_dict, unique_dict, *base_dicts = catalog = build_catalog(rules)
+    try:
+        save_catalog(
+            catalog_paths[-1], set_dict, unique_dict, rules, base_dicts
+        )
+    except OSError:
+        pass
+    return catalog
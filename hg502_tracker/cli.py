@@ -0,0 +1,380 @@
+"""Command line interface of HG502.
+
+Prints statistics of one or several Diablo 2 save folders as JSON or CSV
+without loading the graphical interface, the items found more than once or
+where the found items are.
+"""
+
+import argparse
+import csv
+import json
+import os
+import sys
+
+from hg502_tracker import __app_name__, __version__
+from hg502_tracker.folders import SaveScanner
+from hg502_tracker.hg502 import HG502
+from hg502_tracker.metrics import add_metrics_args, create_metrics, profiling
+from hg502_tracker.scanner import NO_FAST_SCAN_ENV, is_fast_scan_enabled
+from hg502_tracker.search import SearchIndex
+
+STAT_TYPES = ('total', 'set', 'unique')
+CSV_FIELDS = (
+    'folder',
+    'type',
+    'total_items',
+    'total_found',
+    'total_remaining',
+    'progress',
+)
+LOCATION_CSV_FIELDS = ('name', 'file', 'location')
+DUPLICATE_CSV_FIELDS = ('folder', 'type', 'name', 'copies')
+
+
+def _parse_args(argv):
+    """Parses command line arguments.
+
+    :type argv: list or None
+    :rtype: argparse.Namespace
+    """
+    parser = argparse.ArgumentParser(
+        prog=__app_name__.lower(),
+        description='Diablo 2 Holy Grail 502 challenge tracker.',
+    )
+    parser.add_argument(
+        'folders',
+        metavar='FOLDER',
+        nargs='+',
+        help='Diablo 2 save folder, items of all folders are counted together',
+    )
+    parser.add_argument(
+        '-f',
+        '--format',
+        choices=('json', 'csv'),
+        default='json',
+        help='output format (default: json)',
+    )
+    parser.add_argument(
+        '-b',
+        '--batch',
+        action='store_true',
+        help='collect statistics for each folder separately',
+    )
+    parser.add_argument(
+        '-r',
+        '--recursive',
+        action='store_true',
+        help='also read the files of nested folders, such as mules or backups',
+    )
+    parser.add_argument(
+        '--include',
+        action='append',
+        default=[],
+        metavar='GLOB',
+        help='read only the files matching the pattern relative to the '
+        'folder, such as "mules/*.d2s", may be repeated',
+    )
+    parser.add_argument(
+        '--exclude',
+        action='append',
+        default=[],
+        metavar='GLOB',
+        help='skip the files and nested folders matching the pattern, may be '
+        'repeated',
+    )
+    parser.add_argument(
+        '-w',
+        '--workers',
+        type=int,
+        default=None,
+        help='number of worker processes used to parse files '
+        '(default: number of CPUs in batch mode, otherwise 0)',
+    )
+    parser.add_argument(
+        '-t',
+        '--timeout',
+        type=float,
+        default=None,
+        metavar='SECONDS',
+        help='skip files that are parsed longer, files are parsed in worker '
+        'processes then',
+    )
+    parser.add_argument(
+        '--no-fast-scan',
+        action='store_true',
+        default=not is_fast_scan_enabled(),
+        help=f'parse all files with d2lib instead of the fast item scanner '
+        f'(env: {NO_FAST_SCAN_ENV})',
+    )
+    parser.add_argument(
+        '-c',
+        '--cache',
+        metavar='PATH',
+        help='cache file, only files changed since the previous run are '
+        'parsed',
+    )
+    parser.add_argument(
+        '-d',
+        '--duplicates',
+        action='store_true',
+        help='print the items found more than once and their number of '
+        'copies instead of the statistics',
+    )
+    parser.add_argument(
+        '--where',
+        metavar='NAME',
+        help='print where the found copies of the items whose names or base '
+        'item names contain NAME are instead of the statistics',
+    )
+    parser.add_argument(
+        '--no-items',
+        action='store_true',
+        help='do not output the lists of found and remaining items',
+    )
+    parser.add_argument(
+        '-V', '--version', action='version', version=__version__
+    )
+    add_metrics_args(parser)
+    return parser.parse_args(argv)
+
+
+def _stat_to_dict(stats, with_items):
+    """Makes a dictionary {stat_type: stat_dict} of get_hg502_stat result.
+
+    :type stats: hg502_tracker.stat.GrailStat
+    :type with_items: bool
+    :rtype: dict
+    """
+    stat = {}
+    for stat_type, stat_dict in zip(STAT_TYPES, stats):
+        stat_dict = dict(stat_dict)
+        if 'duplicates' in stat_dict:
+            stat_dict['duplicates'] = dict(stat_dict['duplicates'])
+        for field in ('found_items', 'remaining_items'):
+            if with_items:
+                stat_dict[field] = list(stat_dict[field])
+            else:
+                del stat_dict[field]
+        stat[stat_type] = stat_dict
+    return stat
+
+
+def _write_json(out, folder_stats, with_items, is_batch):
+    """Writes statistics in JSON.
+
+    :type out: io.TextIOBase
+    :param folder_stats: Dictionary {folder: stats}
+    :type folder_stats: dict
+    :type with_items: bool
+    :param is_batch: If False the only statistics are written without the
+    folder key
+    :type is_batch: bool
+    """
+    data = {
+        folder: stats and _stat_to_dict(stats, with_items)
+        for folder, stats in folder_stats.items()
+    }
+    if not is_batch:
+        (data,) = data.values()
+    json.dump(data, out, indent=4)
+    out.write('\n')
+
+
+def _write_csv(out, folder_stats):
+    """Writes statistics in CSV, one row per folder and type of items.
+
+    :type out: io.TextIOBase
+    :param folder_stats: Dictionary {folder: stats}
+    :type folder_stats: dict
+    """
+    writer = csv.writer(out)
+    writer.writerow(CSV_FIELDS)
+    for folder, stats in folder_stats.items():
+        if stats is None:
+            continue
+        for stat_type, stat_dict in zip(STAT_TYPES, stats):
+            writer.writerow(
+                (
+                    folder,
+                    stat_type,
+                    stat_dict['total_items'],
+                    stat_dict['total_found'],
+                    stat_dict['total_remaining'],
+                    f'{stat_dict["progress"]:.2f}',
+                )
+            )
+
+
+def _write_duplicates(out, folder_stats, out_format, is_batch):
+    """Writes the items found more than once.
+
+    :type out: io.TextIOBase
+    :param folder_stats: Dictionary {folder: stats}, see
+    HG502.get_hg502_stat with_counts
+    :type folder_stats: dict
+    :param out_format: json or csv
+    :type out_format: str
+    :param is_batch: If False the only duplicates are written without the
+    folder key
+    :type is_batch: bool
+    """
+    data = {}
+    for folder, stats in folder_stats.items():
+        if stats is None:
+            data[folder] = None
+            continue
+        _, set_stat, unique_stat = stats
+        data[folder] = {
+            'set': dict(set_stat['duplicates']),
+            'unique': dict(unique_stat['duplicates']),
+        }
+
+    if out_format == 'csv':
+        writer = csv.writer(out)
+        writer.writerow(DUPLICATE_CSV_FIELDS)
+        for folder, duplicates in data.items():
+            for stat_type, type_duplicates in (duplicates or {}).items():
+                for name, copies in type_duplicates.items():
+                    writer.writerow((folder, stat_type, name, copies))
+        return None
+
+    if not is_batch:
+        (data,) = data.values()
+    json.dump(data, out, indent=4)
+    out.write('\n')
+
+
+def _get_locations(backend, query):
+    """Finds the items by name and returns where they are.
+
+    :type backend: hg502_tracker.hg502.HG502
+    :param query: Part of the item names or base item names, typos are
+    tolerated if nothing matches exactly
+    :type query: str
+    :return: Dictionary {name: locations} in name order, see
+    HG502.get_item_locations
+    :rtype: dict
+    """
+    search_index = SearchIndex(
+        backend.get_item_names(), backend.get_item_aliases()
+    )
+    names = search_index.search(query, fuzzy=True)
+    return {name: backend.get_item_locations(name) for name in sorted(names)}
+
+
+def _write_locations(out, locations, out_format):
+    """Writes the locations of items.
+
+    :type out: io.TextIOBase
+    :param locations: See _get_locations.__doc__
+    :type locations: dict
+    :param out_format: json or csv
+    :type out_format: str
+    """
+    if out_format == 'csv':
+        writer = csv.writer(out)
+        writer.writerow(LOCATION_CSV_FIELDS)
+        for name, item_locations in locations.items():
+            for file_path, location in item_locations:
+                writer.writerow((name, file_path, location))
+        return None
+
+    data = {
+        name: [
+            {'file': file_path, 'location': location}
+            for file_path, location in item_locations
+        ]
+        for name, item_locations in locations.items()
+    }
+    json.dump(data, out, indent=4)
+    out.write('\n')
+
+
+def main(argv=None):
+    """Runs the command line interface.
+
+    :param argv: Command line arguments, defaults to sys.argv
+    :type argv: list or None
+    :return: Exit code
+    :rtype: int
+    """
+    args = _parse_args(argv)
+    with profiling(args.profile, args.tracemalloc):
+        return _run(args)
+
+
+def _run(args):
+    """Collects and prints the statistics.
+
+    :type args: argparse.Namespace
+    :return: Exit code
+    :rtype: int
+    """
+    workers = args.workers
+    if workers is None:
+        workers = os.cpu_count() if args.batch else 0
+
+    metrics = create_metrics(args.trace, args.metrics_textfile)
+    backend = HG502(
+        workers=workers,
+        fast_scan=not args.no_fast_scan,
+        metrics=metrics,
+        timeout=args.timeout,
+        scanner=SaveScanner(args.recursive, args.include, args.exclude),
+    )
+    try:
+        if args.cache:
+            backend.load_cache(args.cache)
+        if args.batch:
+            folder_stats = backend.get_batch_stat(
+                args.folders, with_counts=args.duplicates
+            )
+        else:
+            # The statistics of several folders are united, the folder
+            # column of CSV is left empty for them.
+            folder = args.folders[0] if len(args.folders) == 1 else ''
+            folder_stats = {
+                folder: backend.get_hg502_stat(
+                    args.folders, with_counts=args.duplicates
+                )
+            }
+    except FileNotFoundError:
+        print(
+            f'{", ".join(args.folders)} does not contain Diablo 2 files',
+            file=sys.stderr,
+        )
+        return 1
+    except ValueError as err:
+        print(err, file=sys.stderr)
+        return 1
+    finally:
+        backend.close()
+        if metrics is not None:
+            metrics.report()
+
+    if args.cache:
+        try:
+            backend.save_cache(args.cache)
+        except OSError as err:
+            print(f'Cache is not saved: {err}', file=sys.stderr)
+    # Statistics are printed for the folders and files that could be read.
+    if not args.batch:
+        for save_path in backend.get_missing_folders():
+            print(f'Skipped {save_path}: folder not found', file=sys.stderr)
+    for error in backend.get_file_errors().values():
+        print(f'Skipped {error}', file=sys.stderr)
+
+    if args.where is not None:
+        locations = _get_locations(backend, args.where)
+        _write_locations(sys.stdout, locations, args.format)
+    elif args.duplicates:
+        _write_duplicates(sys.stdout, folder_stats, args.format, args.batch)
+    elif args.format == 'csv':
+        _write_csv(sys.stdout, folder_stats)
+    else:
+        _write_json(sys.stdout, folder_stats, not args.no_items, args.batch)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
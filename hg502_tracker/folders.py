@@ -0,0 +1,266 @@
+"""Search of Diablo 2 files in save folders.
+
+Save folders also contain .key, .ma* and .map files of each character, so
+the entries are listed with os.scandir and matched by the suffix of their
+names without creating Path objects. Nested directories such as mules or
+backups may be scanned too.
+
+The listing of a directory is reused while the modification time of the
+directory does not change. Writing a file in place does not change the time
+of its directory, so the files of the listing are still stat'ed on each
+scan, only reading the directories is skipped. If the caller watches the
+files and reports the changed ones, the files of an unchanged directory are
+not stat'ed either, see SaveScanner.mark_changed.
+"""
+
+import os
+import sys
+import time
+from fnmatch import fnmatch
+from pathlib import Path
+
+SAVE_SUFFIXES = ('.d2s', '.d2x', '.sss')
+# A listing is reused only if its directory was modified longer ago than
+# this, a change within the resolution of the file system time could be
+# missed otherwise. FAT stores the time with 2 s resolution.
+_MTIME_RESOLUTION_NS = 2 * 10 ** 9
+# Directories where Wine prefixes are usually found, relative to the home
+# directory. Each prefix has the drive_c directory.
+_WINE_PREFIXES = (
+    '.wine',
+    '.local/share/wineprefixes/*',
+    'Games/*',
+    '.steam/steam/steamapps/compatdata/*/pfx',
+)
+# Save folders relative to a Windows drive.
+_DRIVE_SAVE_FOLDERS = (
+    'users/*/Saved Games/Diablo II',
+    'Program Files*/Diablo II/Save',
+    'Diablo II/Save',
+    'Games/Diablo II/Save',
+)
+
+
+class SaveScanner(object):
+    """Finds Diablo 2 files in save folders."""
+
+    def __init__(self, recursive=False, include=(), exclude=(), watched=False):
+        """Initializes an instance.
+
+        Patterns are matched by fnmatch against the path relative to the save
+        folder with / as the separator, such as `mules/*.d2s`.
+
+        :param recursive: Also scan nested directories
+        :type recursive: bool
+        :param include: Patterns of the files to take, all files are taken if
+        it is empty
+        :type include: iterable
+        :param exclude: Patterns of the files and directories to skip, the
+        files of a skipped directory are not scanned
+        :type exclude: iterable
+        :param watched: The caller reports the files changed in place by
+        mark_changed, the files of a directory whose listing is reused are
+        not stat'ed again until then
+        :type watched: bool
+        """
+        self._recursive = recursive
+        self._include = tuple(include)
+        self._exclude = tuple(exclude)
+        self._watched = watched
+        # {dir_path: (mtime, file_names, dir_names)}
+        self._listings = {}
+        # {dir_path: {file_path: fingerprint}} of the taken files of the
+        # reused listings if the files are watched
+        self._dir_files = {}
+
+    @property
+    def recursive(self):
+        """True if nested directories are scanned.
+
+        :rtype: bool
+        """
+        return self._recursive
+
+    def mark_changed(self, path):
+        """Makes the next scan stat the files of a directory again.
+
+        :param path: Path to a changed file or directory
+        :type path: str
+        """
+        for dir_path, dir_files in list(self._dir_files.items()):
+            if path == dir_path or path in dir_files:
+                del self._dir_files[dir_path]
+
+    def forget_files(self):
+        """Makes the next scan stat all files again."""
+        self._dir_files.clear()
+
+    def scan(self, save_path):
+        """Finds Diablo 2 files in a directory without parsing them.
+
+        :param save_path: Path to Diablo 2 save directory
+        :type save_path: str
+        :raises FileNotFoundError: If the directory does not exist
+        :return: Dictionary {file_path: fingerprint} where fingerprint is a
+        tuple (size, modification time in nanoseconds)
+        :rtype: dict
+        """
+        files = {}
+        # (dir_path, path relative to save_path with a trailing separator)
+        stack = [(save_path, '')]
+        while stack:
+            dir_path, rel_dir = stack.pop()
+            try:
+                file_names, dir_names, is_reused = self._list_dir(dir_path)
+            except (FileNotFoundError, NotADirectoryError):
+                if not rel_dir:
+                    raise FileNotFoundError(save_path)
+                # Removed while it was scanned.
+                self._dir_files.pop(dir_path, None)
+                continue
+
+            dir_files = self._dir_files.get(dir_path) if is_reused else None
+            if dir_files is None:
+                dir_files = self._stat_files(dir_path, rel_dir, file_names)
+                if self._watched and dir_path in self._listings:
+                    self._dir_files[dir_path] = dir_files
+                else:
+                    self._dir_files.pop(dir_path, None)
+            files.update(dir_files)
+            for name in dir_names:
+                rel_path = rel_dir + name
+                if not self._is_excluded(rel_path):
+                    nested_path = os.path.join(dir_path, name)
+                    stack.append((nested_path, rel_path + '/'))
+        return files
+
+    def _stat_files(self, dir_path, rel_dir, file_names):
+        """Returns the fingerprints of the taken files of a directory.
+
+        :type dir_path: str
+        :param rel_dir: Path of the directory relative to the save folder
+        with a trailing separator
+        :type rel_dir: str
+        :type file_names: list
+        :return: Dictionary {file_path: fingerprint}
+        :rtype: dict
+        """
+        dir_files = {}
+        for name in file_names:
+            if not self._is_taken(rel_dir + name):
+                continue
+            file_path = os.path.join(dir_path, name)
+            try:
+                file_stat = os.stat(file_path)
+            except FileNotFoundError:
+                continue
+            dir_files[file_path] = (file_stat.st_size, file_stat.st_mtime_ns)
+        return dir_files
+
+    def _list_dir(self, dir_path):
+        """Returns the names of the save files and the nested directories.
+
+        :type dir_path: str
+        :raises OSError:
+        :return: Tuple (file_names, dir_names, is_reused), dir_names is empty
+        if the scan is not recursive, is_reused is True if the directory has
+        not changed since the last listing
+        :rtype: tuple
+        """
+        mtime = os.stat(dir_path).st_mtime_ns
+        listing = self._listings.get(dir_path)
+        if listing is not None and listing[0] == mtime:
+            return listing[1], listing[2], True
+
+        file_names = []
+        dir_names = []
+        with os.scandir(dir_path) as entries:
+            for entry in entries:
+                name = entry.name
+                if name.endswith(SAVE_SUFFIXES) and entry.is_file():
+                    file_names.append(name)
+                elif self._recursive and entry.is_dir(follow_symlinks=False):
+                    dir_names.append(name)
+        if time.time_ns() - mtime > _MTIME_RESOLUTION_NS:
+            self._listings[dir_path] = (mtime, file_names, dir_names)
+        else:
+            self._listings.pop(dir_path, None)
+        return file_names, dir_names, False
+
+    def _is_taken(self, rel_path):
+        """Checks the include and exclude patterns of a file.
+
+        :type rel_path: str
+        :rtype: bool
+        """
+        if self._include and not any(
+            fnmatch(rel_path, pattern) for pattern in self._include
+        ):
+            return False
+        return not self._is_excluded(rel_path)
+
+    def _is_excluded(self, rel_path):
+        """Checks the exclude patterns of a file or directory.
+
+        :type rel_path: str
+        :rtype: bool
+        """
+        return any(fnmatch(rel_path, pattern) for pattern in self._exclude)
+
+
+def scan_save_files(save_path):
+    """Finds Diablo 2 files in a directory without nested directories.
+
+    :param save_path: Path to Diablo 2 save directory
+    :type save_path: str
+    :raises FileNotFoundError: If the directory does not exist
+    :return: See SaveScanner.scan.__doc__
+    :rtype: dict
+    """
+    return SaveScanner().scan(save_path)
+
+
+def _has_save_files(dir_path):
+    """Checks if a directory contains at least one Diablo 2 file.
+
+    :type dir_path: pathlib.Path
+    :rtype: bool
+    """
+    try:
+        with os.scandir(dir_path) as entries:
+            return any(
+                entry.name.endswith(SAVE_SUFFIXES) and entry.is_file()
+                for entry in entries
+            )
+    except OSError:
+        return False
+
+
+def find_save_folders(home=None):
+    """Finds the usual save folders of Diablo 2 that contain save files.
+
+    The folders of Windows and of the Wine prefixes in the home directory
+    are checked, nothing is searched recursively.
+
+    :param home: Home directory, defaults to the home of the current user
+    :type home: str or pathlib.Path or None
+    :return: Paths to the folders in the order of the checks
+    :rtype: list
+    """
+    home = Path.home() if home is None else Path(home)
+    drives = []
+    candidates = [home.joinpath('Saved Games', 'Diablo II')]
+    if sys.platform == 'win32':
+        drives.append(Path(os.environ.get('SystemDrive', 'C:') + os.sep))
+    for prefix in _WINE_PREFIXES:
+        drives.extend(sorted(home.glob(f'{prefix}/drive_c')))
+    for drive in drives:
+        for folder in _DRIVE_SAVE_FOLDERS:
+            candidates.extend(sorted(drive.glob(folder)))
+
+    folders = []
+    for candidate in candidates:
+        folder = str(candidate)
+        if folder not in folders and _has_save_files(candidate):
+            folders.append(folder)
+    return folders
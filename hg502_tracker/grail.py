@@ -0,0 +1,234 @@
+"""Compact representation of a Holy Grail state.
+
+A state is a fixed-width bitset where each bit is an item of the catalog.
+Bits are assigned to the set's item IDs in ascending order followed by the
+unique item IDs in ascending order, so the mapping is stable as long as the
+catalog does not change. Union, difference and counting work on a single
+integer regardless of the number of items found.
+"""
+
+import zlib
+
+
+def _count_bits(bits):
+    """Returns the number of set bits of a non-negative integer.
+
+    :type bits: int
+    :rtype: int
+    """
+    return bin(bits).count('1')
+
+
+def _iter_bits(bits):
+    """Yields the positions of the set bits in ascending order.
+
+    :type bits: int
+    :rtype: iterator
+    """
+    while bits:
+        low_bit = bits & -bits
+        yield low_bit.bit_length() - 1
+        bits ^= low_bit
+
+
+class GrailLayout(object):
+    """Stable mapping of set's and unique item IDs to bit positions."""
+
+    def __init__(self, set_ids, unique_ids):
+        """Initializes an instance.
+
+        :param set_ids: IDs of all set's items of the catalog
+        :type set_ids: iterable
+        :param unique_ids: IDs of all unique items of the catalog
+        :type unique_ids: iterable
+        """
+        self.set_ids = tuple(sorted(set_ids))
+        self.unique_ids = tuple(sorted(unique_ids))
+        self.set_count = len(self.set_ids)
+        self.unique_count = len(self.unique_ids)
+        self.size = self.set_count + self.unique_count
+        self.byte_size = (self.size + 7) // 8
+
+        self._set_bits = {
+            item_id: 1 << bit for bit, item_id in enumerate(self.set_ids)
+        }
+        self._unique_bits = {
+            item_id: 1 << bit
+            for bit, item_id in enumerate(self.unique_ids, self.set_count)
+        }
+        self.set_mask = (1 << self.set_count) - 1
+        self.full_mask = (1 << self.size) - 1
+        self.unique_mask = self.full_mask ^ self.set_mask
+        # Identifies the mapping, e.g. to check serialized states.
+        self.checksum = zlib.crc32(
+            repr((self.set_ids, self.unique_ids)).encode()
+        )
+        self.empty = GrailState(self, 0)
+
+    def get_set_bit(self, set_id):
+        """Returns the bitset of a set's item, 0 if it is unknown.
+
+        :type set_id: int
+        :rtype: int
+        """
+        return self._set_bits.get(set_id, 0)
+
+    def get_unique_bit(self, unique_id):
+        """Returns the bitset of a unique item, 0 if it is unknown.
+
+        :type unique_id: int
+        :rtype: int
+        """
+        return self._unique_bits.get(unique_id, 0)
+
+    def make_state(self, set_ids=(), unique_ids=()):
+        """Makes a state from item IDs, unknown IDs are ignored.
+
+        :type set_ids: iterable
+        :type unique_ids: iterable
+        :rtype: GrailState
+        """
+        bits = 0
+        for item_id in set_ids:
+            bits |= self._set_bits.get(item_id, 0)
+        for item_id in unique_ids:
+            bits |= self._unique_bits.get(item_id, 0)
+        return GrailState(self, bits)
+
+    def from_bytes(self, data):
+        """Restores a state serialized by GrailState.to_bytes.
+
+        :type data: bytes
+        :raises ValueError: If data does not fit the layout
+        :rtype: GrailState
+        """
+        if len(data) != self.byte_size:
+            raise ValueError(
+                f'Expected {self.byte_size} bytes, got {len(data)}'
+            )
+        bits = int.from_bytes(data, 'little')
+        if bits & ~self.full_mask:
+            raise ValueError('Bits outside of the layout are set')
+        return GrailState(self, bits)
+
+
+class GrailState(object):
+    """Immutable set of found items of a GrailLayout."""
+
+    __slots__ = ('layout', 'bits')
+
+    def __init__(self, layout, bits):
+        """Initializes an instance.
+
+        :type layout: GrailLayout
+        :param bits: Bitset of the found items
+        :type bits: int
+        """
+        self.layout = layout
+        self.bits = bits
+
+    def __repr__(self):
+        """Returns a short description of the state."""
+        return (
+            f'<GrailState set={self.set_count}/{self.layout.set_count} '
+            f'unique={self.unique_count}/{self.layout.unique_count}>'
+        )
+
+    def __eq__(self, other):
+        """Compares the found items of two states of the same layout."""
+        if not isinstance(other, GrailState):
+            return NotImplemented
+        return self.layout is other.layout and self.bits == other.bits
+
+    def __hash__(self):
+        """Returns the hash of the found items."""
+        return hash(self.bits)
+
+    def __len__(self):
+        """Returns the number of found items."""
+        return _count_bits(self.bits)
+
+    def __bool__(self):
+        """Returns True if at least one item is found."""
+        return bool(self.bits)
+
+    def __or__(self, other):
+        """Returns items found in either state."""
+        return GrailState(self.layout, self.bits | self._get_bits(other))
+
+    def __and__(self, other):
+        """Returns items found in both states."""
+        return GrailState(self.layout, self.bits & self._get_bits(other))
+
+    def __sub__(self, other):
+        """Returns items found in this state but not in the other one."""
+        return GrailState(self.layout, self.bits & ~self._get_bits(other))
+
+    def __invert__(self):
+        """Returns the remaining items."""
+        return GrailState(self.layout, self.bits ^ self.layout.full_mask)
+
+    def _get_bits(self, other):
+        """Returns the bits of a state of the same layout.
+
+        :type other: GrailState
+        :raises ValueError: If the layouts differ
+        :rtype: int
+        """
+        if other.layout is not self.layout:
+            raise ValueError('States have different layouts')
+        return other.bits
+
+    @property
+    def set_count(self):
+        """Number of found set's items.
+
+        :rtype: int
+        """
+        return _count_bits(self.bits & self.layout.set_mask)
+
+    @property
+    def unique_count(self):
+        """Number of found unique items.
+
+        :rtype: int
+        """
+        return _count_bits(self.bits & self.layout.unique_mask)
+
+    def get_set_ids(self):
+        """Returns the IDs of the found set's items in ascending order.
+
+        :rtype: list
+        """
+        set_ids = self.layout.set_ids
+        return [
+            set_ids[bit]
+            for bit in _iter_bits(self.bits & self.layout.set_mask)
+        ]
+
+    def get_unique_ids(self):
+        """Returns the IDs of the found unique items in ascending order.
+
+        :rtype: list
+        """
+        unique_ids = self.layout.unique_ids
+        offset = self.layout.set_count
+        bits = self.bits >> offset
+        return [unique_ids[bit] for bit in _iter_bits(bits)]
+
+    def compare(self, other):
+        """Compares the found items of two players or two snapshots.
+
+        :type other: GrailState
+        :return: Three states: items found by both, only by self and only by
+        other
+        :rtype: tuple
+        """
+        return self & other, self - other, other - self
+
+    def to_bytes(self):
+        """Serializes the state into layout.byte_size bytes.
+
+        :rtype: bytes
+        """
+        return self.bits.to_bytes(self.layout.byte_size, 'little')
@@ -1,20 +1,30 @@
+import importlib
 import sys
+from bisect import bisect_right
+from difflib import SequenceMatcher
 from pathlib import Path
 
 from PyQt5 import QtCore, uic
+from PyQt5.QtGui import QIcon
 from PyQt5.QtWidgets import (
-    QAbstractItemView,
     QFileDialog,
     QLabel,
-    QListWidget,
+    QListView,
     QMainWindow,
     QMessageBox,
+    QPushButton,
     QTableWidgetItem,
 )
 
 from hg502_tracker import __app_name__
 
 UI_DIR = 'ui'
+STATIC_DIR = 'static'
+ICON_NAME = 'icon.gif'
+# Modules compiled from *.ui files by build.py are named _ui_<file stem>.
+UI_MODULE_PREFIX = 'hg502_tracker._ui_'
+# Data role of the item names, the shown text may differ from them.
+NAME_ROLE = QtCore.Qt.UserRole
 
 
 def get_resource_path(relative_path):
@@ -30,22 +40,243 @@ def get_resource_path(relative_path):
     return str(Path('..').joinpath(relative_path))
 
 
+def _import_ui_module(ui_path):
+    """Imports the module compiled from a *.ui file.
+
+    :type ui_path: pathlib.Path
+    :return: The module or None if it was not compiled or the *.ui file has
+    changed since then
+    :rtype: module or None
+    """
+    try:
+        module = importlib.import_module(f'{UI_MODULE_PREFIX}{ui_path.stem}')
+    except ImportError:
+        return None
+    try:
+        if Path(module.__file__).stat().st_mtime < ui_path.stat().st_mtime:
+            return None
+    except (OSError, TypeError):
+        # The module is frozen or the *.ui file is not shipped.
+        pass
+    return module
+
+
 class _UILoader(object):
-    """The mixin class implements the loading of GUI parameters from *.ui."""
+    """The mixin class implements the loading of GUI parameters from *.ui.
+
+    The module compiled from *.ui at build time is used if it is available,
+    otherwise *.ui is loaded at runtime.
+    """
 
     _UI_FILE = None
+    _UI_CLASS = None
 
     def __init__(self):
         """Initializes an instance."""
-        uic.loadUi(
-            Path(get_resource_path(UI_DIR)).joinpath(self._UI_FILE), self
+        ui_path = Path(get_resource_path(UI_DIR)).joinpath(self._UI_FILE)
+        ui_module = _import_ui_module(ui_path)
+        if ui_module is None:
+            uic.loadUi(ui_path, self)
+            return None
+
+        ui = getattr(ui_module, self._UI_CLASS)()
+        ui.setupUi(self)
+        # uic.loadUi sets the widgets as attributes of the window.
+        for name, value in vars(ui).items():
+            setattr(self, name, value)
+        # The compiled icon path is relative to the build directory.
+        self.setWindowIcon(
+            QIcon(str(Path(get_resource_path(STATIC_DIR)).joinpath(ICON_NAME)))
         )
 
 
+class _ItemListModel(QtCore.QAbstractListModel):
+    """Read-only model of item names.
+
+    The model shows one or several lists one after another without copying
+    them, so the lists must not be changed while they are shown. When the
+    lists are replaced, only the rows that differ are removed and inserted,
+    so the views keep their scroll position and selection.
+    """
+
+    def __init__(self, parent=None):
+        """Initializes an instance.
+
+        :type parent: QObject or None
+        """
+        super(_ItemListModel, self).__init__(parent)
+        self._parts = []
+        # The first row of each part.
+        self._offsets = []
+        self._row_count = 0
+        # Names of the rows while the rows are being updated.
+        self._rows = None
+        self.tooltip_func = None
+
+    def set_parts(self, parts):
+        """Replaces the shown lists.
+
+        :param parts: Lists of item names
+        :type parts: iterable
+        """
+        parts = [part for part in parts if part]
+        if not self._row_count or not parts:
+            self.beginResetModel()
+            self._set_parts(parts)
+            self.endResetModel()
+            return None
+
+        old_names = [name for part in self._parts for name in part]
+        new_names = [name for part in parts for name in part]
+        if old_names != new_names:
+            self._update_rows(old_names, new_names)
+        self._set_parts(parts)
+
+    def _set_parts(self, parts):
+        """Sets the shown lists without notifying the views.
+
+        :param parts: Non-empty lists of item names
+        :type parts: list
+        """
+        self._parts = parts
+        self._offsets = []
+        self._row_count = 0
+        for part in parts:
+            self._offsets.append(self._row_count)
+            self._row_count += len(part)
+
+    def _update_rows(self, old_names, new_names):
+        """Removes and inserts the rows that differ.
+
+        The changes are applied from the last row to the first, so the rows
+        of the changes that are not applied yet keep their numbers.
+
+        :type old_names: list
+        :type new_names: list
+        """
+        matcher = SequenceMatcher(None, old_names, new_names, autojunk=False)
+        self._rows = old_names
+        root = QtCore.QModelIndex()
+        for tag, old_start, old_end, new_start, new_end in reversed(
+            matcher.get_opcodes()
+        ):
+            if tag in ('replace', 'delete'):
+                self.beginRemoveRows(root, old_start, old_end - 1)
+                del self._rows[old_start:old_end]
+                self.endRemoveRows()
+            if tag in ('replace', 'insert'):
+                self.beginInsertRows(
+                    root, old_start, old_start + new_end - new_start - 1
+                )
+                self._rows[old_start:old_start] = new_names[new_start:new_end]
+                self.endInsertRows()
+        self._rows = None
+
+    def rowCount(self, parent=QtCore.QModelIndex()):
+        """Returns the number of items."""
+        if parent.isValid():
+            return 0
+        if self._rows is not None:
+            return len(self._rows)
+        return self._row_count
+
+    def data(self, index, role=QtCore.Qt.DisplayRole):
+        """Returns the name of an item or its tooltip."""
+        if not index.isValid():
+            return None
+        if role in (QtCore.Qt.DisplayRole, NAME_ROLE):
+            return self._get_name(index.row())
+        if role == QtCore.Qt.ToolTipRole and self.tooltip_func is not None:
+            return self.tooltip_func(self._get_name(index.row()))
+        return None
+
+    def _get_name(self, row):
+        """Returns the name of the item of a row.
+
+        :type row: int
+        :rtype: str
+        """
+        if self._rows is not None:
+            return self._rows[row]
+        part_index = bisect_right(self._offsets, row) - 1
+        return self._parts[part_index][row - self._offsets[part_index]]
+
+
+class _ItemCountModel(_ItemListModel):
+    """Shows the names of items with their number of copies."""
+
+    def __init__(self, parent=None):
+        """Initializes an instance.
+
+        :type parent: QObject or None
+        """
+        super(_ItemCountModel, self).__init__(parent)
+        self._counts = {}
+
+    def set_parts(self, parts):
+        """Replaces the shown lists.
+
+        The rows of the items whose copies have changed are updated.
+
+        :param parts: Dictionaries {name: copies}
+        :type parts: iterable
+        """
+        parts = list(parts)
+        old_counts = self._counts
+        counts = {}
+        for part in parts:
+            counts.update(part)
+        # The removed rows are still shown while the rows are updated.
+        self._counts = {**old_counts, **counts}
+        super(_ItemCountModel, self).set_parts(list(part) for part in parts)
+        self._counts = counts
+        for row in range(self._row_count):
+            name = self._get_name(row)
+            if old_counts.get(name, counts[name]) != counts[name]:
+                index = self.index(row, 0)
+                self.dataChanged.emit(index, index)
+
+    def data(self, index, role=QtCore.Qt.DisplayRole):
+        """Returns the name of an item with its copies or its tooltip."""
+        if role == QtCore.Qt.DisplayRole and index.isValid():
+            name = self._get_name(index.row())
+            return f'{name} ({self._counts[name]})'
+        return super(_ItemCountModel, self).data(index, role)
+
+
+class _ItemFilterModel(QtCore.QSortFilterProxyModel):
+    """Shows only the items whose names are in the given set."""
+
+    def __init__(self, parent=None):
+        """Initializes an instance.
+
+        :type parent: QObject or None
+        """
+        super(_ItemFilterModel, self).__init__(parent)
+        self._names = None
+
+    def set_names(self, names):
+        """Sets the names of the shown items.
+
+        :param names: Names or None to show all items
+        :type names: set or None
+        """
+        self._names = names
+        self.invalidateFilter()
+
+    def filterAcceptsRow(self, source_row, source_parent):
+        """Returns True if the item is shown."""
+        if self._names is None:
+            return True
+        index = self.sourceModel().index(source_row, 0, source_parent)
+        return index.data(NAME_ROLE) in self._names
+
+
 class _AboutWindow(QMainWindow, _UILoader):
     """About window class."""
 
     _UI_FILE = 'about_window.ui'
+    _UI_CLASS = 'Ui__about_window'
 
     def __init__(self):
         """Initializes an instance."""
@@ -56,6 +287,8 @@ class HG502GUI(QMainWindow, _UILoader):
     """Class of the main interface window."""
 
     _UI_FILE = 'main_window.ui'
+    _UI_CLASS = 'Ui__main_window'
+    _SEARCH_DELAY_MSEC = 250
 
     def __init__(self):
         """Initializes an instance."""
@@ -63,33 +296,69 @@ class HG502GUI(QMainWindow, _UILoader):
         self.setWindowTitle(__app_name__)
 
         self.is_enabled_widgets = False
-        self._about = _AboutWindow()
+        # The about window is created when it is shown for the first time.
+        self._about = None
+        self._about_data = None
 
         self._status_label = QLabel()
         self._status_bar.addWidget(self._status_label)
+        self._cancel_button = QPushButton('Cancel')
+        self._cancel_button.setVisible(False)
+        self._status_bar.addPermanentWidget(self._cancel_button)
+        # Summary of the last refresh, shown only if metrics are enabled.
+        self._metrics_label = QLabel()
+        self._metrics_label.setVisible(False)
+        self._status_bar.addPermanentWidget(self._metrics_label)
+
+        # {list_view: _ItemListModel}, each view shows its model through
+        # an _ItemFilterModel.
+        self._list_models = {}
+        for list_view in self._items_tab.findChildren(QListView):
+            if list_view is self._duplicates_list:
+                model = _ItemCountModel(self)
+            else:
+                model = _ItemListModel(self)
+            filter_model = _ItemFilterModel(self)
+            filter_model.setSourceModel(model)
+            list_view.setModel(filter_model)
+            self._list_models[list_view] = model
+        # {tab: {list_view: parts}}, tabs are filled when they are shown.
+        self._pending_tabs = {}
 
         self._action_about.triggered.connect(self._show_about)
+        self._search_index = None
+        # The search starts when the user stops typing.
+        self._search_timer = QtCore.QTimer(self)
+        self._search_timer.setSingleShot(True)
+        self._search_timer.setInterval(self._SEARCH_DELAY_MSEC)
+        self._search_timer.timeout.connect(self._search_handler)
+        self._search_line.textChanged.connect(self._search_timer.start)
         self._search_button.clicked.connect(self._search_handler)
         self._items_tab.currentChanged.connect(self._change_tab_handler)
 
         self.set_widgets_status('disable')
 
-    def _get_list_widgets(self):
-        """Returns all QListWidget from the current tab."""
-        return self._items_tab.currentWidget().findChildren(QListWidget)
+    def _get_list_views(self):
+        """Returns all QListView from the current tab."""
+        return self._items_tab.currentWidget().findChildren(QListView)
 
     def _change_tab_handler(self):
-        """Scrolls up when the tab is switched."""
-        for list_w in self._get_list_widgets():
-            list_w.scrollToTop()
+        """Fills the tab if it was not filled yet, scrolls up."""
+        self._fill_tab(self._items_tab.currentWidget())
+        for list_view in self._get_list_views():
+            list_view.scrollToTop()
 
     def _show_about(self):
         """Shows the about window."""
+        if self._about is None:
+            self._about = _AboutWindow()
+            if self._about_data is not None:
+                self._fill_about(*self._about_data)
         self._about.show()
 
     def closeEvent(self, *args, **kwargs):
         """Closes the about window if the user has closed the main window."""
-        if self._about.isVisible():
+        if self._about is not None and self._about.isVisible():
             self._about.close()
 
     def set_about_data(
@@ -104,6 +373,24 @@ class HG502GUI(QMainWindow, _UILoader):
         :type author_email: str
         :type home_page: str
         """
+        self._about_data = (
+            app_name,
+            version,
+            _license,
+            author,
+            author_email,
+            home_page,
+        )
+        if self._about is not None:
+            self._fill_about(*self._about_data)
+
+    def _fill_about(
+        self, app_name, version, _license, author, author_email, home_page
+    ):
+        """Fills the QLabel of the about window.
+
+        See set_about_data.__doc__
+        """
         self._about._app_name_label.setText(app_name)
         self._about._version_value.setText(version)
         self._about._license_value.setText(_license)
@@ -120,6 +407,14 @@ class HG502GUI(QMainWindow, _UILoader):
         _action = getattr(self, action)
         _action.triggered.connect(func)
 
+    def is_action_checked(self, action):
+        """Returns True if a checkable action is checked.
+
+        :type action: str
+        :rtype: bool
+        """
+        return getattr(self, action).isChecked()
+
     def clicked_handler_register(self, widget, func):
         """Registers a handler for a clicked event.
 
@@ -143,31 +438,39 @@ class HG502GUI(QMainWindow, _UILoader):
             self, title, directory=directory
         )
 
-    @staticmethod
-    def _clear_selected(list_widget):
-        """Resets selection from QListWidget elements.
+    def set_item_tooltip_func(self, func):
+        """Sets the function that makes the tooltips of the listed items.
 
-        :type list_widget: QListWidget
+        :param func: Function that is called as func(name) when a tooltip is
+        shown and returns its text or None
+        :type func: function
         """
-        for item in list_widget.selectedItems():
-            item.setSelected(False)
+        for model in self._list_models.values():
+            model.tooltip_func = func
+
+    def set_search_index(self, search_index):
+        """Sets the index used to search through the lists of all tabs.
+
+        :type search_index: hg502_tracker.search.SearchIndex
+        """
+        self._search_index = search_index
 
     def _search_handler(self):
-        """Handler for the search button click event."""
-        search_text = self._search_line.text().strip()
-        if not search_text:
+        """Shows only the items that match the search text.
+
+        Called when the search button is clicked or the user has stopped
+        typing. Names with typos are found if nothing matches exactly.
+        """
+        self._search_timer.stop()
+        if self._search_index is None:
             return None
-        for list_w in self._get_list_widgets():
-            items = list_w.findItems(search_text, QtCore.Qt.MatchContains)
-            self._clear_selected(list_w)
-            list_w.setSelectionMode(QAbstractItemView.MultiSelection)
-            if items:
-                for item in items:
-                    item.setSelected(True)
-                    list_w.scrollToItem(
-                        item, QAbstractItemView.PositionAtCenter
-                    )
-            list_w.setSelectionMode(QAbstractItemView.SingleSelection)
+        search_text = self._search_line.text().strip()
+        names = None
+        if search_text:
+            names = self._search_index.search(search_text, fuzzy=True)
+        for list_view in self._list_models:
+            list_view.model().set_names(names)
+            list_view.scrollToTop()
 
     def set_widgets_status(self, status):
         """Enables / disables widgets.
@@ -189,6 +492,8 @@ class HG502GUI(QMainWindow, _UILoader):
     def fill_stat_table(self, data):
         """Fills in the statistics table.
 
+        Only the cells whose text has changed are updated.
+
         :param data: A list of three elements where each element is 4 long and
         is a table row.
         :type data: iterable
@@ -197,50 +502,91 @@ class HG502GUI(QMainWindow, _UILoader):
         for row_data in data:
             column = 0
             for value in row_data:
-                item = QTableWidgetItem(str(value))
-                item.setTextAlignment(QtCore.Qt.AlignCenter)
-                self._stat_table.setItem(row, column, item)
+                text = str(value)
+                item = self._stat_table.item(row, column)
+                if item is None:
+                    item = QTableWidgetItem(text)
+                    item.setTextAlignment(QtCore.Qt.AlignCenter)
+                    self._stat_table.setItem(row, column, item)
+                elif item.text() != text:
+                    item.setText(text)
                 column += 1
             row += 1
 
-    @staticmethod
-    def _fill_items_list(w_list, data):
-        """Fills the QListWidget with data from `data`.
+    def _fill_tab(self, tab):
+        """Fills the lists of a tab with the data set for them.
+
+        :type tab: QWidget
+        """
+        tab_lists = self._pending_tabs.pop(tab, None)
+        if tab_lists is None:
+            return None
+        for list_view, parts in tab_lists.items():
+            self._list_models[list_view].set_parts(parts)
+
+    def _set_tab_lists(self, tab, tab_lists):
+        """Sets the data of the tab lists, fills them if the tab is shown.
 
-        :type w_list: QListWidget
-        :type data: list
+        :type tab: QWidget
+        :param tab_lists: Dictionary {list_view: parts}, see
+        _ItemListModel.set_parts.__doc__
+        :type tab_lists: dict
         """
-        w_list.clear()
-        for value in data:
-            w_list.addItem(value)
-        w_list.scrollToTop()
+        self._pending_tabs[tab] = tab_lists
+        if tab is self._items_tab.currentWidget():
+            self._fill_tab(tab)
 
     def fill_all_items_list(self, found, remaining):
-        """Fills the QListWidget of the `All` tab.
+        """Fills the lists of the `All` tab.
 
-        :type found: list
-        :type remaining: list
+        :param found: Lists of found items shown one after another
+        :type found: iterable
+        :param remaining: Lists of remaining items shown one after another
+        :type remaining: iterable
         """
-        self._fill_items_list(self._all_list_found, found)
-        self._fill_items_list(self._all_list_remaining, remaining)
+        self._set_tab_lists(
+            self._all_tab,
+            {self._all_list_found: found, self._all_list_remaining: remaining},
+        )
 
     def fill_set_items_list(self, found, remaining):
-        """Fills the QListWidget of the `Set's` tab.
+        """Fills the lists of the `Set's` tab.
 
         :type found: list
         :type remaining: list
         """
-        self._fill_items_list(self._set_list_found, found)
-        self._fill_items_list(self._set_list_remaining, remaining)
+        self._set_tab_lists(
+            self._set_tab,
+            {
+                self._set_list_found: (found,),
+                self._set_list_remaining: (remaining,),
+            },
+        )
 
     def fill_unique_items_list(self, found, remaining):
-        """Fills the QListWidget of the `Unique` tab.
+        """Fills the lists of the `Unique` tab.
 
         :type found: list
         :type remaining: list
         """
-        self._fill_items_list(self._unique_list_found, found)
-        self._fill_items_list(self._unique_list_remaining, remaining)
+        self._set_tab_lists(
+            self._unique_tab,
+            {
+                self._unique_list_found: (found,),
+                self._unique_list_remaining: (remaining,),
+            },
+        )
+
+    def fill_duplicates_list(self, duplicates):
+        """Fills the list of the `Duplicates` tab.
+
+        :param duplicates: Dictionaries {name: copies} shown one after
+        another
+        :type duplicates: iterable
+        """
+        self._set_tab_lists(
+            self._duplicates_tab, {self._duplicates_list: duplicates}
+        )
 
     @staticmethod
     def _init_message(msg_type, title, short_text, info_text):
@@ -283,9 +629,30 @@ class HG502GUI(QMainWindow, _UILoader):
         )
         msg.exec_()
 
-    def set_status_bar_text(self, text):
+    def set_cancel_visible(self, is_visible):
+        """Shows / hides the button that cancels a refresh.
+
+        :type is_visible: bool
+        """
+        self._cancel_button.setVisible(is_visible)
+
+    def set_status_bar_text(self, text, tooltip=''):
         """Sets the value of the status bar.
 
         :type text: str
+        :type tooltip: str
         """
         self._status_label.setText(text)
+        self._status_label.setToolTip(tooltip)
+
+    def set_metrics_text(self, summary, details):
+        """Shows the timing of the last refresh in the status bar.
+
+        :param summary: One line that is always visible
+        :type summary: str
+        :param details: Text of the tooltip
+        :type details: str
+        """
+        self._metrics_label.setText(summary)
+        self._metrics_label.setToolTip(details)
+        self._metrics_label.setVisible(True)
@@ -1,8 +1,54 @@
+import json
+import multiprocessing
+import os
+import signal
+import threading
+import time
+from collections import deque
+from concurrent import futures
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from contextlib import nullcontext
+from functools import partial
+from itertools import chain, combinations
 from pathlib import Path
 
+from d2lib import __version__ as d2lib_version
 from d2lib.errors import D2SFileParseError, ItemParseError, StashFileParseError
 from d2lib.files import D2SFile, D2XFile, SSSFile
-from d2lib.items_storage import ItemsDataStorage
+
+from hg502_tracker.catalog import (
+    ItemRules,
+    build_canonical_table,
+    load_catalog,
+)
+from hg502_tracker.folders import SaveScanner
+from hg502_tracker.grail import GrailLayout, GrailState
+from hg502_tracker.metrics import (
+    add_profile_stats,
+    is_profiling,
+    measure_call,
+    profile_call,
+)
+from hg502_tracker.scanner import (
+    LOC_CHARACTER,
+    LOC_CORPSE,
+    LOC_MERCENARY,
+    LOC_PAGE,
+    SET_ITEM,
+    UNIQUE_ITEM,
+    ScanError,
+    scan_items,
+)
+from hg502_tracker.stat import GrailStat, ItemNames, ItemStat, make_name_order
+
+_FILE_CLASSES = {'.d2s': D2SFile, '.d2x': D2XFile, '.sss': SSSFile}
+# Number of files per worker process that are parsed ahead of the consumer.
+_READ_AHEAD = 2
+# Seconds between the checks of HG502.interrupt while a worker parses a file.
+_INTERRUPT_CHECK_SEC = 0.1
+# Context of the phases that are not measured, see HG502._measure.
+_NOT_MEASURED = nullcontext()
 
 
 class FileParseError(Exception):
@@ -11,6 +57,108 @@ class FileParseError(Exception):
     pass
 
 
+class ParseInterrupted(Exception):
+    """Used if parsing is stopped by HG502.interrupt."""
+
+    pass
+
+
+def _register_worker(worker_pids):
+    """Reports the PID of a worker process when it starts.
+
+    :param worker_pids: Queue of the PIDs, see HG502._kill_pool
+    :type worker_pids: multiprocessing.SimpleQueue
+    """
+    worker_pids.put(os.getpid())
+
+
+def _collect_items(items, records, location):
+    """Adds set's and unique items including socketed ones to records.
+
+    Socketed items are walked with a stack and are added right after the
+    item they are inserted into.
+
+    :type items: list
+    :param records: List to which (kind, item_id, name, location) tuples are
+    added
+    :type records: list
+    :param location: Location of the items, see _read_items.__doc__
+    :type location: str
+    """
+    stack = list(reversed(items))
+    while stack:
+        item = stack.pop()
+        if item.is_set:
+            records.append((SET_ITEM, item.set_id, item.name, location))
+        elif item.is_unique:
+            records.append((UNIQUE_ITEM, item.unique_id, item.name, location))
+        if item.socketed_items:
+            stack.extend(reversed(item.socketed_items))
+
+
+def _read_items(file_path, fast_scan=False):
+    """Parses a file and returns its set's and unique items.
+
+    This is a module level function so that it can be run in a worker
+    process, only the compact records are sent back to the parent.
+
+    :param file_path: Path to .d2s, .d2x or .sss file
+    :type file_path: str
+    :param fast_scan: Try the fast scanner first, d2lib is used if the
+    scanner cannot handle the file
+    :type fast_scan: bool
+    :raises FileParseError:
+    :return: A list of (kind, item_id, name, location) tuples where kind is
+    SET_ITEM or UNIQUE_ITEM and location is LOC_CHARACTER, LOC_CORPSE,
+    LOC_MERCENARY or `page N` of a stash
+    :rtype: list
+    """
+    if fast_scan:
+        try:
+            return scan_items(file_path)
+        except ScanError:
+            pass
+
+    try:
+        d2_file = _FILE_CLASSES[Path(file_path).suffix](file_path)
+    except (D2SFileParseError, StashFileParseError, ItemParseError) as err:
+        raise FileParseError(f'{file_path}: {err}')
+
+    records = []
+    if isinstance(d2_file, D2SFile):
+        for items, location in (
+            (d2_file.items, LOC_CHARACTER),
+            (d2_file.corpse_items, LOC_CORPSE),
+            (d2_file.merc_items, LOC_MERCENARY),
+        ):
+            if items:
+                _collect_items(items, records, location)
+    else:
+        for page_number, page in enumerate(d2_file.stash, 1):
+            _collect_items(
+                page['items'], records, f'{LOC_PAGE} {page_number}'
+            )
+    return records
+
+
+def _read_file(file_path, fast_scan=False):
+    """Parses a file so that its errors do not stop parsing other files.
+
+    :type file_path: str
+    :type fast_scan: bool
+    :return: Tuple (records, error) where records is None and error is the
+    message of the error if the file could not be parsed, see _read_items
+    :rtype: tuple
+    """
+    try:
+        return _read_items(file_path, fast_scan), None
+    except FileParseError as err:
+        return None, str(err)
+    except Exception as err:
+        # A corrupt or half-written file may make d2lib fail in any way.
+        return None, f'{file_path}: {type(err).__name__}: {err}'
+
+
 class HG502(object):
     """This class retrieves user item data."""
 
@@ -27,255 +175,1071 @@ class HG502(object):
         _FACET_POISON: 'Poison',
     }
     _FACET_PAIRS = (_FACET_LIGHT, _FACET_COLD, _FACET_FIRE, _FACET_POISON)
+    _CACHE_VERSION = 6
+    # {rules key: (set_dict, unique_dict, layout, canonical_table,
+    # set_order, unique_order)}, see _get_catalog
+    _catalogs = {}
 
-    def __init__(self):
-        """Initializes an instance."""
-        item_storage = ItemsDataStorage()
-        self._set_dict = item_storage.get_set_dict()
-        self._unique_dict = item_storage.get_unique_dict()
-
-        for quest_item_id in self._QUESTS_UNIQUE:
-            self._unique_dict.pop(quest_item_id)
-        for _, level_up_facet_id in self._FACET_PAIRS:
-            self._unique_dict.pop(level_up_facet_id)
+    def __init__(
+        self,
+        workers=0,
+        fast_scan=False,
+        rules=None,
+        metrics=None,
+        timeout=None,
+        scanner=None,
+    ):
+        """Initializes an instance.
 
+        :param workers: Number of worker processes used to parse files, files
+        are parsed in the current process if it is less than 2
+        :type workers: int
+        :param fast_scan: Use the fast scanner that decodes only the item IDs,
+        see hg502_tracker.scanner
+        :type fast_scan: bool
+        :param rules: Rules that declare which items are excluded and which
+        are counted as one, defaults to the HG 502 rules, see get_rules
+        :type rules: hg502_tracker.catalog.ItemRules or None
+        :param metrics: Counters of the phases and the files, nothing is
+        measured if it is None, see hg502_tracker.metrics
+        :type metrics: hg502_tracker.metrics.Metrics or None
+        :param timeout: Number of seconds a file may be parsed, the file is
+        quarantined if it takes longer. Files are parsed in worker processes
+        if it is set, in one process if workers is less than 2.
+        :type timeout: float or None
+        :param scanner: Finds the files of save directories, defaults to the
+        files without nested directories
+        :type scanner: hg502_tracker.folders.SaveScanner or None
+        """
+        self._rules = rules or self.get_rules()
+        (
+            self._set_dict,
+            self._unique_dict,
+            self._layout,
+            self._canonical_table,
+            self._set_order,
+            self._unique_order,
+            self._item_aliases,
+        ) = self._get_catalog(self._rules)
         self._save_path = None
-        self._user_set_items = {}
-        self._user_unique_items = {}
+        self._user_items = self._layout.empty
+        # {(kind, item_id): copies} of the user items if they were counted
+        self._item_counts = None
+        # (key, stat) of the last collected statistics, see _get_hg502_stat
+        self._last_stat = None
+        # {save_path: {file_path: (fingerprint, grail_state, items)}} where
+        # items is a tuple of (kind, item_id, location, copies)
+        self._files_cache = {}
+        # {(kind, item_id): {file_path: [location, ...]}} of all cached
+        # files, updated together with _files_cache
+        self._location_index = {}
+        # {save_path: {file_path: (fingerprint, error)}} of the files that
+        # could not be parsed, they are parsed again when they change
+        self._bad_files = {}
+        # True if the cache has changed since it was loaded or saved, and the
+        # path of that cache file, see save_cache
+        self._cache_dirty = False
+        self._cache_file = None
+        # Directories of the last update that did not exist, see
+        # get_missing_folders
+        self._missing_folders = []
+        # {name: (kind, item_id)}, see get_item_locations
+        self._name_keys = None
+        self._workers = workers
+        self._fast_scan = fast_scan
+        self._pool = None
+        # PIDs reported by the workers of the pool, see _kill_pool
+        self._worker_pids = None
+        # Futures of the files that the workers still parse after an
+        # interrupted parse, see _wait_abandoned
+        self._abandoned = []
+        self._metrics = metrics
+        self._timeout = timeout
+        self._scanner = scanner or SaveScanner()
+        # Set by interrupt from another thread, see _update_cache
+        self._interrupted = threading.Event()
 
-    @staticmethod
-    def _get_stat_dict():
-        """Returns the prepared dictionary for statistics."""
-        return {
-            'total_items': 0,
-            'total_found': 0,
-            'total_remaining': 0,
-            'progress': 0.0,
-            'found_items': [],
-            'remaining_items': [],
-        }
+    @classmethod
+    def get_rules(cls):
+        """Returns the rules of the HG 502 challenge.
+
+        Quest items are excluded. Rainbow facets count as four: a level-up
+        facet counts as the die facet of the same element.
+
+        :rtype: hg502_tracker.catalog.ItemRules
+        """
+        rules = ItemRules()
+        rules.exclude(UNIQUE_ITEM, cls._QUESTS_UNIQUE)
+        for facet_pair, suffix in cls._FACET_SUFFIXES.items():
+            die_facet_id, level_up_facet_id = facet_pair
+            rules.add_equivalent(UNIQUE_ITEM, die_facet_id, level_up_facet_id)
+            rules.set_suffix(UNIQUE_ITEM, die_facet_id, suffix)
+        return rules
 
     @staticmethod
-    def _calc_percentage(total, part):
-        """Calculates the percentage of part from total.
+    def _get_catalog(rules):
+        """Returns the catalog of set's and unique items.
+
+        The catalog is loaded from the precompiled file once per rules and
+        shared by all instances, so it must not be modified.
+
+        :type rules: hg502_tracker.catalog.ItemRules
+        :return: Two dictionaries {item_id: name}, set's and unique items,
+        the GrailLayout of these items, the table that canonicalizes item
+        IDs, see hg502_tracker.catalog.build_canonical_table, the orders
+        of set's and unique items by name, see
+        hg502_tracker.stat.make_name_order, and the list of (base item name,
+        name) pairs, see get_item_aliases
+        :rtype: tuple
+        """
+        rules_key = json.dumps(rules.to_list())
+        catalog = HG502._catalogs.get(rules_key)
+        if catalog is None:
+            set_dict, unique_dict, set_bases, unique_bases = load_catalog(
+                rules=rules
+            )
+            layout = GrailLayout(set_dict, unique_dict)
+            canonical_table = build_canonical_table(
+                set_dict, unique_dict, rules, layout
+            )
+            catalog = (
+                set_dict,
+                unique_dict,
+                layout,
+                canonical_table,
+                make_name_order(set_dict, layout.set_ids, 0),
+                make_name_order(
+                    unique_dict, layout.unique_ids, layout.set_count
+                ),
+                [
+                    (base_name, items_dict[item_id])
+                    for items_dict, base_dict in (
+                        (set_dict, set_bases),
+                        (unique_dict, unique_bases),
+                    )
+                    for item_id, base_name in base_dict.items()
+                ],
+            )
+            HG502._catalogs[rules_key] = catalog
+        return catalog
+
+    def close(self, kill=False):
+        """Shuts down the worker processes if they were started.
+
+        :param kill: Terminate the workers instead of waiting until they
+        finish the files they are parsing
+        :type kill: bool
+        """
+        if self._pool is None:
+            return None
+        if kill:
+            self._kill_pool()
+        else:
+            self._pool.shutdown()
+            self._pool = None
+            self._worker_pids = None
+            self._abandoned = []
+
+    def interrupt(self):
+        """Stops parsing files that is running in another thread.
+
+        The method that parses raises ParseInterrupted after the current file
+        in the current process, or right away with worker processes: a file
+        that is being parsed by a worker is not waited for, the worker
+        finishes it and its result is discarded. The next parse waits for
+        such a file first, the workers are terminated only if it is parsed
+        longer than the timeout. The files parsed so far remain in the cache.
+        Only the parsing that is running is stopped, the next one is not.
+        """
+        self._interrupted.set()
+
+    def _measure(self, phase):
+        """Returns the context that measures a phase.
 
-        :type total: int
-        :type part: int
-        :rtype: float
+        :type phase: str
+        :rtype: contextlib.AbstractContextManager
         """
-        return 100 * (part / total)
+        if self._metrics is None:
+            return _NOT_MEASURED
+        return self._metrics.measure(phase)
 
-    def get_hg502_stat(self, save_path):
+    def get_hg502_stat(self, save_path, progress=None, with_counts=False):
         """Collects statistics for all types of items.
 
-        :param save_path: Path to Diablo 2 save directory
-        :type save_path: str
-        :return: Three dictionaries that look like this:
+        :param save_path: Path to Diablo 2 save directory or a list of paths,
+        items of all directories are counted together, a file that is found
+        in several of them is counted once
+        :type save_path: str or list
+        :param progress: See _load_user_items.__doc__
+        :type progress: function or None
+        :param with_counts: Count the copies of the found items, the counts
+        are kept with each parsed file, so no file is parsed again
+        :type with_counts: bool
+        :raises FileNotFoundError: If no directory contains Diablo 2 files
+        :return: Statistics of the files that could be parsed, the others
+        are reported by get_file_errors. Directories that do not exist are
+        skipped and reported by get_missing_folders. It is unpacked as three
+        read-only mappings, total, set's and unique items, that look like
+        this:
         {
             'total_items': int,
             'total_found': int,
             'total_remaining': int,
             'progress': float,
-            'found_items': list,
-            'remaining_items': list
+            'found_items': sequence,
+            'remaining_items': sequence
         }
-        :rtype: tuple
+        With with_counts the mappings of set's and unique items also have
+        'duplicates': {name: copies} of the items found more than once.
+        The same object is returned while the found items and their copies
+        do not change, it must not be modified.
+        :rtype: hg502_tracker.stat.GrailStat
         """
-        self._user_set_items.clear()
-        self._user_unique_items.clear()
+        self._load_user_items(save_path, progress, with_counts)
+        return self._get_hg502_stat()
 
-        total_stat = self._get_stat_dict()
-        set_stat = self._get_stat_dict()
-        unique_stat = self._get_stat_dict()
-        self._load_user_items(save_path)
+    def get_batch_stat(self, save_paths, progress=None, with_counts=False):
+        """Collects statistics for each save directory separately.
 
-        if self._user_set_items:
-            self._get_set_stat(set_stat)
-        if self._user_unique_items:
-            self._get_unique_stat(unique_stat)
+        Changed files of all directories are parsed together, so the worker
+        processes are used even if each directory has only a few of them.
+        The directories must not share files, see _get_overlapping_roots.
 
-        for sum_field in ('total_items', 'total_found', 'total_remaining'):
-            total_stat[sum_field] += (
-                set_stat[sum_field] + unique_stat[sum_field]
+        :type save_paths: list
+        :param progress: See _load_user_items.__doc__
+        :type progress: function or None
+        :param with_counts: See get_hg502_stat.__doc__
+        :type with_counts: bool
+        :raises ValueError: If a directory is given twice in different ways
+        or, with a recursive scanner, one directory is nested in another
+        :return: Dictionary {save_path: stats} where stats is a tuple
+        returned by get_hg502_stat or None if the directory does not exist or
+        does not contain Diablo 2 files
+        :rtype: dict
+        """
+        save_paths = self._get_save_paths(save_paths)
+        overlapping = self._get_overlapping_roots(save_paths)
+        if overlapping:
+            raise ValueError(
+                f'Save folders share files: {", ".join(overlapping)}'
             )
+        self._set_save_path(save_paths)
+        self._update_cache(save_paths, progress)
+
+        batch_stat = {}
+        for save_path in save_paths:
+            if not self._files_cache[save_path]:
+                batch_stat[save_path] = None
+                continue
+            self._collect_user_items([save_path], with_counts)
+            batch_stat[save_path] = self._get_hg502_stat()
+        return batch_stat
+
+    def iter_grail_items(self, paths):
+        """Yields the set's and unique items of files one file at a time.
+
+        A file is parsed only when the items of the previous one have been
+        consumed, the parsed file is released before the next one is read.
+        With worker processes a few files per worker are parsed ahead.
+
+        :param paths: Paths to .d2s, .d2x or .sss files or to Diablo 2 save
+        directories whose files are taken in name order
+        :type paths: str or list
+        :raises FileNotFoundError: If a directory does not exist
+        :raises FileParseError:
+        :return: Tuples (source, kind, item_id, name) where source is the
+        file path, kind is SET_ITEM or UNIQUE_ITEM and item_id is the grail
+        slot ID, excluded items are skipped
+        :rtype: iterator
+        """
+        canonical_table = self._canonical_table
+        for file_path, (records, error) in self._iter_file_records(
+            self._get_file_paths(paths)
+        ):
+            if error is not None:
+                raise FileParseError(error)
+            for kind, item_id, _, _ in records:
+                slot = canonical_table.get((kind, item_id))
+                if slot is not None:
+                    yield file_path, kind, slot[0], slot[1]
 
-        total_stat['progress'] = self._calc_percentage(
-            total_stat['total_items'], total_stat['total_found']
+    def get_item_locations(self, name):
+        """Returns where the found copies of an item are.
+
+        The locations are known for the files of the last collected
+        statistics or the loaded cache.
+
+        :param name: Name of a set's or unique item of the catalog
+        :type name: str
+        :raises KeyError: If there is no such item in the catalog
+        :return: Tuples (file_path, location) in ascending order, see
+        _read_items.__doc__
+        :rtype: list
+        """
+        if self._name_keys is None:
+            self._name_keys = {}
+            for kind, items_dict in (
+                (SET_ITEM, self._set_dict),
+                (UNIQUE_ITEM, self._unique_dict),
+            ):
+                for item_id, item_name in items_dict.items():
+                    self._name_keys[item_name] = (kind, item_id)
+
+        files = self._location_index.get(self._name_keys[name], {})
+        return sorted(
+            (file_path, location)
+            for file_path, locations in files.items()
+            for location in locations
         )
 
-        for sorted_field in ('found_items', 'remaining_items'):
-            set_stat[sorted_field].sort()
-            unique_stat[sorted_field].sort()
+    def get_missing_folders(self):
+        """Returns the directories that did not exist when they were read.
+
+        Their files are not counted, the statistics of the other directories
+        are still collected.
 
-        return total_stat, set_stat, unique_stat
+        :return: Paths in the order they were given
+        :rtype: list
+        """
+        return list(self._missing_folders)
 
-    def _get_common_stat(self, stat_dict, items_dict, user_items_dict):
-        """Fills in the general statistics for each type.
+    def get_file_errors(self, save_paths=None):
+        """Returns the files that could not be parsed.
 
-        :param stat_dict: Dictionary which is filled with data
-        :type stat_dict: dict
-        :param items_dict: Dictionary containing all items
-        :type items_dict: dict
-        :param user_items_dict: Dictionary with user items
-        :type user_items_dict: dict
-        """
-        items_dict_len = len(items_dict)
-        user_items_len = len(user_items_dict)
-        stat_dict['total_items'] = items_dict_len
-        stat_dict['total_found'] = user_items_len
-        stat_dict['total_remaining'] = items_dict_len - user_items_len
-        stat_dict['progress'] = self._calc_percentage(
-            items_dict_len, user_items_len
+        Such a file is not parsed again until its size or modification time
+        changes, its items are not counted.
+
+        :param save_paths: Directories whose files are taken, defaults to all
+        directories of the last collected statistics or the loaded cache
+        :type save_paths: list or None
+        :return: Dictionary {file_path: error} in ascending order of paths
+        :rtype: dict
+        """
+        if save_paths is None:
+            save_paths = list(self._bad_files)
+        errors = {}
+        for save_path in save_paths:
+            for file_path, (_, error) in self._bad_files.get(
+                save_path, {}
+            ).items():
+                errors[file_path] = error
+        return dict(sorted(errors.items()))
+
+    def get_item_names(self):
+        """Returns the names of all set's and unique items of the catalog.
+
+        :rtype: list
+        """
+        return [*self._set_dict.values(), *self._unique_dict.values()]
+
+    def get_item_aliases(self):
+        """Returns the base item names of the catalog items.
+
+        A name can be searched by its base item, e.g. Harlequin Crest by
+        Shako, see hg502_tracker.search.SearchIndex.
+
+        :return: List of (base item name, name) pairs
+        :rtype: list
+        """
+        return list(self._item_aliases)
+
+    def get_grail_state(self):
+        """Returns the items found by the last collected statistics.
+
+        States of different players or snapshots can be compared with
+        GrailState.compare.
+
+        :rtype: hg502_tracker.grail.GrailState
+        """
+        return self._user_items
+
+    def get_cached_stat(self, with_counts=False):
+        """Collects statistics from the cache without reading the files.
+
+        The cache must have been filled earlier by get_hg502_stat or
+        load_cache.
+
+        :param with_counts: See get_hg502_stat.__doc__
+        :type with_counts: bool
+        :raises FileNotFoundError: If the cache is empty
+        :return: See get_hg502_stat.__doc__
+        :rtype: hg502_tracker.stat.GrailStat
+        """
+        if not any(self._files_cache.values()):
+            raise FileNotFoundError
+        self._collect_user_items(with_counts=with_counts)
+        return self._get_hg502_stat()
+
+    def load_cache(self, cache_path):
+        """Loads the file cache previously saved by save_cache.
+
+        The cache is ignored if it was saved by another cache format version
+        or with another version of d2lib.
+
+        :param cache_path: Path to the cache file
+        :type cache_path: str
+        :return: Diablo 2 save directory (or a list of directories) of the
+        cache or None if the cache could not be loaded
+        :rtype: str or list or None
+        """
+        try:
+            with open(cache_path, 'r') as cache_file:
+                cache = json.load(cache_file)
+        except (OSError, ValueError):
+            return None
+
+        if not isinstance(cache, dict):
+            return None
+        if cache.get('version') != self._CACHE_VERSION:
+            return None
+        if cache.get('d2lib') != d2lib_version:
+            return None
+        if cache.get('rules') != self._rules.to_list():
+            return None
+
+        self._save_path = cache['save_path']
+        self._files_cache.clear()
+        self._location_index.clear()
+        self._bad_files.clear()
+        for root, files in cache['roots'].items():
+            root_cache = self._files_cache[root] = {}
+            for file_path, file_data in files.items():
+                size, mtime, items = file_data
+                self._set_file_entry(
+                    root_cache,
+                    file_path,
+                    (size, mtime),
+                    tuple(map(tuple, items)),
+                )
+            bad_files = cache['bad_files'].get(root, {})
+            self._bad_files[root] = {
+                file_path: ((size, mtime), error)
+                for file_path, (size, mtime, error) in bad_files.items()
+            }
+        self._cache_dirty = False
+        self._cache_file = cache_path
+        return self._save_path
+
+    def save_cache(self, cache_path):
+        """Saves the file cache so that it can be loaded by load_cache.
+
+        Each file is stored as its fingerprint (size, modification time) and
+        the IDs, locations and copies of the items found in it. Files that
+        could not be parsed are stored with their errors.
+
+        The file is not written if the cache has not changed since it was
+        loaded from or saved to the same path.
+
+        :param cache_path: Path to the cache file
+        :type cache_path: str
+        :return: True if the file was written
+        :rtype: bool
+        """
+        if not self._cache_dirty and cache_path == self._cache_file:
+            return False
+        roots = {}
+        for root, root_cache in self._files_cache.items():
+            files = roots[root] = {}
+            for file_path, file_data in root_cache.items():
+                (size, mtime), _, items = file_data
+                files[file_path] = (size, mtime, items)
+        bad_files = {
+            root: {
+                file_path: (size, mtime, error)
+                for file_path, ((size, mtime), error) in root_bad.items()
+            }
+            for root, root_bad in self._bad_files.items()
+        }
+        cache = {
+            'version': self._CACHE_VERSION,
+            'd2lib': d2lib_version,
+            'rules': self._rules.to_list(),
+            'save_path': self._save_path,
+            'roots': roots,
+            'bad_files': bad_files,
+        }
+        tmp_path = f'{cache_path}.tmp'
+        with open(tmp_path, 'w') as cache_file:
+            json.dump(cache, cache_file, separators=(',', ':'))
+        os.replace(tmp_path, cache_path)
+        self._cache_dirty = False
+        self._cache_file = cache_path
+        return True
+
+    def _get_hg502_stat(self):
+        """Collects statistics for the already loaded user items.
+
+        The statistics are made again only if the found items or their
+        copies have changed since the previous call.
+
+        :return: See get_hg502_stat.__doc__
+        :rtype: hg502_tracker.stat.GrailStat
+        """
+        duplicates = None
+        if self._item_counts is not None:
+            duplicates = frozenset(
+                (key, copies)
+                for key, copies in self._item_counts.items()
+                if copies > 1
+            )
+        key = (self._user_items, duplicates)
+        if self._last_stat is not None and self._last_stat[0] == key:
+            return self._last_stat[1]
+
+        with self._measure('make_stat'):
+            stat = self._make_hg502_stat()
+        self._last_stat = (key, stat)
+        return stat
+
+    def _make_hg502_stat(self):
+        """Builds the statistics, see _get_hg502_stat.
+
+        :rtype: hg502_tracker.stat.GrailStat
+        """
+        set_stat = self._make_item_stat(
+            SET_ITEM,
+            self._user_items.set_count,
+            self._layout.set_count,
+            self._set_order,
+            self._set_dict,
+        )
+        unique_stat = self._make_item_stat(
+            UNIQUE_ITEM,
+            self._user_items.unique_count,
+            self._layout.unique_count,
+            self._unique_order,
+            self._unique_dict,
         )
-        stat_dict['found_items'] = list(user_items_dict.values())
+        total_stat = ItemStat(
+            set_stat.total_items + unique_stat.total_items,
+            set_stat.total_found + unique_stat.total_found,
+        )
+        return GrailStat(self._user_items, total_stat, set_stat, unique_stat)
 
-    @staticmethod
-    def _get_remaining_ids(items_dict, user_items_dict):
-        """Calculates which item IDs the user does not have.
+    def _make_item_stat(self, kind, found_count, total_items, order, items):
+        """Makes the statistics of one type of items.
+
+        The statistics are empty if no item of the type is found.
+
+        :type kind: str
+        :param found_count: Number of found items of the type
+        :type found_count: int
+        :param total_items: Number of items of the type
+        :type total_items: int
+        :param order: See hg502_tracker.stat.make_name_order.__doc__
+        :type order: tuple
+        :param items: Catalog items of the type
+        :type items: dict
+        :rtype: hg502_tracker.stat.ItemStat
+        """
+        duplicates = None
+        if self._item_counts is not None:
+            duplicates = self._get_duplicates(kind, items)
+        if not found_count:
+            return ItemStat(duplicates=duplicates)
+
+        state = self._user_items
+        return ItemStat(
+            total_items,
+            found_count,
+            ItemNames(order, state.bits, found_count),
+            ItemNames(order, (~state).bits, total_items - found_count),
+            duplicates,
+        )
+
+    def _get_duplicates(self, kind, items_dict):
+        """Returns the items of a kind that are found more than once.
 
-        :param items_dict: Dictionary containing all items
+        :type kind: str
+        :param items_dict: Catalog items of the kind
         :type items_dict: dict
-        :param user_items_dict:  Dictionary with user items
-        :type user_items_dict: dict
-        :rtype: set
+        :return: Dictionary {name: copies} in name order
+        :rtype: dict
         """
-        return set(items_dict).difference(set(user_items_dict))
+        duplicates = {
+            items_dict[item_id]: copies
+            for (item_kind, item_id), copies in self._item_counts.items()
+            if item_kind == kind and copies > 1
+        }
+        return dict(sorted(duplicates.items()))
+
+    def _load_user_items(self, save_path, progress=None, with_counts=False):
+        """Retrieves data for user items such as set's items and unique items.
 
-    def _get_set_stat(self, stat_dict):
-        """Collects statistics on set's items.
+        Data is taken from .d2s, .d2s and .sss files where .d2x is a PlugY
+        personal stash file. Only files whose size or modification time has
+        changed since the previous call are parsed again, the rest are taken
+        from the cache. Each save directory has its own cache.
 
-        :param stat_dict: Dictionary which is filled with data
-        :type stat_dict: dict
+        :param save_path: Path to Diablo 2 save directory or a list of paths
+        :type save_path: str or list
+        :param progress: Function that is called as progress(parsed, total)
+        before parsing and after each parsed file. It may raise an exception
+        to stop parsing, the files parsed so far remain in the cache.
+        :type progress: function or None
+        :param with_counts: See get_hg502_stat.__doc__
+        :type with_counts: bool
+        :raises FileNotFoundError:
+        :raises ParseInterrupted: If interrupt is called while parsing
         """
-        self._get_common_stat(stat_dict, self._set_dict, self._user_set_items)
-        remaining_items = []
-        for remaining_id in self._get_remaining_ids(
-            self._set_dict, self._user_set_items
-        ):
-            remaining_items.append(self._set_dict.get(remaining_id))
+        self._set_save_path(save_path)
+        if not self._update_cache(self._get_save_paths(save_path), progress):
+            raise FileNotFoundError
+        self._collect_user_items(with_counts=with_counts)
 
-        stat_dict['remaining_items'] = remaining_items
+    def _set_save_path(self, save_path):
+        """Sets the save directory (or directories) stored in the cache.
 
-    def _get_unique_stat(self, stat_dict):
-        """Collects statistics on unique items.
+        :type save_path: str or list
+        """
+        if save_path != self._save_path:
+            self._save_path = save_path
+            self._cache_dirty = True
+
+    def _update_cache(self, save_paths, progress=None):
+        """Parses the changed files of the save directories.
+
+        Caches of directories that are not in save_paths are dropped. A file
+        that cannot be parsed is quarantined by its fingerprint, the items
+        of its previous version are dropped. A missing directory is treated
+        as empty and is reported by get_missing_folders.
 
-        :param stat_dict: Dictionary which is filled with data
-        :type stat_dict: dict
+        A file that is found in several directories, see
+        _get_overlapping_roots, is taken only from the first of them, so its
+        items are counted and located once.
+
+        :type save_paths: list
+        :param progress: See _load_user_items.__doc__
+        :type progress: function or None
+        :return: True if at least one directory contains Diablo 2 files
+        :rtype: bool
         """
-        self._get_common_stat(
-            stat_dict, self._unique_dict, self._user_unique_items
+        self._interrupted.clear()
+        changed_files = []
+        has_files = False
+        self._missing_folders = []
+        overlapping = self._get_overlapping_roots(save_paths)
+        # Resolved paths of the files of the overlapping directories
+        taken_files = set()
+
+        for root in set(self._files_cache).difference(save_paths):
+            root_cache = self._files_cache.pop(root)
+            for file_path in list(root_cache):
+                self._drop_file_entry(root_cache, file_path)
+            self._bad_files.pop(root, None)
+            self._cache_dirty = True
+
+        for root in save_paths:
+            if root not in self._files_cache:
+                self._files_cache[root] = {}
+                self._cache_dirty = True
+            root_cache = self._files_cache[root]
+            root_bad = self._bad_files.setdefault(root, {})
+            try:
+                with self._measure('scan_folder'):
+                    found_files = self._scanner.scan(root)
+            except FileNotFoundError:
+                self._missing_folders.append(root)
+                found_files = {}
+            if root in overlapping:
+                found_files = self._take_files(found_files, taken_files)
+            for file_path, fingerprint in found_files.items():
+                bad = root_bad.get(file_path)
+                if bad is not None and bad[0] == fingerprint:
+                    continue
+                cached = root_cache.get(file_path)
+                if cached is None or cached[0] != fingerprint:
+                    changed_files.append(
+                        (root_cache, root_bad, file_path, fingerprint)
+                    )
+            for file_path in set(root_cache).difference(found_files):
+                self._drop_file_entry(root_cache, file_path)
+            for file_path in set(root_bad).difference(found_files):
+                del root_bad[file_path]
+                self._cache_dirty = True
+            has_files = has_files or bool(found_files)
+
+        total = len(changed_files)
+        if progress is not None:
+            progress(0, total)
+
+        file_records = self._iter_file_records(
+            [file_path for _, _, file_path, _ in changed_files]
         )
-        remaining_items = []
-        for remaining_id in self._get_remaining_ids(
-            self._unique_dict, self._user_unique_items
+        for parsed, (_, (records, error)) in enumerate(file_records, 1):
+            root_cache, root_bad, file_path, fingerprint = changed_files[
+                parsed - 1
+            ]
+            if error is None:
+                root_bad.pop(file_path, None)
+                with self._measure('filter_items'):
+                    items = self._filter_items(records)
+                self._set_file_entry(root_cache, file_path, fingerprint, items)
+            else:
+                root_bad[file_path] = (fingerprint, error)
+                self._drop_file_entry(root_cache, file_path)
+                self._cache_dirty = True
+            if progress is not None:
+                progress(parsed, total)
+
+        return has_files
+
+    @staticmethod
+    def _get_save_paths(save_path):
+        """Returns a list of save directories without duplicates.
+
+        :type save_path: str or list
+        :rtype: list
+        """
+        if isinstance(save_path, str):
+            return [save_path]
+        return list(dict.fromkeys(save_path))
+
+    def _get_overlapping_roots(self, save_paths):
+        """Returns the save directories that may share files.
+
+        These are the directories that are given twice in different ways,
+        such as through a symbolic link, and, if the scanner is recursive,
+        the directories nested in one another.
+
+        :type save_paths: list
+        :return: Paths in the order they were given
+        :rtype: list
+        """
+        # Resolved paths with a trailing separator
+        real_paths = [
+            os.path.join(os.path.normcase(os.path.realpath(save_path)), '')
+            for save_path in save_paths
+        ]
+        overlapping = set()
+        for (index, real_path), (other_index, other_path) in combinations(
+            enumerate(real_paths), 2
         ):
-            if self._is_facet(remaining_id):
-                remaining_items.append(
-                    f'{self._unique_dict.get(remaining_id)} '
-                    f'{self._get_facet_suffix(remaining_id)}'
-                )
+            if self._scanner.recursive:
+                is_nested = real_path.startswith(other_path)
+                is_nested = is_nested or other_path.startswith(real_path)
             else:
-                remaining_items.append(self._unique_dict.get(remaining_id))
+                is_nested = real_path == other_path
+            if is_nested:
+                overlapping.update((index, other_index))
+        return [save_paths[index] for index in sorted(overlapping)]
 
-        stat_dict['remaining_items'] = remaining_items
+    @staticmethod
+    def _take_files(found_files, taken_files):
+        """Skips the files that were taken from another save directory.
 
-    def _load_user_items(self, save_path):
-        """Retrieves data for user items such as set's items and unique items.
+        :param found_files: Dictionary {file_path: fingerprint} of a
+        directory, see SaveScanner.scan
+        :type found_files: dict
+        :param taken_files: Resolved paths of the files taken so far, the
+        taken files of the directory are added
+        :type taken_files: set
+        :return: Dictionary {file_path: fingerprint} of the files that were
+        not taken before
+        :rtype: dict
+        """
+        files = {}
+        for file_path, fingerprint in found_files.items():
+            real_path = os.path.normcase(os.path.realpath(file_path))
+            if real_path not in taken_files:
+                taken_files.add(real_path)
+                files[file_path] = fingerprint
+        return files
 
-        Data is taken from .d2s, .d2s and .sss files where .d2x is a PlugY
-        personal stash file.
+    def _get_file_paths(self, paths):
+        """Returns the paths of files, directories are replaced by their files.
 
-        :param save_path: Path to Diablo 2 save directory
-        :type save_path: str
-        :raises FileParseError:
+        :type paths: str or list
+        :raises FileNotFoundError: If a directory does not exist
+        :rtype: list
         """
-        self._save_path = save_path
-        d2s_files = []
-        stash_files = []
+        if isinstance(paths, str):
+            paths = [paths]
+        file_paths = []
+        for path in paths:
+            if os.path.isdir(path):
+                file_paths.extend(sorted(self._scanner.scan(path)))
+            else:
+                file_paths.append(path)
+        return file_paths
+
+    def _iter_file_records(self, file_paths):
+        """Yields the records of each file together with its path.
 
+        :type file_paths: list
+        :return: Tuples (file_path, (records, error)) in the order of
+        file_paths, see _read_file.__doc__
+        :rtype: iterator
+        """
+        return zip(file_paths, self._read_files(file_paths))
+
+    def _read_files(self, file_paths):
+        """Parses files in worker processes or in the current process.
+
+        The worker processes are started on first use and are reused by the
+        subsequent calls. At most _READ_AHEAD files per worker are parsed
+        ahead, files that are not reached are not parsed. The parse time of
+        each file is measured where it is parsed.
+
+        :type file_paths: list
+        :return: Tuples (records, error) of each file in the order of
+        file_paths, see _read_file.__doc__
+        :rtype: iterator
+        """
+        read_file = partial(
+            measure_call, partial(_read_file, fast_scan=self._fast_scan)
+        )
+        if self._timeout is not None:
+            results = self._read_in_pool(read_file, file_paths)
+        elif self._workers < 2 or len(file_paths) < 2:
+            results = map(read_file, file_paths)
+        else:
+            results = self._read_in_pool(read_file, file_paths)
+        for file_path, (result, seconds, blocks) in zip(file_paths, results):
+            if self._metrics is not None:
+                self._metrics.add_file(file_path, seconds, blocks)
+            yield result
+            if self._interrupted.is_set():
+                raise ParseInterrupted
+
+    def _read_in_pool(self, read_file, file_paths):
+        """Parses files in worker processes, see _read_files.
+
+        A file that is parsed longer than the timeout or crashes its worker
+        is reported as an error, the workers are restarted and the files
+        that were submitted after it are parsed again.
+        While profiling is active, the workers are profiled too and their
+        statistics are added to the profiling of this process.
+
+        :param read_file: Function that parses a file in a worker
+        :type read_file: function
+        :type file_paths: list
+        :rtype: iterator
+        """
+        workers = max(self._workers, 1)
+        max_pending = workers * _READ_AHEAD
+        # (file_path, future) in the order of file_paths
+        pending = deque()
+        file_paths = iter(file_paths)
+        profiled = is_profiling()
+        if profiled:
+            read_file = partial(profile_call, read_file)
+        self._wait_abandoned()
         try:
-            for path in Path(self._save_path).iterdir():
-                if path.suffix == '.d2s':
-                    d2s_files.append(D2SFile(str(path)))
-                elif path.suffix == '.d2x':
-                    stash_files.append(D2XFile(str(path)))
-                elif path.suffix == '.sss':
-                    stash_files.append(SSSFile(str(path)))
-        except (D2SFileParseError, StashFileParseError, ItemParseError) as err:
-            raise FileParseError(f'{path}: {err}')
-
-        if not any((d2s_files, stash_files)):
-            raise FileNotFoundError
+            while True:
+                if self._pool is None:
+                    self._worker_pids = multiprocessing.SimpleQueue()
+                    self._pool = ProcessPoolExecutor(
+                        max_workers=workers,
+                        initializer=_register_worker,
+                        initargs=(self._worker_pids,),
+                    )
+                for file_path in file_paths:
+                    future = self._pool.submit(read_file, file_path)
+                    pending.append((file_path, future))
+                    if len(pending) >= max_pending:
+                        break
+                if not pending:
+                    return
+                file_path, future = pending[0]
+                try:
+                    result = self._wait_result(future)
+                except futures.TimeoutError:
+                    error = f'{file_path}: not parsed in {self._timeout} s'
+                    result = (None, error), self._timeout, 0
+                except BrokenProcessPool as err:
+                    result = (None, f'{file_path}: {err}'), 0.0, 0
+                else:
+                    pending.popleft()
+                    if profiled:
+                        result, stats = result
+                        add_profile_stats(stats)
+                    yield result
+                    continue
+                # The workers are restarted, the files after the failed one
+                # are submitted to the new workers again.
+                self._kill_pool()
+                pending.popleft()
+                file_paths = chain(
+                    [file_path for file_path, _ in pending], file_paths
+                )
+                pending.clear()
+                yield result
+        finally:
+            # The workers may already parse the files that were not reached,
+            # the next parse waits for them.
+            for _, future in pending:
+                if not future.cancel() and not future.done():
+                    self._abandoned.append(future)
 
-        for d2s in d2s_files:
-            if d2s.items:
-                self._filter_items(d2s.items)
-            if d2s.corpse_items:
-                self._filter_items(d2s.corpse_items)
-            if d2s.merc_items:
-                self._filter_items(d2s.merc_items)
+    def _wait_abandoned(self):
+        """Waits for the files of an interrupted parse that are still parsed.
 
-        for stash_file in stash_files:
-            for page in stash_file.stash:
-                self._filter_items(page['items'])
+        Their results are discarded. A file is waited for at most the
+        timeout, the workers are terminated if it takes longer.
 
-    def _is_facet(self, item_id):
-        """Returns True if the ID belongs to Rainbow facet otherwise False.
+        :raises ParseInterrupted: If interrupt is called while waiting, the
+        files are waited for again by the next parse
+        """
+        abandoned = self._abandoned
+        self._abandoned = []
+        for index, future in enumerate(abandoned):
+            try:
+                self._wait_result(future)
+            except ParseInterrupted:
+                self._abandoned = abandoned[index:]
+                raise
+            except (futures.TimeoutError, BrokenProcessPool):
+                if self._pool is not None:
+                    self._kill_pool()
+                return None
+            except futures.CancelledError:
+                pass
 
-        :type item_id: int
-        :rtype: bool
+    def _wait_result(self, future):
+        """Waits for the result of a file that is parsed by a worker.
+
+        :type future: concurrent.futures.Future
+        :raises concurrent.futures.TimeoutError: If the file is parsed longer
+        than the timeout
+        :raises ParseInterrupted: If interrupt is called while waiting
+        :rtype: tuple
         """
-        for pair in self._FACET_PAIRS:
-            if item_id in pair:
-                return True
-        return False
+        deadline = None
+        if self._timeout is not None:
+            deadline = time.monotonic() + self._timeout
+        while True:
+            wait_sec = _INTERRUPT_CHECK_SEC
+            if deadline is not None:
+                wait_sec = min(wait_sec, max(deadline - time.monotonic(), 0))
+            try:
+                return future.result(wait_sec)
+            except futures.TimeoutError:
+                if self._interrupted.is_set():
+                    raise ParseInterrupted
+                if deadline is not None and time.monotonic() >= deadline:
+                    raise
+
+    def _kill_pool(self):
+        """Terminates the worker processes, even those that are busy."""
+        pool = self._pool
+        worker_pids = self._worker_pids
+        self._pool = None
+        self._worker_pids = None
+        self._abandoned = []
+        # ProcessPoolExecutor cannot stop a running call, so the workers are
+        # terminated by the PIDs they reported when they started.
+        while not worker_pids.empty():
+            try:
+                os.kill(worker_pids.get(), signal.SIGTERM)
+            except OSError:
+                # The worker has already exited.
+                pass
+        pool.shutdown(wait=False)
 
-    def _get_die_facet_id(self, facet_id):
-        """Returns the ID of die facet by its pair.
+    def _collect_user_items(self, save_paths=None, with_counts=False):
+        """Unites the grail states of the cached files into the user items.
 
-        :type facet_id:
-        :rtype: int
+        :param save_paths: Directories whose files are taken, defaults to all
+        cached directories
+        :type save_paths: list or None
+        :param with_counts: Also sum the copies of the items of the files
+        :type with_counts: bool
         """
-        for pair in self._FACET_PAIRS:
-            if facet_id in pair:
-                return pair[0]
+        if save_paths is None:
+            save_paths = list(self._files_cache)
+
+        with self._measure('collect_items'):
+            self._unite_files(save_paths, with_counts)
 
-    def _get_facet_suffix(self, facet_id):
-        """Returns an appropriate suffix by facet ID.
+    def _unite_files(self, save_paths, with_counts):
+        """Unites the grail states, see _collect_user_items.
 
-        :type facet_id: int
-        :rtype: str
+        :type save_paths: list
+        :type with_counts: bool
         """
-        for pair, suffix in self._FACET_SUFFIXES.items():
-            if facet_id in pair:
-                return suffix
+        user_items = self._layout.empty
+        item_counts = {} if with_counts else None
+        for save_path in save_paths:
+            root_cache = self._files_cache[save_path]
+            for _, state, items in root_cache.values():
+                user_items |= state
+                if item_counts is None:
+                    continue
+                for kind, item_id, _, copies in items:
+                    key = (kind, item_id)
+                    item_counts[key] = item_counts.get(key, 0) + copies
+        self._user_items = user_items
+        self._item_counts = item_counts
 
-    def _filter_items(self, items):
+    def _filter_items(self, records):
         """Filters the desired items.
 
-        For the HG 502 challenge, need set's and unique items. Rainbow facets
-        count as four.
+        For the HG 502 challenge, need set's and unique items. Each item is
+        canonicalized with a single lookup, see get_rules.
 
-        :type items: list
+        :param records: See _read_items.__doc__
+        :type records: list
+        :return: Tuple of (kind, item_id, location, copies) of the catalog
+        items, item_id is the grail slot ID and copies is the number of the
+        items in the location
+        :rtype: tuple
         """
-        for item in items:
-            if item.is_set and item.set_id not in self._user_set_items:
-                self._user_set_items[item.set_id] = item.name
-            elif (
-                item.is_unique
-                and item.unique_id not in self._QUESTS_UNIQUE  # noqa
-                and item.unique_id not in self._user_unique_items  # noqa
-            ):
-                if self._is_facet(item.unique_id):
-                    die_facet_id = self._get_die_facet_id(item.unique_id)
-                    if die_facet_id in self._user_unique_items:
-                        continue
-                    facet_name = (
-                        f'{item.name} {self._get_facet_suffix(die_facet_id)}'
-                    )
-                    self._user_unique_items[die_facet_id] = facet_name
-                    continue
-                self._user_unique_items[item.unique_id] = item.name
+        canonical_table = self._canonical_table
+        # {(kind, item_id, location): copies}
+        items = {}
+        for kind, item_id, _, location in records:
+            slot = canonical_table.get((kind, item_id))
+            if slot is not None:
+                key = (kind, slot[0], location)
+                items[key] = items.get(key, 0) + 1
+        return tuple((*key, copies) for key, copies in items.items())
+
+    def _make_state(self, items):
+        """Makes the grail state of the items of a file.
+
+        :param items: See _filter_items.__doc__
+        :type items: tuple
+        :rtype: hg502_tracker.grail.GrailState
+        """
+        get_bits = {
+            SET_ITEM: self._layout.get_set_bit,
+            UNIQUE_ITEM: self._layout.get_unique_bit,
+        }
+        bits = 0
+        for kind, item_id, _, _ in items:
+            bits |= get_bits[kind](item_id)
+        return GrailState(self._layout, bits)
 
-            if item.socketed_items:
-                self._filter_items(item.socketed_items)
+    def _set_file_entry(self, root_cache, file_path, fingerprint, items):
+        """Caches the items of a file and adds them to the location index.
+
+        :type root_cache: dict
+        :type file_path: str
+        :type fingerprint: tuple
+        :param items: See _filter_items.__doc__
+        :type items: tuple
+        """
+        self._drop_file_entry(root_cache, file_path)
+        root_cache[file_path] = (fingerprint, self._make_state(items), items)
+        self._cache_dirty = True
+        for kind, item_id, location, _ in items:
+            files = self._location_index.setdefault((kind, item_id), {})
+            files.setdefault(file_path, []).append(location)
+
+    def _drop_file_entry(self, root_cache, file_path):
+        """Removes a file from the cache and from the location index.
+
+        :type root_cache: dict
+        :type file_path: str
+        """
+        entry = root_cache.pop(file_path, None)
+        if entry is None:
+            return None
+        self._cache_dirty = True
+        for kind, item_id, _, _ in entry[2]:
+            files = self._location_index.get((kind, item_id))
+            if files is not None:
+                files.pop(file_path, None)
+                if not files:
+                    del self._location_index[kind, item_id]
@@ -0,0 +1,196 @@
+"""History of found items.
+
+Each refresh appends only the items that were found or lost since the
+previous one, so refreshes that change nothing write nothing. A grail state
+at any point in time is rebuilt from these changes, the timeline of found
+items per day is counted by the database without rebuilding any state. A
+state that may miss items, for example while a save file cannot be parsed,
+is recorded as partial: its items are added, but no item is lost.
+
+Items are stored by their kind and grail slot ID, so the history does not
+depend on the bit positions of a GrailLayout.
+"""
+
+import sqlite3
+import time
+
+from hg502_tracker.scanner import SET_ITEM, UNIQUE_ITEM
+
+HISTORY_VERSION = 1
+
+_SCHEMA = (
+    'CREATE TABLE IF NOT EXISTS changes ('
+    'id INTEGER PRIMARY KEY, '
+    'grail TEXT NOT NULL, '
+    'time REAL NOT NULL, '
+    'kind TEXT NOT NULL, '
+    'item_id INTEGER NOT NULL, '
+    'found INTEGER NOT NULL)',
+    'CREATE INDEX IF NOT EXISTS changes_grail_time ON changes (grail, time)',
+)
+
+
+class HistoryStore(object):
+    """Append-only store of changes of grail states in an SQLite file.
+
+    A store may keep the history of several grails, a grail is identified
+    by a key such as its save folders.
+    """
+
+    def __init__(self, db_path, layout):
+        """Initializes an instance.
+
+        :param db_path: Path to the database file, it is created if missing
+        :type db_path: str
+        :param layout: Layout of the states that are recorded and rebuilt
+        :type layout: hg502_tracker.grail.GrailLayout
+        :raises sqlite3.Error: If the file is not a history database
+        """
+        self._layout = layout
+        self._connection = sqlite3.connect(db_path)
+        # {grail: GrailState} of the last recorded states
+        self._last_states = {}
+        try:
+            (version,) = self._connection.execute(
+                'PRAGMA user_version'
+            ).fetchone()
+            if version not in (0, HISTORY_VERSION):
+                raise sqlite3.DatabaseError(
+                    f'Unsupported history version {version}'
+                )
+            with self._connection:
+                for statement in _SCHEMA:
+                    self._connection.execute(statement)
+                self._connection.execute(
+                    f'PRAGMA user_version = {HISTORY_VERSION}'
+                )
+        except sqlite3.Error:
+            self._connection.close()
+            raise
+
+    def close(self):
+        """Closes the database."""
+        self._connection.close()
+
+    def record(self, grail, state, timestamp=None, partial=False):
+        """Appends the changes of a grail since the last recorded state.
+
+        :param grail: Key of the grail
+        :type grail: str
+        :type state: hg502_tracker.grail.GrailState
+        :param timestamp: Time of the state in seconds since the epoch,
+        defaults to the current time
+        :type timestamp: float or None
+        :param partial: The state may miss found items, only the new items
+        are recorded
+        :type partial: bool
+        :raises sqlite3.Error:
+        :return: Number of found and lost items
+        :rtype: int
+        """
+        last_state = self._get_last_state(grail)
+        if partial:
+            state = state | last_state
+        _, found, lost = state.compare(last_state)
+        if not (found or lost):
+            return 0
+
+        if timestamp is None:
+            timestamp = time.time()
+        rows = [
+            (grail, timestamp, kind, item_id, is_found)
+            for changes, is_found in ((found, 1), (lost, 0))
+            for kind, item_id in self._iter_items(changes)
+        ]
+        with self._connection:
+            self._connection.executemany(
+                'INSERT INTO changes (grail, time, kind, item_id, found) '
+                'VALUES (?, ?, ?, ?, ?)',
+                rows,
+            )
+        self._last_states[grail] = state
+        return len(rows)
+
+    def get_state(self, grail, timestamp=None):
+        """Rebuilds the state of a grail at a point in time.
+
+        :param grail: Key of the grail
+        :type grail: str
+        :param timestamp: Time in seconds since the epoch, defaults to the
+        last recorded state
+        :type timestamp: float or None
+        :raises sqlite3.Error:
+        :return: Found items, items that are not in the layout are skipped
+        :rtype: hg502_tracker.grail.GrailState
+        """
+        if timestamp is None:
+            return self._get_last_state(grail)
+
+        item_ids = {SET_ITEM: set(), UNIQUE_ITEM: set()}
+        # The last change of each item before the time decides if it was
+        # found at that time.
+        cursor = self._connection.execute(
+            'SELECT kind, item_id, found FROM changes '
+            'WHERE id IN ('
+            'SELECT MAX(id) FROM changes WHERE grail = ? AND time <= ? '
+            'GROUP BY kind, item_id'
+            ') AND found = 1',
+            (grail, timestamp),
+        )
+        for kind, item_id, _ in cursor:
+            item_ids[kind].add(item_id)
+        return self._layout.make_state(
+            item_ids[SET_ITEM], item_ids[UNIQUE_ITEM]
+        )
+
+    def get_timeline(self, grail):
+        """Counts found and lost items of a grail per day in local time.
+
+        An item is counted as found only on the first time it was found, an
+        item that is found again after it was lost is not a new find.
+
+        :param grail: Key of the grail
+        :type grail: str
+        :raises sqlite3.Error:
+        :return: Tuples (day, found, lost) in ascending order of days, where
+        day is an ISO date string, days without new finds and losses are
+        skipped
+        :rtype: list
+        """
+        return self._connection.execute(
+            "SELECT date(time, 'unixepoch', 'localtime') AS day, "
+            'SUM(id IN ('
+            'SELECT MIN(id) FROM changes WHERE grail = ? AND found = 1 '
+            'GROUP BY kind, item_id'
+            ')) AS first_found, '
+            'SUM(1 - found) AS lost FROM changes WHERE grail = ? '
+            'GROUP BY day HAVING first_found + lost > 0 ORDER BY day',
+            (grail, grail),
+        ).fetchall()
+
+    def _get_last_state(self, grail):
+        """Returns the last recorded state of a grail.
+
+        The state is rebuilt from the database once and then kept in memory.
+
+        :type grail: str
+        :rtype: hg502_tracker.grail.GrailState
+        """
+        state = self._last_states.get(grail)
+        if state is None:
+            state = self._last_states[grail] = self.get_state(
+                grail, float('inf')
+            )
+        return state
+
+    @staticmethod
+    def _iter_items(state):
+        """Yields (kind, item_id) of the found items of a state.
+
+        :type state: hg502_tracker.grail.GrailState
+        :rtype: iterator
+        """
+        for item_id in state.get_set_ids():
+            yield SET_ITEM, item_id
+        for item_id in state.get_unique_ids():
+            yield UNIQUE_ITEM, item_id
@@ -1,10 +1,23 @@
-import sys
+import time
 
-from PyQt5 import QtWidgets
+# Measured before the other imports, see _FirstPaintTimer.
+START_TIME = time.perf_counter()
 
-from hg502_tracker.app import HG502App
-from hg502_tracker.gui import HG502GUI
-from hg502_tracker.hg502 import HG502
+import multiprocessing  # noqa: E402
+import os  # noqa: E402
+import sys  # noqa: E402
+
+import qdarkstyle  # noqa: E402
+from PyQt5 import QtCore, QtWidgets  # noqa: E402
+
+from hg502_tracker.gui import HG502GUI  # noqa: E402
+
+# If set, the time to the first paint of the main window is printed to
+# stderr. If it is `exit` the application quits right after the first paint.
+STARTUP_TIME_ENV = 'HG502_STARTUP_TIME'
+# Seconds a save file may be parsed. Files are parsed in a worker process,
+# so a file that hangs d2lib is skipped instead of blocking the refreshes.
+PARSE_TIMEOUT_SEC = 10
 
 if sys.platform == 'win32':
     # This is necessary for the correct display of the icon on the taskbar.
@@ -14,7 +27,81 @@ if sys.platform == 'win32':
     ctypes.windll.shell32.SetCurrentProcessExplicitAppUserModelID(app_id)
 
 
+class _FirstPaintTimer(QtCore.QObject):
+    """Reports the time from the start to the first paint of a window."""
+
+    def __init__(self, window, quit_after):
+        """Initializes an instance.
+
+        :type window: QWidget
+        :param quit_after: Quit the application after the first paint
+        :type quit_after: bool
+        """
+        super(_FirstPaintTimer, self).__init__()
+        self._window = window
+        self._quit_after = quit_after
+        self.elapsed_ms = None
+        window.installEventFilter(self)
+
+    def eventFilter(self, obj, event):
+        """Catches the first paint event of the window."""
+        if event.type() == QtCore.QEvent.Paint:
+            self._window.removeEventFilter(self)
+            # Reported after the paint event has been handled.
+            QtCore.QTimer.singleShot(0, self._report)
+        return False
+
+    def _report(self):
+        """Prints the elapsed time."""
+        self.elapsed_ms = (time.perf_counter() - START_TIME) * 1000
+        print(
+            f'time-to-first-paint: {self.elapsed_ms:.1f} ms', file=sys.stderr
+        )
+        if self._quit_after:
+            QtWidgets.QApplication.quit()
+
+
 if __name__ == '__main__':
+    # The frozen build starts the parsing worker processes from its own
+    # executable.
+    multiprocessing.freeze_support()
     qapp = QtWidgets.QApplication(sys.argv)
-    app = HG502App(HG502GUI(), HG502(), qapp)
-    app.run()
+    qapp.setStyleSheet(qdarkstyle.load_stylesheet())
+    gui = HG502GUI()
+
+    paint_timer = None
+    startup_time = os.environ.get(STARTUP_TIME_ENV)
+    if startup_time:
+        paint_timer = _FirstPaintTimer(gui, startup_time == 'exit')
+
+    gui.show()
+    # The window is painted before the backend is imported and the cached
+    # statistics are loaded.
+    qapp.processEvents()
+
+    from hg502_tracker.app import HG502App
+    from hg502_tracker.hg502 import HG502
+
+    if startup_time == 'exit' and paint_timer.elapsed_ms is not None:
+        # Painted already, quit was requested outside of the event loop.
+        sys.exit(0)
+
+    from hg502_tracker.metrics import (
+        PROFILE_ENV,
+        TRACEMALLOC_ENV,
+        create_metrics_from_env,
+        profiling,
+    )
+    from hg502_tracker.scanner import is_fast_scan_enabled
+
+    metrics = create_metrics_from_env()
+    backend = HG502(
+        fast_scan=is_fast_scan_enabled(),
+        metrics=metrics,
+        timeout=PARSE_TIMEOUT_SEC,
+    )
+    app = HG502App(gui, backend, qapp, metrics)
+    with profiling(
+        os.environ.get(PROFILE_ENV), os.environ.get(TRACEMALLOC_ENV)
+    ):
+        app.run()
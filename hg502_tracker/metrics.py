@@ -0,0 +1,581 @@
+"""Timing and allocation counters of collecting statistics.
+
+A Metrics instance passed to HG502 counts the time and the allocated memory
+blocks of each phase of a refresh and the parse time of each file, nothing
+is measured without it. The counters are sent to sinks when a refresh is
+reported: a JSON trace file, a Prometheus textfile or any function such as
+the status bar summary of the GUI.
+
+The phases are:
+
+- scan_folder - listing the files of the save directories;
+- parse - parsing the changed files, the sum of the per-file times, so it
+  is the time of all worker processes together;
+- filter_items - canonicalizing the items of the parsed files;
+- collect_items - uniting the items of the cached files;
+- make_stat - building the statistics, skipped if the found items have not
+  changed since the previous refresh;
+- fill_widgets - filling the GUI lists.
+
+cProfile and tracemalloc can be switched on without editing code by the
+environment variables HG502_PROFILE and HG502_TRACEMALLOC or the options of
+the command line tools, see profiling. The statistics of the refresh thread
+of the GUI and of the parse worker processes are added to the cProfile
+output, see profile_thread and profile_call.
+"""
+
+import cProfile
+import json
+import os
+import pstats
+import sys
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+# Path of a JSON lines file to which each report is appended.
+TRACE_ENV = 'HG502_TRACE'
+# Path of a Prometheus textfile that is rewritten on each report.
+TEXTFILE_ENV = 'HG502_METRICS_TEXTFILE'
+# If set, the GUI shows the summary of each refresh in the status bar.
+METRICS_ENV = 'HG502_METRICS'
+# Path to which the cProfile statistics are written on exit.
+PROFILE_ENV = 'HG502_PROFILE'
+# Path to which the top allocation sites are written on exit.
+TRACEMALLOC_ENV = 'HG502_TRACEMALLOC'
+# Number of allocation sites written by profiling.
+TRACEMALLOC_TOP = 50
+
+# cProfile statistics of other threads and processes that are added to the
+# output of the active profiling, None if cProfile is not active.
+_added_stats = None
+_added_stats_lock = threading.Lock()
+
+
+def measure_call(func, *args):
+    """Calls a function and measures the call.
+
+    This is a module level function so that it can be run in a worker
+    process together with the function.
+
+    :type func: function
+    :return: Tuple (result, seconds, blocks) where blocks is the number of
+    memory blocks that were allocated and not released by the call
+    :rtype: tuple
+    """
+    blocks = sys.getallocatedblocks()
+    start = time.perf_counter()
+    result = func(*args)
+    elapsed = time.perf_counter() - start
+    return result, elapsed, sys.getallocatedblocks() - blocks
+
+
+class Metrics(object):
+    """Counters of the phases and the files since the last report."""
+
+    def __init__(self, sinks=()):
+        """Initializes an instance.
+
+        :param sinks: Functions that are called as sink(snapshot) on each
+        report, see snapshot
+        :type sinks: iterable
+        """
+        self._sinks = list(sinks)
+        # {phase: [calls, seconds, blocks]}
+        self._phases = {}
+        # {file_path: (seconds, blocks)} of the last parse of each file
+        self._files = {}
+
+    def add_sink(self, sink):
+        """Adds a function that receives the reports.
+
+        :type sink: function
+        """
+        self._sinks.append(sink)
+
+    @contextmanager
+    def measure(self, phase):
+        """Measures the time and the allocated blocks of a with block.
+
+        :type phase: str
+        """
+        blocks = sys.getallocatedblocks()
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(
+                phase,
+                time.perf_counter() - start,
+                sys.getallocatedblocks() - blocks,
+            )
+
+    def add(self, phase, seconds, blocks=0):
+        """Adds a measurement of a phase.
+
+        :type phase: str
+        :type seconds: float
+        :param blocks: Net number of allocated memory blocks
+        :type blocks: int
+        """
+        counters = self._phases.get(phase)
+        if counters is None:
+            counters = self._phases[phase] = [0, 0.0, 0]
+        counters[0] += 1
+        counters[1] += seconds
+        counters[2] += blocks
+
+    def add_file(self, file_path, seconds, blocks=0):
+        """Adds the parse time of a file, it is counted in the parse phase.
+
+        :type file_path: str
+        :type seconds: float
+        :type blocks: int
+        """
+        self._files[file_path] = (seconds, blocks)
+        self.add('parse', seconds, blocks)
+
+    def snapshot(self):
+        """Returns the counters since the last report.
+
+        :return: Dictionary that looks like this:
+        {
+            'time': float,
+            'phases': {phase: {'calls': int, 'seconds': float, 'blocks': int}},
+            'files': {file_path: {'seconds': float, 'blocks': int}}
+        }
+        where the phases are in the order of their first measurement
+        :rtype: dict
+        """
+        return {
+            'time': time.time(),
+            'phases': {
+                phase: {'calls': calls, 'seconds': seconds, 'blocks': blocks}
+                for phase, (calls, seconds, blocks) in self._phases.items()
+            },
+            'files': {
+                file_path: {'seconds': seconds, 'blocks': blocks}
+                for file_path, (seconds, blocks) in self._files.items()
+            },
+        }
+
+    def report(self):
+        """Sends the counters to the sinks and resets them.
+
+        A sink that cannot write its file does not stop the others, the
+        measurements must not break a refresh.
+
+        :return: See snapshot.__doc__
+        :rtype: dict
+        """
+        snapshot = self.snapshot()
+        self._phases.clear()
+        self._files.clear()
+        for sink in self._sinks:
+            try:
+                sink(snapshot)
+            except OSError:
+                pass
+        return snapshot
+
+
+class TraceFileSink(object):
+    """Appends each report to a JSON lines file."""
+
+    def __init__(self, trace_path):
+        """Initializes an instance.
+
+        :type trace_path: str
+        """
+        self._trace_path = trace_path
+
+    def __call__(self, snapshot):
+        """Appends a report.
+
+        :param snapshot: See Metrics.snapshot.__doc__
+        :type snapshot: dict
+        """
+        with open(self._trace_path, 'a') as trace_file:
+            trace_file.write(json.dumps(snapshot, separators=(',', ':')))
+            trace_file.write('\n')
+
+
+def _escape_label(value):
+    """Escapes a label value of the Prometheus text format.
+
+    :type value: str
+    :rtype: str
+    """
+    return (
+        value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+    )
+
+
+class PrometheusSink(object):
+    """Rewrites a textfile for the node exporter textfile collector.
+
+    The time and the calls of the phases are counted from the creation of
+    the sink, the allocated blocks are the values of the last report and
+    each file has the time of its last parse.
+    """
+
+    _NAMESPACE = 'hg502'
+
+    def __init__(self, textfile_path):
+        """Initializes an instance.
+
+        :param textfile_path: Path to a .prom file, it is replaced atomically
+        :type textfile_path: str
+        """
+        self._textfile_path = textfile_path
+        # {phase: [calls, seconds]}
+        self._totals = {}
+        # {file_path: seconds}
+        self._files = {}
+
+    def __call__(self, snapshot):
+        """Adds a report and rewrites the textfile.
+
+        :param snapshot: See Metrics.snapshot.__doc__
+        :type snapshot: dict
+        """
+        for phase, counters in snapshot['phases'].items():
+            totals = self._totals.setdefault(phase, [0, 0.0])
+            totals[0] += counters['calls']
+            totals[1] += counters['seconds']
+        for file_path, counters in snapshot['files'].items():
+            self._files[file_path] = counters['seconds']
+
+        lines = []
+        self._add_metric(
+            lines,
+            'phase_seconds_total',
+            'counter',
+            'Time spent in a phase of collecting statistics.',
+            'phase',
+            ((phase, totals[1]) for phase, totals in self._totals.items()),
+        )
+        self._add_metric(
+            lines,
+            'phase_calls_total',
+            'counter',
+            'Number of measurements of a phase.',
+            'phase',
+            ((phase, totals[0]) for phase, totals in self._totals.items()),
+        )
+        self._add_metric(
+            lines,
+            'phase_allocated_blocks',
+            'gauge',
+            'Net number of memory blocks allocated by a phase in the last '
+            'report.',
+            'phase',
+            (
+                (phase, counters['blocks'])
+                for phase, counters in snapshot['phases'].items()
+            ),
+        )
+        self._add_metric(
+            lines,
+            'file_parse_seconds',
+            'gauge',
+            'Time of the last parse of a file.',
+            'file',
+            self._files.items(),
+        )
+        self._add_metric(
+            lines,
+            'last_report_timestamp_seconds',
+            'gauge',
+            'Time of the last report.',
+            None,
+            ((None, snapshot['time']),),
+        )
+
+        tmp_path = f'{self._textfile_path}.tmp'
+        with open(tmp_path, 'w') as textfile:
+            textfile.write('\n'.join(lines))
+            textfile.write('\n')
+        os.replace(tmp_path, self._textfile_path)
+
+    def _add_metric(self, lines, name, metric_type, help_text, label, values):
+        """Adds the lines of a metric.
+
+        :type lines: list
+        :type name: str
+        :param metric_type: counter or gauge
+        :type metric_type: str
+        :type help_text: str
+        :param label: Name of the label or None
+        :type label: str or None
+        :param values: Tuples (label_value, value)
+        :type values: iterable
+        """
+        name = f'{self._NAMESPACE}_{name}'
+        lines.append(f'# HELP {name} {help_text}')
+        lines.append(f'# TYPE {name} {metric_type}')
+        for label_value, value in values:
+            if label is None:
+                lines.append(f'{name} {value}')
+            else:
+                lines.append(
+                    f'{name}{{{label}="{_escape_label(label_value)}"}} {value}'
+                )
+
+
+def _format_seconds(seconds):
+    """Formats a duration for the summary.
+
+    :type seconds: float
+    :rtype: str
+    """
+    if seconds >= 1:
+        return f'{seconds:.2f} s'
+    return f'{seconds * 1000:.1f} ms'
+
+
+def format_summary(snapshot):
+    """Formats the time of each phase of a report in one line.
+
+    :param snapshot: See Metrics.snapshot.__doc__
+    :type snapshot: dict
+    :rtype: str
+    """
+    parts = []
+    for phase, counters in snapshot['phases'].items():
+        part = f'{phase} {_format_seconds(counters["seconds"])}'
+        if phase == 'parse':
+            part += f' ({len(snapshot["files"])} files)'
+        parts.append(part)
+    return ', '.join(parts)
+
+
+def format_details(snapshot, slowest=5):
+    """Formats the counters of a report and the slowest files.
+
+    :param snapshot: See Metrics.snapshot.__doc__
+    :type snapshot: dict
+    :param slowest: Number of the slowest files
+    :type slowest: int
+    :rtype: str
+    """
+    lines = []
+    for phase, counters in snapshot['phases'].items():
+        lines.append(
+            f'{phase}: {_format_seconds(counters["seconds"])} in '
+            f'{counters["calls"]} calls, {counters["blocks"]} blocks'
+        )
+    files = sorted(
+        snapshot['files'].items(),
+        key=lambda file_item: file_item[1]['seconds'],
+        reverse=True,
+    )
+    for file_path, counters in files[:slowest]:
+        lines.append(
+            f'{os.path.basename(file_path)}: '
+            f'{_format_seconds(counters["seconds"])}'
+        )
+    return '\n'.join(lines)
+
+
+def add_metrics_args(parser):
+    """Adds the options of the metrics and profiling to a parser.
+
+    The options default to the environment variables.
+
+    :type parser: argparse.ArgumentParser
+    """
+    group = parser.add_argument_group('metrics and profiling')
+    group.add_argument(
+        '--trace',
+        metavar='PATH',
+        default=os.environ.get(TRACE_ENV),
+        help=f'append the timing of each phase and file as JSON lines '
+        f'(env: {TRACE_ENV})',
+    )
+    group.add_argument(
+        '--metrics-textfile',
+        metavar='PATH',
+        default=os.environ.get(TEXTFILE_ENV),
+        help=f'write the counters in the Prometheus text format '
+        f'(env: {TEXTFILE_ENV})',
+    )
+    group.add_argument(
+        '--profile',
+        metavar='PATH',
+        default=os.environ.get(PROFILE_ENV),
+        help=f'write cProfile statistics on exit (env: {PROFILE_ENV})',
+    )
+    group.add_argument(
+        '--tracemalloc',
+        metavar='PATH',
+        default=os.environ.get(TRACEMALLOC_ENV),
+        help=f'write the top allocation sites on exit '
+        f'(env: {TRACEMALLOC_ENV})',
+    )
+
+
+def create_metrics(trace_path=None, textfile_path=None, enabled=False):
+    """Creates Metrics with the sinks of the given files.
+
+    :param trace_path: See TraceFileSink
+    :type trace_path: str or None
+    :param textfile_path: See PrometheusSink
+    :type textfile_path: str or None
+    :param enabled: Create Metrics even if no file is given
+    :type enabled: bool
+    :return: None if nothing is to be measured
+    :rtype: Metrics or None
+    """
+    sinks = []
+    if trace_path:
+        sinks.append(TraceFileSink(trace_path))
+    if textfile_path:
+        sinks.append(PrometheusSink(textfile_path))
+    if not (sinks or enabled):
+        return None
+    return Metrics(sinks)
+
+
+def create_metrics_from_env(environ=os.environ):
+    """Creates Metrics configured by the environment variables.
+
+    :type environ: dict
+    :rtype: Metrics or None
+    """
+    return create_metrics(
+        environ.get(TRACE_ENV),
+        environ.get(TEXTFILE_ENV),
+        bool(environ.get(METRICS_ENV)),
+    )
+
+
+@contextmanager
+def profiling(profile_path=None, tracemalloc_path=None):
+    """Profiles a with block if the output paths are given.
+
+    cProfile sees only the current thread, the threads and the worker
+    processes that do the work of the block add their statistics by
+    profile_thread and profile_call. tracemalloc sees all threads of the
+    process but not the worker processes. Nothing is done if both paths are
+    None.
+
+    :param profile_path: Path to which the cProfile statistics are written,
+    they can be read by pstats or snakeviz
+    :type profile_path: str or None
+    :param tracemalloc_path: Path to which the allocation sites with the most
+    allocated memory are written as text
+    :type tracemalloc_path: str or None
+    """
+    global _added_stats
+    profiler = None
+    if profile_path:
+        profiler = cProfile.Profile()
+        with _added_stats_lock:
+            _added_stats = []
+    if tracemalloc_path:
+        tracemalloc.start()
+    if profiler is not None:
+        profiler.enable()
+    try:
+        yield
+    finally:
+        if profiler is not None:
+            profiler.disable()
+            with _added_stats_lock:
+                added_stats, _added_stats = _added_stats, None
+            stats = pstats.Stats(profiler)
+            for thread_stats in added_stats:
+                stats.add(_ProfileStats(thread_stats))
+            stats.dump_stats(profile_path)
+        if tracemalloc_path:
+            memory_snapshot = tracemalloc.take_snapshot()
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            top_stats = memory_snapshot.statistics('lineno')
+            with open(tracemalloc_path, 'w') as tracemalloc_file:
+                tracemalloc_file.write(f'peak: {peak} bytes\n')
+                for stat in top_stats[:TRACEMALLOC_TOP]:
+                    tracemalloc_file.write(f'{stat}\n')
+
+
+class _ProfileStats(object):
+    """cProfile statistics in the form that pstats.Stats reads."""
+
+    def __init__(self, stats):
+        """Initializes an instance.
+
+        :param stats: Statistics of cProfile.Profile.create_stats
+        :type stats: dict
+        """
+        self.stats = stats
+
+    def create_stats(self):
+        """Does nothing, the statistics are already created."""
+
+
+def is_profiling():
+    """Checks if cProfile statistics are collected, see profiling.
+
+    :rtype: bool
+    """
+    return _added_stats is not None
+
+
+def add_profile_stats(stats):
+    """Adds cProfile statistics to the output of the active profiling.
+
+    The statistics are dropped if profiling is not active.
+
+    :param stats: Statistics of cProfile.Profile.create_stats
+    :type stats: dict
+    """
+    with _added_stats_lock:
+        if _added_stats is not None:
+            _added_stats.append(stats)
+
+
+@contextmanager
+def profile_thread():
+    """Profiles the current thread while profiling is active.
+
+    A thread that is started in a profiled block, such as the refresh thread
+    of the GUI, runs its work in this with block, its statistics are added
+    to the output of profiling.
+    """
+    if not is_profiling():
+        yield
+        return
+    profiler = cProfile.Profile()
+    try:
+        profiler.enable()
+    except ValueError:
+        # Since Python 3.12 cProfile sees all threads and only one profiler
+        # can be enabled, the thread is already seen by profiling.
+        yield
+        return
+    try:
+        yield
+    finally:
+        profiler.disable()
+        profiler.create_stats()
+        add_profile_stats(profiler.stats)
+
+
+def profile_call(func, *args):
+    """Profiles a call in a worker process.
+
+    This is a module level function so that it can be run in a worker
+    process together with the function. The parent adds the returned
+    statistics to its profiling by add_profile_stats.
+
+    :type func: function
+    :return: Tuple (result, stats) where stats are the statistics of
+    cProfile.Profile.create_stats
+    :rtype: tuple
+    """
+    profiler = cProfile.Profile()
+    result = profiler.runcall(func, *args)
+    profiler.create_stats()
+    return result, profiler.stats
@@ -0,0 +1,473 @@
+"""Fast scanner of set's and unique items in Diablo 2 files.
+
+The scanner walks the item lists of .d2s, .d2x and .sss files directly over
+the file bytes. Item headers are decoded only as far as needed to get the
+set's or unique ID, magic attributes are skipped by their bit widths without
+being formatted. If the scanner meets data it cannot handle, ScanError is
+raised and the file should be parsed by d2lib.
+
+The front ends use the scanner by default, the environment variable
+HG502_NO_FAST_SCAN (or the --no-fast-scan option of the command line tools)
+makes them parse all files with d2lib.
+"""
+
+import mmap
+import os
+from pathlib import Path
+
+from d2lib.files import D2SFile, D2XFile, SSSFile, _D2File, _PlugyStash
+from d2lib.item import Item
+from d2lib.items_storage import ItemsDataStorage
+
+SET_ITEM = 'set'
+UNIQUE_ITEM = 'unique'
+# Locations of items, stash pages are `page N` starting with 1.
+LOC_CHARACTER = 'character'
+LOC_CORPSE = 'corpse'
+LOC_MERCENARY = 'mercenary'
+LOC_PAGE = 'page'
+# If set to a non-empty value, the front ends do not use the scanner.
+NO_FAST_SCAN_ENV = 'HG502_NO_FAST_SCAN'
+
+_D2S_HEADER_SIZE = 765
+_D2S_CHAR_STATUS_OFFSET = 36
+_D2S_MERC_ID_OFFSET = 179
+_D2S_SKILLS_SIZE = 32
+_CHAR_STATUS_EXPANSION = 0b100000
+_ATTRS_END = 0x1FF
+
+_ITEMS_HEADER = _D2File._ITEMS_HEADER.to_bytes(2, 'big')
+_ITEMS_HEADER_VALUE = int.from_bytes(_ITEMS_HEADER, 'little')
+_SKILLS_HEADER = D2SFile._SKILLS_HEADER.to_bytes(2, 'big')
+_MERC_ITEMS_HEADER = D2SFile._MERC_ITEMS_HEADER.to_bytes(2, 'big')
+_STASH_HEADER = _PlugyStash._STASH_HEADER.to_bytes(2, 'little')
+
+
+def is_fast_scan_enabled(environ=os.environ):
+    """Returns False if the scanner is switched off by NO_FAST_SCAN_ENV.
+
+    :type environ: dict
+    :rtype: bool
+    """
+    return not environ.get(NO_FAST_SCAN_ENV)
+
+
+class ScanError(Exception):
+    """Used if the scanner cannot handle the file data."""
+
+    pass
+
+
+class _ItemsData(object):
+    """Compact tables derived from d2lib items data.
+
+    The tables are built on first use and are shared by all scans.
+    """
+
+    _instance = None
+
+    def __init__(self):
+        """Initializes an instance."""
+        storage = ItemsDataStorage()
+        self.get_set_name = storage.get_set_name
+        self.get_unique_name = storage.get_unique_name
+        self.is_quantitative = storage.is_quantitative
+
+        # {magic_attr_id: total bits of its values}
+        self.attr_bits = {}
+        for attr_id in range(_ATTRS_END):
+            attr = storage.get_magic_attr(attr_id)
+            if attr is not None:
+                self.attr_bits[attr_id] = sum(attr['bits'])
+
+        self._item_types = {}
+        self._storage = storage
+
+    @classmethod
+    def get(cls):
+        """Returns the shared instance.
+
+        :rtype: _ItemsData
+        """
+        if cls._instance is None:
+            cls._instance = cls()
+        return cls._instance
+
+    def get_item_type(self, code):
+        """Returns the item type by its code.
+
+        :type code: str
+        :rtype: int
+        """
+        itype = self._item_types.get(code)
+        if itype is None:
+            if self._storage.is_armor(code):
+                itype = Item.T_ARMOR
+            elif self._storage.is_shield(code):
+                itype = Item.T_SHIELD
+            elif self._storage.is_weapon(code):
+                itype = Item.T_WEAPON
+            else:
+                itype = Item.T_MISC
+            self._item_types[code] = itype
+        return itype
+
+
+class _BitReader(object):
+    """Reads little-endian bit fields starting from the lowest bit."""
+
+    __slots__ = ('_data', '_size', 'pos')
+
+    def __init__(self, data, pos=0):
+        """Initializes an instance.
+
+        :param data: File data
+        :type data: bytes | mmap.mmap
+        :param pos: Start position in bits
+        :type pos: int
+        """
+        self._data = data
+        self._size = len(data) * 8
+        self.pos = pos
+
+    def read(self, bits):
+        """Reads n bits.
+
+        :type bits: int
+        :raises ScanError:
+        :rtype: int
+        """
+        pos = self.pos
+        end = pos + bits
+        if end > self._size:
+            raise ScanError('Unexpected end of data')
+        start = pos >> 3
+        stop = (end + 7) >> 3
+        value = int.from_bytes(self._data[start:stop], 'little')
+        self.pos = end
+        return (value >> (pos & 7)) & ((1 << bits) - 1)
+
+    def skip_string(self, bits):
+        """Skips a string of n-bit characters terminated by zero.
+
+        :type bits: int
+        """
+        while self.read(bits):
+            pass
+
+    def align(self):
+        """Moves the position to the byte boundary."""
+        self.pos = (self.pos + 7) & ~7
+
+    @property
+    def offset(self):
+        """Current position in bytes, the position must be aligned.
+
+        :rtype: int
+        """
+        return self.pos >> 3
+
+
+def _read_bytes(data, offset, size):
+    """Reads n bytes at the offset.
+
+    :type data: bytes | mmap.mmap
+    :type offset: int
+    :type size: int
+    :rtype: bytes
+    """
+    end = offset + size
+    return data[offset:end]
+
+
+def _read_int(data, offset, size):
+    """Reads a little-endian integer of n bytes at the offset.
+
+    :type data: bytes | mmap.mmap
+    :type offset: int
+    :type size: int
+    :rtype: int
+    """
+    return int.from_bytes(_read_bytes(data, offset, size), 'little')
+
+
+def _skip_magic_attrs(reader, attr_bits):
+    """Skips a list of magic attributes terminated by 0x1FF.
+
+    :type reader: _BitReader
+    :type attr_bits: dict
+    :raises ScanError:
+    """
+    while True:
+        attr_id = reader.read(9)
+        if attr_id == _ATTRS_END:
+            return None
+        bits = attr_bits.get(attr_id)
+        if bits is None:
+            raise ScanError(f'Unknown magic attribute id: {attr_id}')
+        reader.pos += bits
+
+
+def _scan_item(reader, items_data):
+    """Scans a single item.
+
+    :type reader: _BitReader
+    :type items_data: _ItemsData
+    :raises ScanError:
+    :return: (location_id, inserted_items_count, record) where record is
+    (kind, item_id, name) or None if the item is neither set's nor unique
+    :rtype: tuple
+    """
+    if reader.read(16) != Item._HEADER:
+        raise ScanError('Invalid item header')
+    flags = reader.read(32)
+    is_socketed = flags >> 11 & 1
+    is_ear = flags >> 16 & 1
+    is_simple = flags >> 21 & 1
+    is_personalized = flags >> 24 & 1
+    is_runeword = flags >> 26 & 1
+    # Version, location, equipped location, position and panel.
+    location_id = reader.read(28) >> 10 & 0b111
+
+    if is_ear:
+        reader.pos += 10
+        reader.skip_string(7)
+        reader.align()
+        return location_id, 0, None
+
+    code_value = reader.read(32)
+    code = code_value.to_bytes(4, 'little').decode('latin-1').rstrip()
+    inserted_items_count = reader.read(3)
+    if is_simple:
+        reader.align()
+        return location_id, 0, None
+
+    reader.pos += 39
+    rarity = reader.read(4)
+    if reader.read(1):
+        reader.pos += 3
+    if reader.read(1):
+        reader.pos += 11
+
+    record = None
+    if rarity in (Item.Q_LOW, Item.Q_HIGH):
+        reader.pos += 3
+    elif rarity == Item.Q_MAGIC:
+        reader.pos += 22
+    elif rarity == Item.Q_SET:
+        set_id = reader.read(12)
+        record = (SET_ITEM, set_id, items_data.get_set_name(set_id))
+    elif rarity in (Item.Q_RARE, Item.Q_CRAFTED):
+        reader.pos += 16
+        for _ in range(6):
+            if reader.read(1):
+                reader.pos += 11
+    elif rarity == Item.Q_UNIQUE:
+        unique_id = reader.read(12)
+        record = (
+            UNIQUE_ITEM,
+            unique_id,
+            items_data.get_unique_name(unique_id),
+        )
+
+    if is_runeword:
+        reader.pos += 16
+    if is_personalized:
+        reader.skip_string(7)
+    if code in ('tbk', 'ibk'):
+        reader.pos += 5
+    reader.pos += 1
+
+    itype = items_data.get_item_type(code)
+    if itype in (Item.T_ARMOR, Item.T_SHIELD):
+        reader.pos += 11
+    if itype != Item.T_MISC and reader.read(8):
+        reader.pos += 9
+    if items_data.is_quantitative(code):
+        reader.pos += 9
+    if is_socketed:
+        reader.pos += 4
+
+    set_extra_count = 0
+    if rarity == Item.Q_SET:
+        set_extra_count = Item._SET_EXTRA_COUNTS.get(reader.read(5), 0)
+
+    attr_bits = items_data.attr_bits
+    _skip_magic_attrs(reader, attr_bits)
+    for _ in range(set_extra_count):
+        _skip_magic_attrs(reader, attr_bits)
+    if is_runeword:
+        _skip_magic_attrs(reader, attr_bits)
+
+    reader.align()
+    return location_id, inserted_items_count, record
+
+
+def _scan_items(reader, records, location):
+    """Scans an item list which starts with the `JM` header.
+
+    Socketed items are scanned the same way as the items they are inserted
+    into.
+
+    :type reader: _BitReader
+    :param records: List to which (kind, item_id, name, location) tuples are
+    added
+    :type records: list
+    :param location: Location of the items of the list
+    :type location: str
+    :raises ScanError:
+    """
+    if reader.read(16) != _ITEMS_HEADER_VALUE:
+        raise ScanError('Invalid items header')
+    items_count = reader.read(16)
+    items_data = _ItemsData.get()
+    has_parent = False
+
+    while items_count:
+        location_id, inserted_items_count, record = _scan_item(
+            reader, items_data
+        )
+        if location_id == Item.LOC_SOCKETED:
+            if not has_parent:
+                raise ScanError('Socketed item without a parent')
+        else:
+            has_parent = True
+            items_count += inserted_items_count
+        if record is not None:
+            kind, item_id, name = record
+            records.append((kind, item_id, name, location))
+        items_count -= 1
+
+
+def _scan_d2s(data, records):
+    """Scans the items of the character, its corpse and its mercenary.
+
+    :type data: bytes | mmap.mmap
+    :type records: list
+    :raises ScanError:
+    """
+    if _read_int(data, 0, 4) != D2SFile._HEADER:
+        raise ScanError('Invalid header')
+
+    reader = _BitReader(data, (_D2S_HEADER_SIZE + 2) * 8)
+    attr_sizes = D2SFile._ATTRIBUTE_VALUE_SIZES
+    while True:
+        attr_id = reader.read(9)
+        if attr_id == _ATTRS_END:
+            break
+        attr_size = attr_sizes.get(attr_id)
+        if attr_size is None:
+            raise ScanError(f'Invalid attribute id: {attr_id}')
+        reader.pos += attr_size
+    reader.align()
+    offset = reader.offset
+    if _read_bytes(data, offset, 2) != _SKILLS_HEADER:
+        raise ScanError('Invalid skills header')
+    reader.pos += _D2S_SKILLS_SIZE * 8
+    _scan_items(reader, records, LOC_CHARACTER)
+
+    offset = reader.offset
+    corpse_header = _read_bytes(data, offset, 2)
+    is_dead = _read_int(data, offset + 2, 2)
+    reader.pos += 32
+    if is_dead and corpse_header == _ITEMS_HEADER:
+        reader.pos += 12 * 8
+        _scan_items(reader, records, LOC_CORPSE)
+
+    char_status = data[_D2S_CHAR_STATUS_OFFSET]
+    if not char_status & _CHAR_STATUS_EXPANSION:
+        return None
+    merc_id = _read_int(data, _D2S_MERC_ID_OFFSET, 4)
+    offset = reader.offset
+    merc_header = _read_bytes(data, offset, 2)
+    reader.pos += 16
+    if merc_header == _MERC_ITEMS_HEADER and merc_id:
+        _scan_items(reader, records, LOC_MERCENARY)
+
+
+def _scan_stash(data, page_count_offset, records):
+    """Scans the items of all PlugY stash pages.
+
+    :type data: bytes | mmap.mmap
+    :param page_count_offset: Offset of the page count in bytes
+    :type page_count_offset: int
+    :type records: list
+    :raises ScanError:
+    """
+    page_count = _read_int(data, page_count_offset, 4)
+    reader = _BitReader(data, (page_count_offset + 4) * 8)
+    for page_number in range(1, page_count + 1):
+        offset = reader.offset
+        if _read_bytes(data, offset, 2) != _STASH_HEADER:
+            raise ScanError('Invalid stash header')
+        offset += 2
+        if _read_bytes(data, offset, 2) != _ITEMS_HEADER:
+            # Flags and the null terminated page name.
+            name_end = data.find(b'\x00', offset + 4)
+            if name_end == -1:
+                raise ScanError('Invalid page name')
+            offset = name_end + 1
+        reader.pos = offset * 8
+        _scan_items(reader, records, f'{LOC_PAGE} {page_number}')
+
+
+def _scan_d2x(data, records):
+    """Scans a PlugY personal stash.
+
+    :type data: bytes | mmap.mmap
+    :type records: list
+    :raises ScanError:
+    """
+    if _read_int(data, 0, 4) != D2XFile._HEADER:
+        raise ScanError('Invalid header')
+    if _read_int(data, 4, 2) != D2XFile._VERSION:
+        raise ScanError('Invalid version')
+    _scan_stash(data, 10, records)
+
+
+def _scan_sss(data, records):
+    """Scans a PlugY shared stash.
+
+    :type data: bytes | mmap.mmap
+    :type records: list
+    :raises ScanError:
+    """
+    if _read_int(data, 0, 4) != SSSFile._HEADER:
+        raise ScanError('Invalid header')
+    version = _read_int(data, 4, 2)
+    if version == SSSFile._VERSION_1:
+        _scan_stash(data, 6, records)
+    elif version == SSSFile._VERSION_2:
+        _scan_stash(data, 10, records)
+    else:
+        raise ScanError('Invalid version')
+
+
+_SCANNERS = {'.d2s': _scan_d2s, '.d2x': _scan_d2x, '.sss': _scan_sss}
+
+
+def scan_items(file_path):
+    """Scans a file and returns its set's and unique items.
+
+    :param file_path: Path to .d2s, .d2x or .sss file
+    :type file_path: str
+    :raises ScanError: If the file cannot be handled by the scanner
+    :return: A list of (kind, item_id, name, location) tuples where kind is
+    SET_ITEM or UNIQUE_ITEM and location is one of LOC_CHARACTER, LOC_CORPSE,
+    LOC_MERCENARY or `page N` of a stash
+    :rtype: list
+    """
+    scanner = _SCANNERS.get(Path(file_path).suffix)
+    if scanner is None:
+        raise ScanError(f'Unsupported file: {file_path}')
+
+    records = []
+    try:
+        with open(file_path, 'rb') as d2_file:
+            with mmap.mmap(
+                d2_file.fileno(), 0, access=mmap.ACCESS_READ
+            ) as data:
+                scanner(data, records)
+    except (OSError, ValueError, IndexError) as err:
+        raise ScanError(f'{file_path}: {err}')
+    return records
@@ -0,0 +1,134 @@
+"""Search over item names.
+
+Names and their aliases, e.g. base item names, are indexed by their trigrams
+once, a query is checked only against the keys that contain all trigrams of
+the query. Queries with typos are matched by the similarity of trigrams, only
+the most similar keys are found.
+"""
+
+GRAM_SIZE = 3
+# Dice similarity of the trigrams of a query and a key, 2 * common trigrams /
+# (query trigrams + key trigrams), that a key must have to match fuzzily.
+FUZZY_RATIO = 0.5
+
+
+def _get_grams(text):
+    """Returns the trigrams of a text.
+
+    :type text: str
+    :rtype: set
+    """
+    starts = range(len(text))
+    ends = range(GRAM_SIZE, len(text) + 1)
+    return {text[start:end] for start, end in zip(starts, ends)}
+
+
+class SearchIndex(object):
+    """Trigram index of item names."""
+
+    def __init__(self, names, aliases=()):
+        """Initializes an instance.
+
+        :param names: Item names, duplicates are ignored
+        :type names: iterable
+        :param aliases: (alias, name) pairs, a name is also found by its
+        aliases, see hg502_tracker.hg502.HG502.get_item_aliases
+        :type aliases: iterable
+        """
+        self._names = list(dict.fromkeys(names))
+        name_indexes = {name: index for index, name in enumerate(self._names)}
+        # Lowercase names and aliases and the indexes of their names
+        self._keys = [name.lower() for name in self._names]
+        self._key_names = list(range(len(self._names)))
+        for alias, name in aliases:
+            if name in name_indexes:
+                self._keys.append(alias.lower())
+                self._key_names.append(name_indexes[name])
+        # {trigram: set of key indexes}
+        self._grams = {}
+        # Number of trigrams of each key
+        self._gram_counts = []
+        for key_index, key in enumerate(self._keys):
+            key_grams = _get_grams(key)
+            for gram in key_grams:
+                self._grams.setdefault(gram, set()).add(key_index)
+            self._gram_counts.append(len(key_grams))
+        # (query key, key indexes) of the last exact search, a query that
+        # contains the last one is checked against its result only.
+        self._last_search = (None, None)
+
+    def search(self, query, fuzzy=False):
+        """Finds the names that contain the query ignoring case.
+
+        :type query: str
+        :param fuzzy: If nothing is found, return the names whose names or
+        aliases are the most similar to the query
+        :type fuzzy: bool
+        :return: Found names, all names if the query is empty
+        :rtype: set
+        """
+        key = query.strip().lower()
+        if not key:
+            return set(self._names)
+
+        key_indexes = self._find(key)
+        if not key_indexes and fuzzy:
+            key_indexes = self._find_fuzzy(key)
+        return {
+            self._names[self._key_names[key_index]]
+            for key_index in key_indexes
+        }
+
+    def _find(self, key):
+        """Returns the indexes of the keys that contain the query key.
+
+        :type key: str
+        :rtype: set
+        """
+        last_key, last_indexes = self._last_search
+        if last_key is not None and last_key in key:
+            candidates = last_indexes
+        elif len(key) < GRAM_SIZE:
+            candidates = range(len(self._keys))
+        else:
+            postings = sorted(
+                (self._grams.get(gram, set()) for gram in _get_grams(key)),
+                key=len,
+            )
+            candidates = postings[0].intersection(*postings[1:])
+
+        key_indexes = {
+            key_index
+            for key_index in candidates
+            if key in self._keys[key_index]
+        }
+        self._last_search = (key, key_indexes)
+        return key_indexes
+
+    def _find_fuzzy(self, key):
+        """Returns the indexes of the keys most similar to the query key.
+
+        :type key: str
+        :return: Indexes of the keys that have the best similarity if it is
+        at least FUZZY_RATIO
+        :rtype: set
+        """
+        grams = _get_grams(key)
+        if not grams:
+            return set()
+        counts = {}
+        for gram in grams:
+            for key_index in self._grams.get(gram, ()):
+                counts[key_index] = counts.get(key_index, 0) + 1
+        similarities = {
+            key_index: 2 * count / (len(grams) + self._gram_counts[key_index])
+            for key_index, count in counts.items()
+        }
+        best = max(similarities.values(), default=0)
+        if best < FUZZY_RATIO:
+            return set()
+        return {
+            key_index
+            for key_index, similarity in similarities.items()
+            if similarity == best
+        }
@@ -0,0 +1,427 @@
+"""Local HTTP service of HG502 statistics.
+
+The statistics of the registered save folders are kept in memory and are
+answered as JSON. A folder is parsed again only if its files have changed
+and only the changed files are parsed.
+
+Endpoints:
+
+- GET /folders - list of the registered folders;
+- GET /stat?folder=PATH - total, set's and unique items statistics without
+  the lists of items;
+- GET /items?folder=PATH&type=TYPE&list=LIST - list of item names, where
+  TYPE is total, set or unique and LIST is found or remaining;
+- GET /errors?folder=PATH - {file: error} of the files that could not be
+  parsed, the statistics are collected without them.
+
+The folder parameter may be omitted if only one folder is registered.
+"""
+
+import argparse
+import json
+import sys
+import time
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+from hg502_tracker import __app_name__, __version__
+from hg502_tracker.folders import SaveScanner
+from hg502_tracker.hg502 import HG502
+from hg502_tracker.metrics import add_metrics_args, create_metrics, profiling
+from hg502_tracker.scanner import NO_FAST_SCAN_ENV, is_fast_scan_enabled
+
+STAT_TYPES = ('total', 'set', 'unique')
+ITEM_LISTS = ('found', 'remaining')
+
+
+class RequestError(Exception):
+    """Used in case of a request that cannot be answered."""
+
+    def __init__(self, status, message):
+        """Initializes an instance.
+
+        :type status: http.HTTPStatus
+        :type message: str
+        """
+        super(RequestError, self).__init__(message)
+        self.status = status
+
+
+def _encode(data):
+    """Encodes a response body.
+
+    :rtype: bytes
+    """
+    return json.dumps(data, separators=(',', ':')).encode()
+
+
+class _FolderState(object):
+    """Statistics of a save folder kept in memory."""
+
+    def __init__(
+        self,
+        save_path,
+        check_interval,
+        metrics=None,
+        timeout=None,
+        fast_scan=True,
+    ):
+        """Initializes an instance.
+
+        :param save_path: Path to Diablo 2 save directory
+        :type save_path: str
+        :param check_interval: Minimum number of seconds between checks of
+        the folder files
+        :type check_interval: float
+        :param metrics: Counters that are reported after each refresh
+        :type metrics: hg502_tracker.metrics.Metrics or None
+        :param timeout: See HG502.__init__.__doc__
+        :type timeout: float or None
+        :param fast_scan: See HG502.__init__.__doc__
+        :type fast_scan: bool
+        """
+        self.save_path = save_path
+        self._check_interval = check_interval
+        self._metrics = metrics
+        # The backend reuses the directory listings of the checks.
+        self._scanner = SaveScanner()
+        self._backend = HG502(
+            fast_scan=fast_scan,
+            metrics=metrics,
+            timeout=timeout,
+            scanner=self._scanner,
+        )
+        self._checked_at = None
+        self._fingerprints = None
+        self._stats = None
+        self._error = None
+        # {(endpoint, stat_type, item_list): bytes}
+        self._responses = {}
+
+    def close(self):
+        """Releases the resources of the backend."""
+        self._backend.close()
+
+    def get_response(self, key):
+        """Returns the encoded response body for a request.
+
+        :param key: ('stat', None, None), ('errors', None, None) or
+        ('items', stat_type, item_list)
+        :type key: tuple
+        :raises RequestError: If the folder statistics are not available
+        :rtype: bytes
+        """
+        self.refresh()
+        if self._error is not None:
+            raise self._error
+
+        response = self._responses.get(key)
+        if response is None:
+            response = self._responses[key] = _encode(self._get_data(key))
+        return response
+
+    def refresh(self):
+        """Collects the statistics again if the folder files have changed.
+
+        The folder is checked at most once per check interval.
+        """
+        now = time.monotonic()
+        if self._checked_at is not None:
+            if now - self._checked_at < self._check_interval:
+                return
+        self._checked_at = now
+
+        try:
+            fingerprints = self._scanner.scan(self.save_path)
+        except OSError:
+            fingerprints = {}
+        if fingerprints == self._fingerprints:
+            return
+
+        self._responses.clear()
+        self._stats = None
+        self._error = None
+        # The fingerprints are kept only if the folder could be read, so a
+        # folder that failed is read again on the next check.
+        self._fingerprints = None
+        try:
+            self._stats = self._backend.get_hg502_stat(self.save_path)
+        except FileNotFoundError:
+            self._error = RequestError(
+                HTTPStatus.NOT_FOUND,
+                f'{self.save_path} does not contain Diablo 2 files',
+            )
+        except OSError as err:
+            self._error = RequestError(
+                HTTPStatus.SERVICE_UNAVAILABLE,
+                f'{self.save_path} cannot be read: {err}',
+            )
+        else:
+            self._fingerprints = fingerprints
+        if self._metrics is not None:
+            self._metrics.report()
+
+    def _get_data(self, key):
+        """Makes the response data from the statistics.
+
+        :type key: tuple
+        :rtype: dict or list
+        """
+        endpoint, stat_type, item_list = key
+        if endpoint == 'errors':
+            return self._backend.get_file_errors()
+        stats = dict(zip(STAT_TYPES, self._stats))
+        if endpoint == 'items':
+            if stat_type == 'total':
+                return list(getattr(self._stats, f'all_{item_list}'))
+            return list(stats[stat_type][f'{item_list}_items'])
+
+        data = {}
+        for data_type, stat_dict in stats.items():
+            data[data_type] = {
+                field: value
+                for field, value in stat_dict.items()
+                if not field.endswith('_items')
+            }
+        return data
+
+
+class _RequestHandler(BaseHTTPRequestHandler):
+    """Answers the requests of HG502Server."""
+
+    server_version = f'{__app_name__}/{__version__}'
+
+    def do_GET(self):
+        """Handles GET requests."""
+        url = urlsplit(self.path)
+        query = parse_qs(url.query)
+        try:
+            if url.path == '/folders':
+                body = self.server.folders_response
+            elif url.path == '/stat':
+                folder = self.server.get_folder(
+                    self._get_param(query, 'folder')
+                )
+                body = folder.get_response(('stat', None, None))
+            elif url.path == '/items':
+                folder = self.server.get_folder(
+                    self._get_param(query, 'folder')
+                )
+                stat_type = self._get_param(query, 'type', STAT_TYPES)
+                item_list = self._get_param(query, 'list', ITEM_LISTS)
+                body = folder.get_response(('items', stat_type, item_list))
+            elif url.path == '/errors':
+                folder = self.server.get_folder(
+                    self._get_param(query, 'folder')
+                )
+                body = folder.get_response(('errors', None, None))
+            else:
+                raise RequestError(HTTPStatus.NOT_FOUND, 'Unknown endpoint')
+        except RequestError as err:
+            self._send(err.status, _encode({'error': str(err)}))
+        else:
+            self._send(HTTPStatus.OK, body)
+
+    @staticmethod
+    def _get_param(query, name, choices=None):
+        """Returns a query parameter.
+
+        :type query: dict
+        :type name: str
+        :param choices: Allowed values, the parameter is optional if None
+        :type choices: tuple or None
+        :raises RequestError: If the value is not allowed
+        :rtype: str or None
+        """
+        values = query.get(name)
+        value = values[-1] if values else None
+        if choices is not None and value not in choices:
+            raise RequestError(
+                HTTPStatus.BAD_REQUEST,
+                f'Parameter {name} must be one of: {", ".join(choices)}',
+            )
+        return value
+
+    def _send(self, status, body):
+        """Sends a JSON response.
+
+        :type status: http.HTTPStatus
+        :type body: bytes
+        """
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        """Logs requests only in verbose mode."""
+        if self.server.verbose:
+            super(_RequestHandler, self).log_message(format, *args)
+
+
+class HG502Server(HTTPServer):
+    """HTTP server that answers statistics of save folders from memory.
+
+    Requests are handled one by one, so the folder states are not shared
+    between threads.
+    """
+
+    def __init__(
+        self,
+        address,
+        save_paths,
+        check_interval=1.0,
+        verbose=False,
+        metrics=None,
+        timeout=None,
+        fast_scan=True,
+    ):
+        """Initializes an instance.
+
+        :param address: (host, port)
+        :type address: tuple
+        :param save_paths: Paths to Diablo 2 save directories
+        :type save_paths: list
+        :param check_interval: Minimum number of seconds between checks of
+        the files of a folder
+        :type check_interval: float
+        :param verbose: Log each request to stderr
+        :type verbose: bool
+        :param metrics: Counters of the folder backends, see _FolderState
+        :type metrics: hg502_tracker.metrics.Metrics or None
+        :param timeout: See HG502.__init__.__doc__
+        :type timeout: float or None
+        :param fast_scan: See HG502.__init__.__doc__
+        :type fast_scan: bool
+        """
+        super(HG502Server, self).__init__(address, _RequestHandler)
+        self.verbose = verbose
+        self._folders = {
+            save_path: _FolderState(
+                save_path, check_interval, metrics, timeout, fast_scan
+            )
+            for save_path in dict.fromkeys(save_paths)
+        }
+        self.folders_response = _encode(list(self._folders))
+
+    def warm_up(self):
+        """Collects the statistics of all folders before serving."""
+        for folder in self._folders.values():
+            folder.refresh()
+
+    def get_folder(self, save_path):
+        """Returns the state of a registered folder.
+
+        :param save_path: Folder path, may be None if only one folder is
+        registered
+        :type save_path: str or None
+        :raises RequestError: If the folder is not registered
+        :rtype: _FolderState
+        """
+        if save_path is None and len(self._folders) == 1:
+            (folder,) = self._folders.values()
+            return folder
+        try:
+            return self._folders[save_path]
+        except KeyError:
+            raise RequestError(
+                HTTPStatus.NOT_FOUND, f'Folder {save_path} is not registered'
+            )
+
+    def server_close(self):
+        """Closes the socket and the folder backends."""
+        super(HG502Server, self).server_close()
+        for folder in self._folders.values():
+            folder.close()
+
+
+def _parse_args(argv):
+    """Parses command line arguments.
+
+    :type argv: list or None
+    :rtype: argparse.Namespace
+    """
+    parser = argparse.ArgumentParser(
+        prog=f'{__app_name__.lower()}-server',
+        description='Serves Diablo 2 Holy Grail 502 statistics over HTTP.',
+    )
+    parser.add_argument(
+        'folders', metavar='FOLDER', nargs='+', help='Diablo 2 save folder'
+    )
+    parser.add_argument(
+        '--host', default='127.0.0.1', help='address (default: 127.0.0.1)'
+    )
+    parser.add_argument(
+        '-p', '--port', type=int, default=8502, help='port (default: 8502)'
+    )
+    parser.add_argument(
+        '-i',
+        '--interval',
+        type=float,
+        default=1.0,
+        help='minimum number of seconds between checks of the folder files '
+        '(default: 1.0)',
+    )
+    parser.add_argument(
+        '-t',
+        '--timeout',
+        type=float,
+        default=None,
+        metavar='SECONDS',
+        help='skip files that are parsed longer, files are parsed in a '
+        'worker process then',
+    )
+    parser.add_argument(
+        '--no-fast-scan',
+        action='store_true',
+        default=not is_fast_scan_enabled(),
+        help=f'parse all files with d2lib instead of the fast item scanner '
+        f'(env: {NO_FAST_SCAN_ENV})',
+    )
+    parser.add_argument(
+        '-v', '--verbose', action='store_true', help='log each request'
+    )
+    parser.add_argument(
+        '-V', '--version', action='version', version=__version__
+    )
+    add_metrics_args(parser)
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    """Runs the server until it is interrupted.
+
+    :param argv: Command line arguments, defaults to sys.argv
+    :type argv: list or None
+    :return: Exit code
+    :rtype: int
+    """
+    args = _parse_args(argv)
+    server = HG502Server(
+        (args.host, args.port),
+        args.folders,
+        args.interval,
+        args.verbose,
+        create_metrics(args.trace, args.metrics_textfile),
+        args.timeout,
+        not args.no_fast_scan,
+    )
+    with profiling(args.profile, args.tracemalloc):
+        try:
+            server.warm_up()
+            print(
+                f'Serving on http://{args.host}:{server.server_port}',
+                file=sys.stderr,
+            )
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,328 @@
+"""Statistics of the found items of a Holy Grail state.
+
+The statistics are immutable and share the names of the catalog instead of
+copying them. Lists of item names are views that are built on first access
+from an order of the catalog items by name, which is made once per catalog,
+so no list is sorted when statistics are collected. The lists of all items
+merge the already sorted lists of set's and unique items.
+"""
+
+import heapq
+from abc import abstractmethod
+from collections.abc import Mapping, Sequence
+from types import MappingProxyType
+
+STAT_FIELDS = (
+    'total_items',
+    'total_found',
+    'total_remaining',
+    'progress',
+    'found_items',
+    'remaining_items',
+)
+
+
+def make_name_order(names, item_ids, first_bit):
+    """Orders the items of a kind by name.
+
+    :param names: Dictionary {item_id: name} of the catalog
+    :type names: dict
+    :param item_ids: IDs of the items in the order of their bits, see
+    hg502_tracker.grail.GrailLayout
+    :type item_ids: tuple
+    :param first_bit: Bit of the first item
+    :type first_bit: int
+    :return: Tuple of (name, bit) in name order
+    :rtype: tuple
+    """
+    return tuple(
+        sorted(
+            (names[item_id], bit)
+            for bit, item_id in enumerate(item_ids, first_bit)
+        )
+    )
+
+
+class _NameList(Sequence):
+    """Read-only list of item names that is built on first access."""
+
+    __slots__ = ('_names',)
+
+    def __init__(self):
+        """Initializes an instance."""
+        self._names = None
+
+    def __repr__(self):
+        """Returns a short description of the list."""
+        return f'<{type(self).__name__} of {len(self)} items>'
+
+    def __eq__(self, other):
+        """Compares the names with another list or tuple of names."""
+        if isinstance(other, _NameList):
+            other = other._get_names()
+        elif isinstance(other, list):
+            other = tuple(other)
+        elif not isinstance(other, tuple):
+            return NotImplemented
+        return self._get_names() == other
+
+    def __len__(self):
+        """Returns the number of names."""
+        return len(self._get_names())
+
+    def __getitem__(self, index):
+        """Returns a name or a tuple of names of a slice."""
+        return self._get_names()[index]
+
+    def __iter__(self):
+        """Iterates over the names."""
+        return iter(self._get_names())
+
+    def _get_names(self):
+        """Returns the names, builds them on first call.
+
+        :rtype: tuple
+        """
+        if self._names is None:
+            self._names = self._make_names()
+        return self._names
+
+    @abstractmethod
+    def _make_names(self):
+        """Builds the names.
+
+        :rtype: tuple
+        """
+
+
+class ItemNames(_NameList):
+    """Names of the items of a kind whose bits are set, in name order."""
+
+    __slots__ = ('_order', '_bits', '_count')
+
+    def __init__(self, order, bits, count):
+        """Initializes an instance.
+
+        :param order: Items of the kind, see make_name_order
+        :type order: tuple
+        :param bits: Bitset of the items, bits of other kinds are ignored
+        :type bits: int
+        :param count: Number of the items of the kind whose bits are set
+        :type count: int
+        """
+        super(ItemNames, self).__init__()
+        self._order = order
+        self._bits = bits
+        self._count = count
+
+    def __len__(self):
+        """Returns the number of names without building them."""
+        return self._count
+
+    def _make_names(self):
+        """Selects the names of the set bits.
+
+        :rtype: tuple
+        """
+        bits = self._bits
+        return tuple(name for name, bit in self._order if bits >> bit & 1)
+
+
+class MergedNames(_NameList):
+    """Names of several sorted lists merged in name order."""
+
+    __slots__ = ('_parts',)
+
+    def __init__(self, parts):
+        """Initializes an instance.
+
+        :param parts: Lists of names sorted by name
+        :type parts: iterable
+        """
+        super(MergedNames, self).__init__()
+        self._parts = tuple(parts)
+
+    def __len__(self):
+        """Returns the number of names without merging them."""
+        return sum(len(part) for part in self._parts)
+
+    def _make_names(self):
+        """Merges the lists.
+
+        :rtype: tuple
+        """
+        return tuple(heapq.merge(*self._parts))
+
+
+_NO_NAMES = MergedNames(())
+
+
+class _ReadOnly(object):
+    """The mixin class forbids setting attributes after initialization."""
+
+    __slots__ = ()
+
+    def __setattr__(self, name, value):
+        """Forbids setting an attribute."""
+        raise AttributeError(f'{type(self).__name__} is read-only')
+
+    def __delattr__(self, name):
+        """Forbids deleting an attribute."""
+        raise AttributeError(f'{type(self).__name__} is read-only')
+
+    def _init_fields(self, **fields):
+        """Sets the attributes in __init__.
+
+        :param fields: Values of the attributes by name
+        """
+        for name, value in fields.items():
+            object.__setattr__(self, name, value)
+
+
+class ItemStat(_ReadOnly, Mapping):
+    """Statistics of one type of items.
+
+    Fields are attributes and also items of a read-only mapping with the
+    keys of STAT_FIELDS, 'duplicates' is a key only if the copies were
+    counted.
+    """
+
+    __slots__ = (
+        'total_items',
+        'total_found',
+        'total_remaining',
+        'progress',
+        'found_items',
+        'remaining_items',
+        'duplicates',
+    )
+
+    def __init__(
+        self,
+        total_items=0,
+        total_found=0,
+        found_items=None,
+        remaining_items=None,
+        duplicates=None,
+    ):
+        """Initializes an instance.
+
+        :param total_items: Number of items of the type
+        :type total_items: int
+        :param total_found: Number of found items
+        :type total_found: int
+        :param found_items: Names of the found items in name order, defaults
+        to no items
+        :type found_items: collections.abc.Sequence or None
+        :param remaining_items: Names of the remaining items in name order,
+        defaults to no items
+        :type remaining_items: collections.abc.Sequence or None
+        :param duplicates: Dictionary {name: copies} of the items found more
+        than once in name order, None if the copies were not counted; it is
+        kept as a read-only view
+        :type duplicates: dict or None
+        """
+        progress = 0.0
+        if total_items:
+            progress = 100 * (total_found / total_items)
+        if duplicates is not None:
+            duplicates = MappingProxyType(duplicates)
+        self._init_fields(
+            total_items=total_items,
+            total_found=total_found,
+            total_remaining=total_items - total_found,
+            progress=progress,
+            found_items=_NO_NAMES if found_items is None else found_items,
+            remaining_items=(
+                _NO_NAMES if remaining_items is None else remaining_items
+            ),
+            duplicates=duplicates,
+        )
+
+    def __repr__(self):
+        """Returns a short description of the statistics."""
+        return f'<ItemStat found={self.total_found}/{self.total_items}>'
+
+    def __getitem__(self, key):
+        """Returns a field."""
+        if key in STAT_FIELDS or (
+            key == 'duplicates' and self.duplicates is not None
+        ):
+            return getattr(self, key)
+        raise KeyError(key)
+
+    def __iter__(self):
+        """Iterates over the field names."""
+        yield from STAT_FIELDS
+        if self.duplicates is not None:
+            yield 'duplicates'
+
+    def __len__(self):
+        """Returns the number of fields."""
+        return len(STAT_FIELDS) + (self.duplicates is not None)
+
+
+class GrailStat(_ReadOnly):
+    """Statistics of a grail state.
+
+    It is unpacked as the three statistics (total_stat, set_stat,
+    unique_stat). The total statistics do not list the items, all_found and
+    all_remaining merge the items of both types.
+    """
+
+    __slots__ = (
+        'state',
+        'total_stat',
+        'set_stat',
+        'unique_stat',
+        'all_found',
+        'all_remaining',
+    )
+
+    def __init__(self, state, total_stat, set_stat, unique_stat):
+        """Initializes an instance.
+
+        :param state: Found items the statistics are collected for
+        :type state: hg502_tracker.grail.GrailState
+        :type total_stat: ItemStat
+        :type set_stat: ItemStat
+        :type unique_stat: ItemStat
+        """
+        self._init_fields(
+            state=state,
+            total_stat=total_stat,
+            set_stat=set_stat,
+            unique_stat=unique_stat,
+            all_found=MergedNames(
+                (set_stat.found_items, unique_stat.found_items)
+            ),
+            all_remaining=MergedNames(
+                (set_stat.remaining_items, unique_stat.remaining_items)
+            ),
+        )
+
+    def __repr__(self):
+        """Returns a short description of the statistics."""
+        return f'<GrailStat {self.total_stat!r}>'
+
+    def __eq__(self, other):
+        """Compares the statistics with other statistics or a tuple of them."""
+        if isinstance(other, GrailStat):
+            other = tuple(other)
+        elif not isinstance(other, tuple):
+            return NotImplemented
+        return tuple(self) == other
+
+    def __len__(self):
+        """Returns the number of the statistics."""
+        return 3
+
+    def __getitem__(self, index):
+        """Returns the statistics by index like a tuple."""
+        return (self.total_stat, self.set_stat, self.unique_stat)[index]
+
+    def __iter__(self):
+        """Iterates over the statistics."""
+        yield self.total_stat
+        yield self.set_stat
+        yield self.unique_stat
@@ -1,4 +1,5 @@
 from setuptools import setup
+from setuptools.command.build_py import build_py
 
 from hg502_tracker import (
     __app_name__,
@@ -7,10 +8,37 @@ from hg502_tracker import (
     __version__,
 )
 
+
+class BuildPy(build_py):
+    """Writes the precompiled catalog before the package is built."""
+
+    def run(self):
+        """Builds the package."""
+        try:
+            from hg502_tracker.catalog import CATALOG_PATH, load_catalog
+            from hg502_tracker.hg502 import HG502
+        except ImportError:
+            # Without d2lib the catalog is built at runtime in the user
+            # directory.
+            pass
+        else:
+            load_catalog(CATALOG_PATH, HG502.get_rules())
+        super(BuildPy, self).run()
+
+
 setup(
     name=__app_name__,
     version=__version__,
     description='Diablo 2 Holy Grail 502 challenge tracker',
     author=__author__,
     author_email=__author_email__,
+    packages=['hg502_tracker'],
+    package_data={'hg502_tracker': ['catalog.json', 'bases.json']},
+    cmdclass={'build_py': BuildPy},
+    entry_points={
+        'console_scripts': [
+            'hg502=hg502_tracker.cli:main',
+            'hg502-server=hg502_tracker.server:main',
+        ]
+    },
 )
@@ -0,0 +1,21 @@
+import pytest
+
+from hg502_tracker import catalog
+
+
+@pytest.fixture(scope='session', autouse=True)
+def user_dir(tmp_path_factory):
+    """Keeps the files of the user directory out of the real home.
+
+    The catalog cache, the settings, the cache and the history of the app
+    are written in the home directory.
+    """
+    home_path = tmp_path_factory.mktemp('home')
+    with pytest.MonkeyPatch.context() as monkeypatch:
+        monkeypatch.setenv('HOME', str(home_path))
+        monkeypatch.setattr(
+            catalog,
+            'CATALOG_CACHE_DIR',
+            str(home_path.joinpath('.hg502_catalogs')),
+        )
+        yield home_path
@@ -0,0 +1,53 @@
+from d2lib.files import D2XFile, SSSFile
+
+from benchmarks.run import GUI_STAGES, STAGES, run_benchmarks
+from benchmarks.saves import SHARED_STASH_NAME, generate_save_folder
+from hg502_tracker.hg502 import _read_items
+from hg502_tracker.scanner import scan_items
+
+
+def test_generate_save_folder(tmp_path):
+    file_paths = generate_save_folder(
+        tmp_path,
+        characters=2,
+        shared_pages=40,
+        personal_pages=3,
+        items_per_page=10,
+        socketed_ratio=0.5,
+    )
+    assert len(file_paths) == 5
+    for file_path in file_paths:
+        assert sorted(scan_items(file_path)) == sorted(_read_items(file_path))
+
+    shared_stash = SSSFile(str(tmp_path / SHARED_STASH_NAME))
+    assert shared_stash.page_count == 40
+    items = [item for page in shared_stash.stash for item in page['items']]
+    assert len(items) == 400
+    assert any(item.socketed_items for item in items)
+    assert D2XFile(str(tmp_path / 'char001.d2x')).page_count == 3
+
+    again_path = tmp_path / 'again'
+    generate_save_folder(
+        again_path,
+        characters=2,
+        shared_pages=40,
+        personal_pages=3,
+        items_per_page=10,
+        socketed_ratio=0.5,
+    )
+    assert (again_path / SHARED_STASH_NAME).read_bytes() == (
+        tmp_path / SHARED_STASH_NAME
+    ).read_bytes()
+
+
+def test_run_benchmarks(tmp_path):
+    generate_save_folder(
+        tmp_path, characters=1, shared_pages=2, personal_pages=1
+    )
+    results = run_benchmarks(str(tmp_path), repeat=2, with_gui=False)
+    assert list(results) == [
+        stage for stage in STAGES if stage not in GUI_STAGES
+    ]
+    for summary in results.values():
+        assert summary['runs'] == 2
+        assert summary['min'] <= summary['median'] <= summary['max']
@@ -0,0 +1,155 @@
+import json
+from pathlib import Path
+
+import pytest
+
+from hg502_tracker import catalog
+from hg502_tracker.catalog import (
+    ItemRules,
+    build_canonical_table,
+    build_catalog,
+    load_catalog,
+)
+from hg502_tracker.grail import GrailLayout
+from hg502_tracker.scanner import SET_ITEM, UNIQUE_ITEM
+
+RULES = ItemRules()
+RULES.exclude(UNIQUE_ITEM, [123, 4095])
+RULES.add_equivalent(UNIQUE_ITEM, 392, 396)
+RULES.set_suffix(UNIQUE_ITEM, 392, 'Lightning')
+
+
+@pytest.fixture
+def catalog_path(tmp_path):
+    return str(tmp_path / 'catalog.json')
+
+
+def _fail_build(*args):
+    raise AssertionError('The catalog must not be rebuilt')
+
+
+def test_build_catalog():
+    set_dict, unique_dict, set_bases, unique_bases = build_catalog(RULES)
+    assert len(set_dict) == 127
+    assert 123 not in unique_dict
+    assert 4095 not in unique_dict
+    assert 396 not in unique_dict
+    assert unique_dict[392] == 'Rainbow Facet Lightning'
+
+    # Every slot has a base item, the bases are not affected by suffixes.
+    assert set_bases.keys() == set_dict.keys()
+    assert unique_bases.keys() == unique_dict.keys()
+    assert unique_bases[248] == 'Shako'
+    assert unique_bases[392] == 'Jewel'
+    assert set_bases[79] == 'Lacquered Plate'
+
+
+def test_bases_file():
+    from d2lib.items_storage import ItemsDataStorage
+
+    item_storage = ItemsDataStorage()
+    with open(catalog.BASES_PATH) as bases_file:
+        base_codes = json.load(bases_file)
+    for kind, items_dict in (
+        (SET_ITEM, item_storage.get_set_dict()),
+        (UNIQUE_ITEM, item_storage.get_unique_dict()),
+    ):
+        item_ids = [item_id for item_id, _ in base_codes[kind]]
+        assert item_ids == sorted(items_dict)
+        for _, code in base_codes[kind]:
+            assert catalog._get_base_name(item_storage, code) is not None
+
+
+def test_build_canonical_table():
+    set_dict, unique_dict, _, _ = build_catalog(RULES)
+    layout = GrailLayout(set_dict, unique_dict)
+    table = build_canonical_table(set_dict, unique_dict, RULES, layout)
+
+    slot = table[UNIQUE_ITEM, 392]
+    assert table[UNIQUE_ITEM, 396] is slot
+    assert slot[:2] == (392, 'Rainbow Facet Lightning')
+    assert slot[2] == layout.get_unique_bit(392) != 0
+    assert table[UNIQUE_ITEM, 123] is None
+    assert (UNIQUE_ITEM, 100000) not in table
+    assert table[SET_ITEM, 0][2] == layout.get_set_bit(0) == 1
+
+
+def test_load_catalog(catalog_path, monkeypatch):
+    expected = build_catalog(RULES)
+    assert load_catalog(catalog_path, RULES) == expected
+
+    monkeypatch.setattr(catalog, 'build_catalog', _fail_build)
+    assert load_catalog(catalog_path, RULES) == expected
+
+
+@pytest.mark.parametrize(
+    'field,value', (('version', 0), ('d2lib', '0.0.0'), ('rules', []))
+)
+def test_load_catalog_outdated(catalog_path, field, value):
+    expected = load_catalog(catalog_path, RULES)
+    with open(catalog_path) as catalog_file:
+        data = json.load(catalog_file)
+    data[field] = value
+    data['set'] = []
+    with open(catalog_path, 'w') as catalog_file:
+        json.dump(data, catalog_file)
+
+    assert load_catalog(catalog_path, RULES) == expected
+    with open(catalog_path) as catalog_file:
+        assert json.load(catalog_file)[field] != value
+
+
+def test_load_catalog_other_rules(catalog_path):
+    load_catalog(catalog_path, RULES)
+    _, unique_dict, _, unique_bases = load_catalog(catalog_path, ItemRules())
+    assert 123 in unique_dict
+    assert 396 in unique_dict
+    assert unique_dict[392] == 'Rainbow Facet'
+    assert unique_bases[396] == 'Jewel'
+
+
+@pytest.mark.parametrize('data', ('', '[]', '{"version": 1}'))
+def test_load_catalog_invalid(catalog_path, data):
+    with open(catalog_path, 'w') as catalog_file:
+        catalog_file.write(data)
+    expected = build_catalog(RULES)
+    assert load_catalog(catalog_path, RULES) == expected
+
+
+def test_load_catalog_read_only(tmp_path):
+    # The directory cannot be created where a file is.
+    tmp_path.joinpath('file').write_text('')
+    catalog_path = str(tmp_path / 'file' / 'catalog.json')
+    expected = build_catalog(RULES)
+    assert load_catalog(catalog_path, RULES) == expected
+    assert list(tmp_path.iterdir()) == [tmp_path / 'file']
+
+
+def test_load_catalog_default_paths(tmp_path, user_dir, monkeypatch):
+    shipped_path = tmp_path / 'package' / 'catalog.json'
+    monkeypatch.setattr(catalog, 'CATALOG_PATH', str(shipped_path))
+    default_rules = ItemRules()
+    expected = build_catalog(default_rules)
+    cache_paths = [
+        Path(catalog.get_catalog_cache_path(rules))
+        for rules in (default_rules, RULES)
+    ]
+    for cache_path in cache_paths:
+        if cache_path.exists():
+            cache_path.unlink()
+
+    # The shipped file is only read, the catalog of each rules is stored in
+    # the user directory.
+    assert load_catalog() == expected
+    assert load_catalog(rules=RULES) == build_catalog(RULES)
+    assert not shipped_path.exists()
+    for cache_path in cache_paths:
+        assert cache_path.parent == user_dir / '.hg502_catalogs'
+        assert cache_path.exists()
+
+    load_catalog(str(shipped_path))
+    for cache_path in cache_paths:
+        cache_path.unlink()
+    monkeypatch.setattr(catalog, 'build_catalog', _fail_build)
+    assert load_catalog() == expected
+    assert not any(cache_path.exists() for cache_path in cache_paths)
@@ -0,0 +1,181 @@
+import csv
+import io
+import json
+import shutil
+import subprocess
+import sys
+from pathlib import Path
+
+from hg502_tracker.cli import main
+
+SAVE_PATH = 'data'
+
+
+def _load_expected():
+    expected = {}
+    for stat_type in ('total', 'set', 'unique'):
+        with open(f'{SAVE_PATH}/{stat_type}_stat.json') as stat_file:
+            expected[stat_type] = json.load(stat_file)
+    return expected
+
+
+def test_cli_json(capsys):
+    assert main([SAVE_PATH]) == 0
+    assert json.loads(capsys.readouterr().out) == _load_expected()
+
+
+def test_cli_json_no_items(capsys):
+    assert main(['--no-items', SAVE_PATH]) == 0
+    stat = json.loads(capsys.readouterr().out)
+    for stat_type, stat_dict in _load_expected().items():
+        del stat_dict['found_items']
+        del stat_dict['remaining_items']
+        assert stat[stat_type] == stat_dict
+
+
+def test_cli_batch(capsys, tmp_path):
+    args = ['--batch', '--workers', '0', SAVE_PATH, str(tmp_path)]
+    assert main(args) == 0
+    stat = json.loads(capsys.readouterr().out)
+    assert stat == {SAVE_PATH: _load_expected(), str(tmp_path): None}
+
+
+def test_cli_no_fast_scan(capsys, monkeypatch):
+    def _scan_items(file_path):
+        raise AssertionError('the fast scanner is used')
+
+    monkeypatch.setattr('hg502_tracker.hg502.scan_items', _scan_items)
+    assert main(['--no-fast-scan', SAVE_PATH]) == 0
+    assert json.loads(capsys.readouterr().out) == _load_expected()
+
+    monkeypatch.setenv('HG502_NO_FAST_SCAN', '1')
+    assert main([SAVE_PATH]) == 0
+    assert json.loads(capsys.readouterr().out) == _load_expected()
+
+
+def test_cli_csv(capsys):
+    assert main(['--format', 'csv', SAVE_PATH]) == 0
+    rows = list(csv.DictReader(io.StringIO(capsys.readouterr().out)))
+    expected = _load_expected()
+    assert [row['type'] for row in rows] == list(expected)
+    for row in rows:
+        stat_dict = expected[row['type']]
+        assert row['folder'] == SAVE_PATH
+        assert int(row['total_found']) == stat_dict['total_found']
+        assert int(row['total_remaining']) == stat_dict['total_remaining']
+
+
+def test_cli_csv_folders(capsys, tmp_path):
+    folders = [tmp_path / 'characters', tmp_path / 'stashes']
+    for folder in folders:
+        folder.mkdir()
+    shutil.copy(f'{SAVE_PATH}/test_d2s.d2s', str(folders[0]))
+    shutil.copy(f'{SAVE_PATH}/test_d2x.d2x', str(folders[1]))
+    shutil.copy(f'{SAVE_PATH}/test_sss.sss', str(folders[1]))
+    args = ['--format', 'csv'] + [str(folder) for folder in folders]
+    assert main(args) == 0
+    rows = list(csv.DictReader(io.StringIO(capsys.readouterr().out)))
+    expected = _load_expected()
+    assert [row['type'] for row in rows] == list(expected)
+    for row in rows:
+        assert row['folder'] == ''
+        assert int(row['total_found']) == expected[row['type']]['total_found']
+
+
+def test_cli_cache(capsys, tmp_path):
+    cache_path = tmp_path / 'cache'
+    assert main(['--cache', str(cache_path), SAVE_PATH]) == 0
+    assert cache_path.exists()
+    assert main(['--cache', str(cache_path), SAVE_PATH]) == 0
+    out = capsys.readouterr().out
+    assert out.count('"total"') == 2
+
+
+def test_cli_no_files(capsys, tmp_path):
+    assert main([str(tmp_path)]) == 1
+    assert 'does not contain Diablo 2 files' in capsys.readouterr().err
+
+
+def test_cli_without_gui():
+    code = 'import sys, hg502_tracker.cli; print("PyQt5" in sys.modules)'
+    out = subprocess.check_output([sys.executable, '-c', code], text=True)
+    assert out.strip() == 'False'
+
+
+def test_cli_where(capsys):
+    assert main(['--where', "tal rasha's guard", SAVE_PATH]) == 0
+    assert json.loads(capsys.readouterr().out) == {
+        "Tal Rasha's Guardianship": [
+            {'file': f'{SAVE_PATH}/test_d2s.d2s', 'location': 'character'},
+            {'file': f'{SAVE_PATH}/test_sss.sss', 'location': 'page 21'},
+        ]
+    }
+
+    # Tal Rasha's Guardianship is a Lacquered Plate.
+    assert main(['--where', 'lacquered plate', SAVE_PATH]) == 0
+    assert list(json.loads(capsys.readouterr().out)) == [
+        "Tal Rasha's Guardianship"
+    ]
+
+    assert main(['--where', 'zzzz', SAVE_PATH]) == 0
+    assert json.loads(capsys.readouterr().out) == {}
+
+
+def test_cli_where_csv(capsys):
+    assert main(['--format', 'csv', '--where', 'guardianship', SAVE_PATH]) == 0
+    rows = list(csv.reader(io.StringIO(capsys.readouterr().out)))
+    assert rows[0] == ['name', 'file', 'location']
+    assert ["Tal Rasha's Guardianship", f'{SAVE_PATH}/test_d2s.d2s'] == (
+        rows[1][:2]
+    )
+
+
+def test_cli_duplicates(capsys, tmp_path):
+    assert main(['--duplicates', SAVE_PATH]) == 0
+    duplicates = json.loads(capsys.readouterr().out)
+    assert list(duplicates) == ['set', 'unique']
+    assert duplicates['set']["Tal Rasha's Guardianship"] == 2
+
+    assert main(['--duplicates', '--batch', SAVE_PATH, str(tmp_path)]) == 0
+    assert json.loads(capsys.readouterr().out) == {
+        SAVE_PATH: duplicates,
+        str(tmp_path): None,
+    }
+
+    assert main(['--duplicates', '--format', 'csv', SAVE_PATH]) == 0
+    rows = list(csv.reader(io.StringIO(capsys.readouterr().out)))
+    assert rows[0] == ['folder', 'type', 'name', 'copies']
+    assert len(rows) == 1 + len(duplicates['set']) + len(duplicates['unique'])
+
+
+def test_cli_missing_folder(capsys, tmp_path):
+    missing_path = str(tmp_path / 'missing')
+    assert main([missing_path, SAVE_PATH]) == 0
+    captured = capsys.readouterr()
+    assert json.loads(captured.out) == _load_expected()
+    assert f'Skipped {missing_path}: folder not found' in captured.err
+
+
+def test_cli_bad_file(capsys, tmp_path):
+    for path in Path(SAVE_PATH).iterdir():
+        if path.suffix != '.json':
+            shutil.copy(path, tmp_path)
+    bad_path = tmp_path / 'bad.d2s'
+    bad_path.write_bytes(b'\xff' * 1024)
+    assert main([str(tmp_path)]) == 0
+    captured = capsys.readouterr()
+    assert json.loads(captured.out) == _load_expected()
+    assert captured.err.startswith(f'Skipped {bad_path}: ')
+
+
+def test_cli_recursive(capsys, tmp_path):
+    mules_path = tmp_path / 'mules'
+    mules_path.mkdir()
+    for path in Path(SAVE_PATH).iterdir():
+        if path.suffix != '.json':
+            shutil.copy(path, mules_path)
+    assert main([str(tmp_path)]) == 1
+    assert main(['--recursive', '--exclude', 'mules', str(tmp_path)]) == 1
+    capsys.readouterr()
+    assert main(['--recursive', str(tmp_path)]) == 0
+    assert json.loads(capsys.readouterr().out) == _load_expected()
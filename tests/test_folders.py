@@ -0,0 +1,155 @@
+import os
+from pathlib import Path
+
+import pytest
+
+from hg502_tracker import folders
+from hg502_tracker.folders import SaveScanner, find_save_folders
+
+
+def _make_folder(save_dir):
+    for rel_path in (
+        'a.d2s',
+        'a.key',
+        'a.ma0',
+        '_LOD_SharedStashSave.sss',
+        'mules/b.d2s',
+        'mules/b.d2x',
+        'mules/old/c.d2s',
+        'backup/a.d2s',
+    ):
+        path = save_dir.joinpath(rel_path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_bytes(b'')
+
+
+def _scan(scanner, save_dir):
+    return sorted(
+        Path(file_path).relative_to(save_dir).as_posix()
+        for file_path in scanner.scan(str(save_dir))
+    )
+
+
+def test_save_scanner(tmp_path):
+    _make_folder(tmp_path)
+    assert _scan(SaveScanner(), tmp_path) == [
+        '_LOD_SharedStashSave.sss',
+        'a.d2s',
+    ]
+    assert _scan(SaveScanner(recursive=True), tmp_path) == [
+        '_LOD_SharedStashSave.sss',
+        'a.d2s',
+        'backup/a.d2s',
+        'mules/b.d2s',
+        'mules/b.d2x',
+        'mules/old/c.d2s',
+    ]
+    scanner = SaveScanner(
+        recursive=True, include=('*.d2s',), exclude=('backup', '*/old')
+    )
+    assert _scan(scanner, tmp_path) == ['a.d2s', 'mules/b.d2s']
+    scanner = SaveScanner(recursive=True, include=('mules/*',))
+    assert _scan(scanner, tmp_path) == [
+        'mules/b.d2s',
+        'mules/b.d2x',
+        'mules/old/c.d2s',
+    ]
+
+
+def test_save_scanner_listings(monkeypatch, tmp_path):
+    _make_folder(tmp_path)
+    scanned = []
+    scandir = os.scandir
+
+    def _scandir(path):
+        scanned.append(Path(path).relative_to(tmp_path).as_posix())
+        return scandir(path)
+
+    monkeypatch.setattr(folders.os, 'scandir', _scandir)
+    for path in (tmp_path, tmp_path / 'mules'):
+        os.utime(path, ns=(0, 0))
+    scanner = SaveScanner(recursive=True)
+    files = scanner.scan(str(tmp_path))
+    assert sorted(scanned) == ['.', 'backup', 'mules', 'mules/old']
+
+    # Recently modified directories are read again.
+    scanned.clear()
+    assert scanner.scan(str(tmp_path)) == files
+    assert sorted(scanned) == ['backup', 'mules/old']
+
+    # Files are stat'ed even if the listing is reused.
+    a_path = tmp_path / 'a.d2s'
+    a_path.write_bytes(b'a')
+    os.utime(tmp_path, ns=(0, 0))
+    assert scanner.scan(str(tmp_path))[str(a_path)][0] == 1
+
+    tmp_path.joinpath('mules', 'd.d2s').write_bytes(b'')
+    os.utime(tmp_path / 'mules', ns=(10 ** 9, 10 ** 9))
+    scanned.clear()
+    assert len(scanner.scan(str(tmp_path))) == len(files) + 1
+    assert 'mules' in scanned
+
+
+def test_save_scanner_watched(monkeypatch, tmp_path):
+    _make_folder(tmp_path)
+    for path in (tmp_path, tmp_path / 'mules', tmp_path / 'mules' / 'old'):
+        os.utime(path, ns=(0, 0))
+    scanner = SaveScanner(recursive=True, watched=True)
+    files = scanner.scan(str(tmp_path))
+    stated = []
+    stat = os.stat
+
+    def _stat(path):
+        if path.endswith(folders.SAVE_SUFFIXES):
+            stated.append(Path(path).relative_to(tmp_path).as_posix())
+        return stat(path)
+
+    monkeypatch.setattr(folders.os, 'stat', _stat)
+    # Only the files of the recently modified directory are stat'ed.
+    assert scanner.scan(str(tmp_path)) == files
+    assert sorted(stated) == [
+        'backup/a.d2s'
+    ]
+
+    # A file written in place is stat'ed again once it is reported.
+    a_path = tmp_path / 'a.d2s'
+    a_path.write_bytes(b'a')
+    os.utime(tmp_path, ns=(0, 0))
+    assert scanner.scan(str(tmp_path))[str(a_path)][0] == 0
+    scanner.mark_changed(str(a_path))
+    stated.clear()
+    assert scanner.scan(str(tmp_path))[str(a_path)][0] == 1
+    assert sorted(stated) == [
+        '_LOD_SharedStashSave.sss',
+        'a.d2s',
+        'backup/a.d2s',
+    ]
+
+    scanner.forget_files()
+    stated.clear()
+    assert len(scanner.scan(str(tmp_path))) == len(files)
+    assert len(stated) == len(files)
+
+
+def test_save_scanner_not_found(tmp_path):
+    with pytest.raises(FileNotFoundError):
+        SaveScanner().scan(str(tmp_path / 'missing'))
+
+
+def test_find_save_folders(tmp_path):
+    drive_path = tmp_path.joinpath('.wine', 'drive_c')
+    saves_path = drive_path.joinpath('users', 'user', 'Saved Games')
+    saves_path.joinpath('Diablo II').mkdir(parents=True)
+    saves_path.joinpath('Diablo II', 'a.d2s').write_bytes(b'')
+    drive_path.joinpath('Program Files', 'Diablo II', 'Save').mkdir(
+        parents=True
+    )
+    prefix_path = tmp_path.joinpath('Games', 'diablo-ii', 'drive_c')
+    prefix_path.joinpath('Diablo II', 'Save').mkdir(parents=True)
+    prefix_path.joinpath('Diablo II', 'Save', 'a.d2x').write_bytes(b'')
+
+    assert find_save_folders(tmp_path) == [
+        str(saves_path.joinpath('Diablo II')),
+        str(prefix_path.joinpath('Diablo II', 'Save')),
+    ]
+    assert find_save_folders(tmp_path / 'missing') == []
@@ -0,0 +1,80 @@
+import pytest
+
+from hg502_tracker.grail import GrailLayout, GrailState
+from hg502_tracker.hg502 import HG502
+
+SAVE_PATH = 'data'
+
+
+@pytest.fixture(scope='module')
+def layout():
+    return GrailLayout({30: 'c', 10: 'a', 20: 'b'}, {5: 'x', 1: 'y'})
+
+
+def test_grail_layout(layout):
+    assert layout.set_ids == (10, 20, 30)
+    assert layout.unique_ids == (1, 5)
+    assert layout.size == 5
+    assert layout.byte_size == 1
+    assert layout.set_mask == 0b00111
+    assert layout.unique_mask == 0b11000
+    assert layout.checksum == GrailLayout([10, 20, 30], [1, 5]).checksum
+    assert layout.checksum != GrailLayout([10, 20], [1, 5]).checksum
+
+
+def test_grail_state(layout):
+    state = layout.make_state([30, 10, 99], [5])
+    assert state.bits == 0b10101
+    assert len(state) == 3
+    assert state.set_count == 2
+    assert state.unique_count == 1
+    assert state.get_set_ids() == [10, 30]
+    assert state.get_unique_ids() == [5]
+    assert not layout.empty
+    assert layout.empty == layout.make_state()
+
+    remaining = ~state
+    assert remaining.get_set_ids() == [20]
+    assert remaining.get_unique_ids() == [1]
+    assert len(state | remaining) == layout.size
+    assert not state & remaining
+
+
+def test_grail_state_compare(layout):
+    first = layout.make_state([10, 20], [1])
+    second = layout.make_state([20], [1, 5])
+    common, only_first, only_second = first.compare(second)
+    assert common == layout.make_state([20], [1])
+    assert only_first == layout.make_state([10])
+    assert only_second == layout.make_state(unique_ids=[5])
+    assert first - second == only_first
+    assert hash(common) == hash(layout.make_state([20], [1]))
+
+    other_layout = GrailLayout([10, 20, 30], [1, 5])
+    assert first != other_layout.make_state([10, 20], [1])
+    with pytest.raises(ValueError):
+        first | other_layout.empty
+
+
+def test_grail_state_serialization(layout):
+    state = layout.make_state([10, 30], [1, 5])
+    data = state.to_bytes()
+    assert len(data) == layout.byte_size
+    assert layout.from_bytes(data) == state
+
+    with pytest.raises(ValueError):
+        layout.from_bytes(b'\x00\x00')
+    with pytest.raises(ValueError):
+        layout.from_bytes(b'\xff')
+
+
+def test_grail_state_hg502():
+    hg502 = HG502()
+    total_stat, set_stat, unique_stat = hg502.get_hg502_stat(SAVE_PATH)
+    state = hg502.get_grail_state()
+    assert isinstance(state, GrailState)
+    assert state.layout.byte_size == 63
+    assert state.set_count == set_stat['total_found']
+    assert state.unique_count == unique_stat['total_found']
+    assert len(state) == total_stat['total_found']
+    assert state.layout.from_bytes(state.to_bytes()) == state
@@ -0,0 +1,182 @@
+import os
+from pathlib import Path
+
+import pytest
+
+pytest.importorskip('PyQt5')
+
+ROOT_PATH = Path(__file__).absolute().parent.parent
+
+
+@pytest.fixture(scope='module')
+def qapp():
+    os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+    from PyQt5.QtWidgets import QApplication
+
+    return QApplication.instance() or QApplication([])
+
+
+@pytest.fixture
+def gui(qapp, monkeypatch):
+    monkeypatch.chdir(ROOT_PATH.joinpath('hg502_tracker'))
+    from hg502_tracker.gui import HG502GUI
+
+    gui = HG502GUI()
+    yield gui
+    gui.close()
+
+
+def _get_rows(list_view):
+    model = list_view.model()
+    return [model.index(row, 0).data() for row in range(model.rowCount())]
+
+
+def test_item_list_model(qapp):
+    from hg502_tracker.gui import _ItemListModel
+
+    model = _ItemListModel()
+    assert model.rowCount() == 0
+    model.set_parts((['a', 'b'], [], ['c']))
+    assert model.rowCount() == 3
+    assert [model.index(row, 0).data() for row in range(3)] == ['a', 'b', 'c']
+    model.set_parts(())
+    assert model.rowCount() == 0
+
+
+def test_gui_lazy_tabs(gui):
+    gui.set_widgets_status('enable')
+    gui.fill_set_items_list(['Set 1'], ['Set 2'])
+    gui.fill_unique_items_list(['Unique 1'], [])
+    gui.fill_all_items_list((['Set 1'], ['Unique 1']), (['Set 2'], []))
+
+    assert gui._items_tab.currentWidget() is gui._all_tab
+    assert _get_rows(gui._all_list_found) == ['Set 1', 'Unique 1']
+    assert _get_rows(gui._all_list_remaining) == ['Set 2']
+    assert _get_rows(gui._set_list_found) == []
+
+    gui._items_tab.setCurrentWidget(gui._set_tab)
+    assert _get_rows(gui._set_list_found) == ['Set 1']
+    assert _get_rows(gui._set_list_remaining) == ['Set 2']
+    assert _get_rows(gui._unique_list_found) == []
+
+
+def test_gui_search(gui):
+    from hg502_tracker.search import SearchIndex
+
+    gui.set_widgets_status('enable')
+    gui.set_search_index(SearchIndex(['Set 1', 'Set 2', 'Unique 1']))
+    gui.fill_all_items_list((['Set 1', 'Set 2'], ['Unique 1']), ([],))
+    gui.fill_set_items_list(['Set 1', 'Set 2'], [])
+
+    gui._search_line.setText('set')
+    assert gui._search_timer.isActive()
+    gui._search_handler()
+    assert _get_rows(gui._all_list_found) == ['Set 1', 'Set 2']
+
+    gui._search_line.setText('uniquee 1')
+    gui._search_handler()
+    assert _get_rows(gui._all_list_found) == ['Unique 1']
+    gui._items_tab.setCurrentWidget(gui._set_tab)
+    assert _get_rows(gui._set_list_found) == []
+
+    gui._search_line.setText('')
+    gui._search_handler()
+    assert _get_rows(gui._set_list_found) == ['Set 1', 'Set 2']
+
+
+def test_about_window_is_lazy(gui):
+    gui.set_about_data('HG502', '1.0', 'MIT', 'Author', 'mail', 'page')
+    assert gui._about is None
+
+    gui._show_about()
+    assert gui._about._version_value.text() == '1.0'
+    assert gui._about.isVisible()
+    gui.close()
+    assert not gui._about.isVisible()
+
+
+def test_gui_item_tooltips(gui):
+    from PyQt5.QtCore import Qt
+
+    gui.fill_all_items_list((['Set 1'], []), ([], []))
+    index = gui._all_list_found.model().index(0, 0)
+    assert index.data(Qt.ToolTipRole) is None
+
+    gui.set_item_tooltip_func(lambda name: f'{name}: character')
+    assert index.data(Qt.ToolTipRole) == 'Set 1: character'
+
+
+def test_gui_duplicates(gui):
+    gui.set_widgets_status('enable')
+    gui.fill_duplicates_list(({'Set 1': 2}, {'Unique 1': 3}))
+    assert _get_rows(gui._duplicates_list) == []
+
+    gui._items_tab.setCurrentWidget(gui._duplicates_tab)
+    assert _get_rows(gui._duplicates_list) == ['Set 1 (2)', 'Unique 1 (3)']
+
+    from hg502_tracker.search import SearchIndex
+
+    gui.set_search_index(SearchIndex(['Set 1', 'Unique 1']))
+    gui._search_line.setText('unique')
+    gui._search_handler()
+    assert _get_rows(gui._duplicates_list) == ['Unique 1 (3)']
+
+
+def test_item_list_model_diff(qapp):
+    from hg502_tracker.gui import _ItemListModel
+
+    model = _ItemListModel()
+    model.set_parts((['a', 'c', 'd'],))
+    changes = []
+    model.modelReset.connect(lambda: changes.append('reset'))
+    model.rowsInserted.connect(
+        lambda parent, first, last: changes.append(('insert', first, last))
+    )
+    model.rowsRemoved.connect(
+        lambda parent, first, last: changes.append(('remove', first, last))
+    )
+
+    model.set_parts((['a', 'c'], ['d']))
+    assert changes == []
+    model.set_parts((['a', 'b', 'c', 'd'],))
+    assert changes == [('insert', 1, 1)]
+    model.set_parts((['b', 'c', 'd'],))
+    assert changes[1:] == [('remove', 0, 0)]
+    assert [model.index(row, 0).data() for row in range(3)] == ['b', 'c', 'd']
+    model.set_parts(())
+    assert changes[2:] == ['reset']
+
+
+def test_item_count_model_diff(qapp):
+    from hg502_tracker.gui import _ItemCountModel
+
+    model = _ItemCountModel()
+    model.set_parts(({'a': 2, 'b': 2},))
+    changed = []
+    model.dataChanged.connect(
+        lambda first, last: changed.append(first.row())
+    )
+    model.set_parts(({'a': 2, 'b': 3},))
+    assert changed == [1]
+    assert model.index(1, 0).data() == 'b (3)'
+
+
+def test_gui_keeps_scroll_and_selection(gui):
+    gui.set_widgets_status('enable')
+    found = [f'Item {number:03}' for number in range(200)]
+    gui.fill_all_items_list((found,), ([],))
+    list_view = gui._all_list_found
+    list_view.setCurrentIndex(list_view.model().index(150, 0))
+    list_view.scrollTo(list_view.currentIndex())
+    scroll = list_view.verticalScrollBar().value()
+    assert scroll
+
+    gui.fill_all_items_list((['Item'] + found,), ([],))
+    assert list_view.currentIndex().data() == 'Item 150'
+    assert list_view.verticalScrollBar().value() == scroll
+
+    gui.fill_stat_table([['1', '2', '3', '4']])
+    item = gui._stat_table.item(0, 0)
+    gui.fill_stat_table([['1', '5', '3', '4']])
+    assert gui._stat_table.item(0, 0) is item
+    assert gui._stat_table.item(0, 1).text() == '5'
@@ -1,13 +1,27 @@
 import json
+import os
+import threading
+import time
+import tracemalloc
 from pathlib import Path
+from types import SimpleNamespace
 
 import pytest
 
-from hg502_tracker.hg502 import HG502
+from hg502_tracker import hg502 as hg502_module
+from hg502_tracker.catalog import ItemRules
+from hg502_tracker.folders import SaveScanner, scan_save_files
+from hg502_tracker.grail import GrailState
+from hg502_tracker.hg502 import (
+    _FILE_CLASSES,
+    HG502,
+    FileParseError,
+    ParseInterrupted,
+)
+from hg502_tracker.metrics import Metrics
+from hg502_tracker.scanner import LOC_CHARACTER, UNIQUE_ITEM
 
 SAVE_PATH = 'data'
-ITEMS_DICT = {0: 'Test0', 1: 'Test1', 2: 'Test2', 3: 'Test3'}
-USER_ITEMS_DICT = {4: 'Test4', 5: 'Test5'}
 
 
 @pytest.fixture(scope='module')
@@ -43,30 +57,10 @@ def test_hg502_constructor(hg502):
         assert level_up_facet_id not in hg502._unique_dict
 
     assert hg502._save_path is None
-    assert not hg502._user_set_items
-    assert not hg502._user_unique_items
-    assert isinstance(hg502._user_set_items, dict)
-    assert isinstance(hg502._user_unique_items, dict)
-
-
-def test_hg502_get_stat_dict(hg502):
-    stat_dict = hg502._get_stat_dict()
-    assert stat_dict
-    assert isinstance(stat_dict, dict)
-    assert stat_dict['total_items'] == 0
-    assert stat_dict['total_found'] == 0
-    assert stat_dict['total_remaining'] == 0
-    assert stat_dict['progress'] == 0.0
-    assert isinstance(stat_dict['found_items'], list)
-    assert isinstance(stat_dict['remaining_items'], list)
-
-
-@pytest.mark.parametrize(
-    'total,part,expected',
-    ((150, 15, 10.0), (100, 100, 100.0), (502, 348, 69.32270916334662)),
-)
-def test_hg502_calc_percentage(hg502, total, part, expected):
-    assert hg502._calc_percentage(total, part) == expected
+    assert not hg502._user_items
+    assert isinstance(hg502._user_items, GrailState)
+    assert hg502._layout.set_count == 127
+    assert hg502._layout.unique_count == 375
 
 
 def test_hg502_get_hg502_stat(hg502_expected):
@@ -77,51 +71,28 @@ def test_hg502_get_hg502_stat(hg502_expected):
     assert unique_stat == unique_stat_exp
 
 
-@pytest.mark.parametrize(
-    'stat_dict,items_dict,user_items_dict,expected',
-    (
-        (
-            {
-                'total_items': 0,
-                'total_found': 0,
-                'total_remaining': 0,
-                'progress': 0.0,
-                'found_items': [],
-                'remaining_items': [],
-            },
-            ITEMS_DICT,
-            USER_ITEMS_DICT,
-            {
-                'total_items': 4,
-                'total_found': 2,
-                'total_remaining': 2,
-                'progress': 50.0,
-                'found_items': ['Test4', 'Test5'],
-                'remaining_items': [],
-            },
-        ),
-    ),
-)
-def test_hg502_get_common_stat(
-    hg502, stat_dict, items_dict, user_items_dict, expected
-):
-    hg502._get_common_stat(stat_dict, items_dict, user_items_dict)
-    assert stat_dict == expected
-
+def test_hg502_get_hg502_stat_memo(hg502_expected):
+    hg502, _, set_stat_exp, unique_stat_exp = hg502_expected
+    stats = hg502.get_hg502_stat(SAVE_PATH)
+    assert hg502.get_hg502_stat(SAVE_PATH) is stats
+    assert list(stats.all_found) == sorted(
+        set_stat_exp['found_items'] + unique_stat_exp['found_items']
+    )
+    assert len(stats.all_remaining) == (
+        set_stat_exp['total_remaining'] + unique_stat_exp['total_remaining']
+    )
 
-@pytest.mark.parametrize(
-    'items_dict,user_items_dict,expected',
-    ((ITEMS_DICT, USER_ITEMS_DICT, {0, 1, 2, 3}),),
-)
-def test_hg502_get_remaining_ids(hg502, items_dict, user_items_dict, expected):
-    assert hg502._get_remaining_ids(items_dict, user_items_dict) == expected
+    counted_stats = hg502.get_hg502_stat(SAVE_PATH, with_counts=True)
+    assert counted_stats is not stats
+    assert hg502.get_cached_stat(with_counts=True) is counted_stats
+    assert hg502.get_cached_stat() is not counted_stats
 
 
 def test_hg502_load_user_items(hg502):
     hg502._load_user_items(SAVE_PATH)
     assert hg502._save_path == SAVE_PATH
-    assert hg502._user_set_items
-    assert hg502._user_unique_items
+    assert hg502._user_items.set_count
+    assert hg502._user_items.unique_count
 
 
 def test_hg502_load_user_items_invalid_path(hg502):
@@ -130,22 +101,511 @@ def test_hg502_load_user_items_invalid_path(hg502):
 
 
 @pytest.mark.parametrize(
-    'facet_id,expected', ((392, True), (399, True), (391, False), (400, False))
+    'item_id,slot_id,name',
+    (
+        (392, 392, 'Rainbow Facet Lightning'),
+        (397, 393, 'Rainbow Facet Cold'),
+        (398, 394, 'Rainbow Facet Fire'),
+        (395, 395, 'Rainbow Facet Poison'),
+    ),
 )
-def test_hg502_is_facet(hg502, facet_id, expected):
-    assert hg502._is_facet(facet_id) is expected
+def test_hg502_canonical_facets(hg502, item_id, slot_id, name):
+    slot = hg502._canonical_table[UNIQUE_ITEM, item_id]
+    assert slot[:2] == (slot_id, name)
+    assert slot[2] == hg502._layout.get_unique_bit(slot_id)
 
 
-@pytest.mark.parametrize(
-    'facet_id,expected', ((392, 392), (397, 393), (399, 395), (394, 394))
-)
-def test_hg502_get_die_facet_id(hg502, facet_id, expected):
-    assert hg502._get_die_facet_id(facet_id) == expected
+def test_hg502_canonical_quest_items(hg502):
+    for quest_item_id in hg502._QUESTS_UNIQUE:
+        assert hg502._canonical_table[UNIQUE_ITEM, quest_item_id] is None
+
+
+def test_hg502_custom_rules():
+    hg502 = HG502(rules=ItemRules())
+    assert 123 in hg502._unique_dict
+    assert hg502._unique_dict[392] == 'Rainbow Facet'
+    assert hg502._layout is not HG502()._layout
+    assert HG502(rules=ItemRules())._layout is hg502._layout
+
+
+@pytest.fixture()
+def save_dir(tmp_path):
+    for path in Path(SAVE_PATH).iterdir():
+        if path.suffix in _FILE_CLASSES:
+            tmp_path.joinpath(path.name).write_bytes(path.read_bytes())
+    return tmp_path
+
+
+def test_hg502_load_user_items_cache(hg502_expected, save_dir, monkeypatch):
+    _, total_stat_exp, set_stat_exp, unique_stat_exp = hg502_expected
+    hg502 = HG502()
+    hg502.get_hg502_stat(str(save_dir))
+    assert len(hg502._files_cache[str(save_dir)]) == 3
+
+    parsed = []
+    read_files = hg502._read_files
+
+    def _read_files(file_paths):
+        parsed.extend(Path(file_path).name for file_path in file_paths)
+        return read_files(file_paths)
+
+    monkeypatch.setattr(hg502, '_read_files', _read_files)
+    total_stat, set_stat, unique_stat = hg502.get_hg502_stat(str(save_dir))
+    assert not parsed
+    assert total_stat == total_stat_exp
+    assert set_stat == set_stat_exp
+    assert unique_stat == unique_stat_exp
+
+    d2s_path = save_dir.joinpath('test_d2s.d2s')
+    d2s_path.write_bytes(d2s_path.read_bytes())
+    os.utime(d2s_path, ns=(0, 0))
+    hg502.get_hg502_stat(str(save_dir))
+    assert parsed == ['test_d2s.d2s']
+
+    save_dir.joinpath('test_sss.sss').unlink()
+    hg502.get_hg502_stat(str(save_dir))
+    assert len(hg502._files_cache[str(save_dir)]) == 2
+    assert parsed == ['test_d2s.d2s']
+
+
+def test_hg502_save_load_cache(hg502_expected, save_dir, tmp_path_factory):
+    _, total_stat_exp, set_stat_exp, unique_stat_exp = hg502_expected
+    cache_path = str(tmp_path_factory.mktemp('cache').joinpath('.hg502'))
+    hg502 = HG502()
+    hg502.get_hg502_stat(str(save_dir))
+    hg502.save_cache(cache_path)
+
+    hg502 = HG502()
+    with pytest.raises(FileNotFoundError):
+        hg502.get_cached_stat()
+    assert hg502.load_cache(cache_path) == str(save_dir)
+    total_stat, set_stat, unique_stat = hg502.get_cached_stat()
+    assert total_stat == total_stat_exp
+    assert set_stat == set_stat_exp
+    assert unique_stat == unique_stat_exp
+
+
+def test_hg502_save_cache_unchanged(save_dir, tmp_path):
+    cache_path = str(tmp_path.joinpath('.hg502'))
+    other_path = str(tmp_path.joinpath('.hg502_other'))
+    hg502 = HG502()
+    hg502.get_hg502_stat(str(save_dir))
+    assert hg502.save_cache(cache_path)
+    # Nothing has changed, the file is not written again.
+    hg502.get_hg502_stat(str(save_dir))
+    assert not hg502.save_cache(cache_path)
+    assert hg502.save_cache(other_path)
+
+    os.utime(save_dir.joinpath('test_d2s.d2s'), ns=(0, 0))
+    hg502.get_hg502_stat(str(save_dir))
+    assert hg502.save_cache(cache_path)
+
+    # A file that cannot be parsed changes the quarantine only.
+    bad_path = save_dir.joinpath('bad.d2s')
+    bad_path.write_bytes(b'bad')
+    hg502.get_hg502_stat(str(save_dir))
+    assert hg502.save_cache(cache_path)
+    bad_path.unlink()
+    hg502.get_hg502_stat(str(save_dir))
+    assert hg502.save_cache(cache_path)
+
+    hg502 = HG502()
+    hg502.load_cache(cache_path)
+    assert not hg502.save_cache(cache_path)
+    hg502.get_hg502_stat([str(save_dir), str(tmp_path)])
+    assert hg502.save_cache(cache_path)
 
 
 @pytest.mark.parametrize(
-    'facet_id,expected',
-    ((392, 'Lightning'), (398, 'Fire'), (399, 'Poison'), (393, 'Cold')),
+    'data', ('', '[]', '{"version": 0}', '{"version": 1, "d2lib": "0.0.0"}')
 )
-def test_hg502_get_facet_suffix(hg502, facet_id, expected):
-    assert hg502._get_facet_suffix(facet_id) == expected
+def test_hg502_load_cache_invalid(hg502, tmp_path, data):
+    cache_path = tmp_path.joinpath('.hg502')
+    cache_path.write_text(data)
+    assert hg502.load_cache(str(cache_path)) is None
+    assert hg502.load_cache(str(tmp_path.joinpath('missing'))) is None
+
+
+def test_hg502_get_hg502_stat_workers(hg502_expected):
+    _, total_stat_exp, set_stat_exp, unique_stat_exp = hg502_expected
+    hg502 = HG502(workers=2)
+    try:
+        total_stat, set_stat, unique_stat = hg502.get_hg502_stat(SAVE_PATH)
+        assert hg502._pool is not None
+    finally:
+        hg502.close()
+    assert hg502._pool is None
+    assert total_stat == total_stat_exp
+    assert set_stat == set_stat_exp
+    assert unique_stat == unique_stat_exp
+
+
+def test_hg502_get_hg502_stat_progress(save_dir):
+    hg502 = HG502()
+    calls = []
+    hg502.get_hg502_stat(
+        str(save_dir), progress=lambda *args: calls.append(args)
+    )
+    assert calls == [(0, 3), (1, 3), (2, 3), (3, 3)]
+
+    def _cancel(parsed, total):
+        raise InterruptedError
+
+    os.utime(save_dir.joinpath('test_d2s.d2s'), ns=(0, 0))
+    with pytest.raises(InterruptedError):
+        hg502.get_hg502_stat(str(save_dir), progress=_cancel)
+
+    calls.clear()
+    hg502.get_hg502_stat(
+        str(save_dir), progress=lambda *args: calls.append(args)
+    )
+    assert calls == [(0, 1), (1, 1)]
+
+
+def test_scan_save_files(save_dir):
+    save_dir.joinpath('test.key').write_bytes(b'')
+    files = scan_save_files(str(save_dir))
+    assert sorted(Path(file_path).name for file_path in files) == [
+        'test_d2s.d2s',
+        'test_d2x.d2x',
+        'test_sss.sss',
+    ]
+    d2s_path = save_dir.joinpath('test_d2s.d2s')
+    assert files[str(d2s_path)] == (
+        d2s_path.stat().st_size,
+        d2s_path.stat().st_mtime_ns,
+    )
+
+
+def test_hg502_get_hg502_stat_multiple_roots(hg502_expected, tmp_path):
+    _, total_stat_exp, set_stat_exp, unique_stat_exp = hg502_expected
+    save_paths = []
+    for path in Path(SAVE_PATH).iterdir():
+        if path.suffix in _FILE_CLASSES:
+            root = tmp_path.joinpath(path.stem)
+            root.mkdir()
+            root.joinpath(path.name).write_bytes(path.read_bytes())
+            save_paths.append(str(root))
+
+    hg502 = HG502()
+    total_stat, set_stat, unique_stat = hg502.get_hg502_stat(save_paths)
+    assert total_stat == total_stat_exp
+    assert set_stat == set_stat_exp
+    assert unique_stat == unique_stat_exp
+    assert sorted(hg502._files_cache) == sorted(save_paths)
+
+    calls = []
+    os.utime(next(Path(save_paths[0]).iterdir()), ns=(0, 0))
+    hg502.get_hg502_stat(save_paths, progress=lambda *args: calls.append(args))
+    assert calls == [(0, 1), (1, 1)]
+
+    total_stat, _, _ = hg502.get_hg502_stat(save_paths[1:])
+    assert total_stat['total_found'] < total_stat_exp['total_found']
+    assert sorted(hg502._files_cache) == sorted(save_paths[1:])
+    assert hg502.get_missing_folders() == []
+
+    # A missing folder is skipped, the others are still counted.
+    missing_path = str(tmp_path.joinpath('missing'))
+    stats = hg502.get_hg502_stat([missing_path] + save_paths)
+    assert stats == (total_stat_exp, set_stat_exp, unique_stat_exp)
+    assert hg502.get_missing_folders() == [missing_path]
+    hg502.get_hg502_stat(save_paths)
+    assert hg502.get_missing_folders() == []
+    with pytest.raises(FileNotFoundError):
+        hg502.get_hg502_stat([missing_path])
+
+
+def test_hg502_overlapping_roots(tmp_path):
+    name = "Tal Rasha's Guardianship"
+    saves_dir = tmp_path.joinpath('saves')
+    mules_dir = saves_dir.joinpath('mules')
+    mules_dir.mkdir(parents=True)
+    for path in Path(SAVE_PATH).iterdir():
+        if path.suffix in _FILE_CLASSES:
+            file_dir = mules_dir if path.suffix == '.d2s' else saves_dir
+            file_dir.joinpath(path.name).write_bytes(path.read_bytes())
+    link_dir = tmp_path.joinpath('link')
+    link_dir.symlink_to(saves_dir, target_is_directory=True)
+
+    expected = HG502(scanner=SaveScanner(recursive=True))
+    stats = expected.get_hg502_stat(str(saves_dir), with_counts=True)
+    locations = expected.get_item_locations(name)
+
+    # A nested folder and a folder given twice are counted once.
+    hg502 = HG502(scanner=SaveScanner(recursive=True))
+    save_paths = [str(mules_dir), str(saves_dir), str(link_dir)]
+    assert hg502.get_hg502_stat(save_paths, with_counts=True) == stats
+    assert hg502.get_item_locations(name) == locations
+    assert hg502.get_hg502_stat(save_paths[::-1], with_counts=True) == stats
+    assert len(hg502.get_item_locations(name)) == len(locations)
+    with pytest.raises(ValueError):
+        hg502.get_batch_stat(save_paths[:2])
+
+    # Without recursion the nested folder shares no files.
+    hg502 = HG502()
+    batch_stat = hg502.get_batch_stat(save_paths[:2])
+    assert all(batch_stat.values())
+    with pytest.raises(ValueError):
+        hg502.get_batch_stat(save_paths[1:])
+
+
+def test_hg502_iter_grail_items(hg502, hg502_expected):
+    _, _, set_stat_exp, unique_stat_exp = hg502_expected
+    file_paths = sorted(scan_save_files(SAVE_PATH))
+    items = list(hg502.iter_grail_items(SAVE_PATH))
+    assert [source for source, _, _, _ in items] == sorted(
+        source for source, _, _, _ in items
+    )
+    assert {source for source, _, _, _ in items} == set(file_paths)
+    assert list(hg502.iter_grail_items(file_paths)) == items
+
+    names = {name for _, _, _, name in items}
+    assert sorted(names) == sorted(
+        set_stat_exp['found_items'] + unique_stat_exp['found_items']
+    )
+    for _, kind, item_id, name in items:
+        assert hg502._canonical_table[kind, item_id][1] == name
+
+
+def test_hg502_iter_grail_items_lazy(hg502, monkeypatch):
+    parsed = []
+    read_items = hg502_module._read_items
+
+    def _read_items(file_path, fast_scan=False):
+        parsed.append(file_path)
+        return read_items(file_path, fast_scan)
+
+    monkeypatch.setattr(hg502_module, '_read_items', _read_items)
+    items = hg502.iter_grail_items(SAVE_PATH)
+    assert not parsed
+    next(items)
+    assert len(parsed) == 1
+
+
+@pytest.mark.parametrize('fast_scan', (False, True))
+def test_hg502_iter_grail_items_memory(fast_scan):
+    hg502 = HG502(fast_scan=fast_scan)
+    file_paths = sorted(scan_save_files(SAVE_PATH))
+
+    def _get_peak(repeat):
+        tracemalloc.start()
+        try:
+            for _ in hg502.iter_grail_items(file_paths * repeat):
+                pass
+            return tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+
+    single_peak = _get_peak(1)
+    # The peak is that of one parsed file no matter how many are read.
+    assert _get_peak(5) < single_peak * 1.5 + 64 * 1024
+    assert single_peak < 8 * 1024 * 1024
+
+
+def test_collect_items_deep_sockets():
+    def _item(unique_id, socketed_items=()):
+        return SimpleNamespace(
+            is_set=False,
+            is_unique=True,
+            unique_id=unique_id,
+            name=str(unique_id),
+            socketed_items=list(socketed_items),
+        )
+
+    item = _item(0)
+    for unique_id in range(1, 5000):
+        item = _item(unique_id, [item])
+    records = []
+    hg502_module._collect_items([item, _item(5000)], records, LOC_CHARACTER)
+    assert [record[1] for record in records] == [
+        *range(4999, -1, -1),
+        5000,
+    ]
+
+
+def test_hg502_get_item_locations(save_dir, tmp_path_factory):
+    name = "Tal Rasha's Guardianship"
+    d2s_path = str(save_dir.joinpath('test_d2s.d2s'))
+    sss_path = str(save_dir.joinpath('test_sss.sss'))
+    hg502 = HG502()
+    assert hg502.get_item_locations(name) == []
+    with pytest.raises(KeyError):
+        hg502.get_item_locations('Unknown')
+
+    hg502.get_hg502_stat(str(save_dir))
+    expected = [(d2s_path, 'character'), (sss_path, 'page 21')]
+    assert hg502.get_item_locations(name) == expected
+
+    cache_path = str(tmp_path_factory.mktemp('cache').joinpath('.hg502'))
+    hg502.save_cache(cache_path)
+    cached = HG502()
+    cached.load_cache(cache_path)
+    assert cached.get_item_locations(name) == expected
+
+    save_dir.joinpath('test_sss.sss').unlink()
+    hg502.get_hg502_stat(str(save_dir))
+    assert hg502.get_item_locations(name) == [(d2s_path, 'character')]
+    hg502.get_hg502_stat(SAVE_PATH)
+    assert hg502.get_item_locations(name) == [
+        (f'{SAVE_PATH}/test_d2s.d2s', 'character'),
+        (f'{SAVE_PATH}/test_sss.sss', 'page 21'),
+    ]
+    assert all(
+        SAVE_PATH in file_path
+        for files in hg502._location_index.values()
+        for file_path in files
+    )
+
+
+def test_hg502_filter_items_locations(hg502):
+    items = hg502._filter_items(
+        [
+            (UNIQUE_ITEM, 396, 'Rainbow Facet', 'page 1'),
+            (UNIQUE_ITEM, 392, 'Rainbow Facet', 'page 1'),
+            (UNIQUE_ITEM, 123, 'Quest item', 'page 1'),
+            (UNIQUE_ITEM, 392, 'Rainbow Facet', 'mercenary'),
+        ]
+    )
+    assert items == (
+        (UNIQUE_ITEM, 392, 'page 1', 2),
+        (UNIQUE_ITEM, 392, 'mercenary', 1),
+    )
+
+
+def test_hg502_get_hg502_stat_with_counts(hg502_expected, save_dir):
+    _, total_stat_exp, set_stat_exp, unique_stat_exp = hg502_expected
+    hg502 = HG502()
+    total_stat, set_stat, unique_stat = hg502.get_hg502_stat(
+        str(save_dir), with_counts=True
+    )
+    assert total_stat == total_stat_exp
+    for stat_dict, expected in (
+        (set_stat, set_stat_exp),
+        (unique_stat, unique_stat_exp),
+    ):
+        stat_dict = dict(stat_dict)
+        duplicates = stat_dict.pop('duplicates')
+        assert stat_dict == expected
+        assert duplicates
+        assert list(duplicates) == sorted(duplicates)
+        assert set(duplicates) < set(expected['found_items'])
+        assert all(copies > 1 for copies in duplicates.values())
+
+    # The copies are kept in the cache, no file is parsed again.
+    hg502._read_files = None
+    _, set_stat, _ = hg502.get_cached_stat(with_counts=True)
+    name = "Tal Rasha's Guardianship"
+    assert set_stat['duplicates'][name] == 2
+    assert len(hg502.get_item_locations(name)) == 2
+    _, set_stat, _ = hg502.get_cached_stat()
+    assert 'duplicates' not in set_stat
+
+
+def test_hg502_get_hg502_stat_bad_file(
+    hg502_expected, save_dir, tmp_path_factory
+):
+    _, total_stat_exp, set_stat_exp, unique_stat_exp = hg502_expected
+    bad_path = save_dir.joinpath('bad.d2s')
+    bad_path.write_bytes(b'\xff' * 1024)
+    metrics = Metrics()
+    hg502 = HG502(metrics=metrics)
+    stats = hg502.get_hg502_stat(str(save_dir))
+    assert stats == (total_stat_exp, set_stat_exp, unique_stat_exp)
+    errors = hg502.get_file_errors()
+    assert list(errors) == [str(bad_path)]
+    assert 'Invalid header id' in errors[str(bad_path)]
+    with pytest.raises(FileParseError):
+        list(hg502.iter_grail_items(str(bad_path)))
+    assert len(metrics.report()['files']) == 4
+
+    # The bad file is not parsed again until it changes.
+    assert hg502.get_hg502_stat(str(save_dir)) == stats
+    assert metrics.report()['files'] == {}
+    cache_path = str(tmp_path_factory.mktemp('cache').joinpath('.hg502'))
+    hg502.save_cache(cache_path)
+    cached = HG502()
+    cached.load_cache(cache_path)
+    assert cached.get_file_errors() == errors
+    assert cached.get_file_errors([str(save_dir)]) == errors
+    assert cached.get_file_errors(['other']) == {}
+
+    bad_path.write_bytes(save_dir.joinpath('test_d2s.d2s').read_bytes())
+    hg502.get_hg502_stat(str(save_dir))
+    assert list(metrics.report()['files']) == [str(bad_path)]
+    assert hg502.get_file_errors() == {}
+
+    # Items of the previous version of a file that became bad are dropped.
+    bad_path.write_bytes(b'\xff' * 1024)
+    hg502.get_hg502_stat(str(save_dir))
+    assert list(hg502.get_file_errors()) == [str(bad_path)]
+    assert str(bad_path) not in hg502._files_cache[str(save_dir)]
+    bad_path.unlink()
+    hg502.get_hg502_stat(str(save_dir))
+    assert hg502.get_file_errors() == {}
+
+
+def test_hg502_interrupt(save_dir):
+    hung_path = save_dir.joinpath('hung.d2s')
+    hung_path.write_bytes(save_dir.joinpath('test_d2s.d2s').read_bytes()[:10])
+    hg502 = HG502(timeout=60)
+    timer = threading.Timer(0.5, hg502.interrupt)
+    timer.start()
+    start = time.monotonic()
+    try:
+        with pytest.raises(ParseInterrupted):
+            hg502.get_hg502_stat(str(save_dir))
+        assert time.monotonic() - start < 10
+        # The workers are not terminated, the hung file is left to them.
+        assert hg502._pool is not None
+        assert hg502._abandoned
+    finally:
+        timer.cancel()
+        hg502.close(kill=True)
+    assert hg502._pool is None
+    # The interrupted file is not quarantined, it is parsed again next time.
+    assert hg502.get_file_errors() == {}
+    assert str(hung_path) not in hg502._files_cache[str(save_dir)]
+
+
+def test_hg502_interrupt_next_parse(hg502_expected, save_dir):
+    _, total_stat_exp, set_stat_exp, unique_stat_exp = hg502_expected
+    hung_path = save_dir.joinpath('hung.d2s')
+    hung_path.write_bytes(save_dir.joinpath('test_d2s.d2s').read_bytes()[:10])
+    hg502 = HG502(timeout=1)
+    timer = threading.Timer(0.3, hg502.interrupt)
+    timer.start()
+    try:
+        with pytest.raises(ParseInterrupted):
+            hg502.get_hg502_stat(str(save_dir))
+        pool = hg502._pool
+        hung_path.unlink()
+        os.utime(save_dir.joinpath('test_d2x.d2x'), ns=(0, 0))
+        # The hung file of the interrupted parse is waited for at most the
+        # timeout before the changed file is parsed, then the workers are
+        # restarted.
+        start = time.monotonic()
+        stats = hg502.get_hg502_stat(str(save_dir))
+        assert 1 <= time.monotonic() - start < 10
+        assert hg502._pool is not pool
+        assert not hg502._abandoned
+    finally:
+        timer.cancel()
+        hg502.close(kill=True)
+    assert stats == (total_stat_exp, set_stat_exp, unique_stat_exp)
+    assert hg502.get_file_errors() == {}
+
+
+def test_hg502_get_hg502_stat_timeout(hg502_expected, save_dir):
+    _, total_stat_exp, set_stat_exp, unique_stat_exp = hg502_expected
+    hung_path = save_dir.joinpath('hung.d2s')
+    # d2lib never finishes parsing this truncated file.
+    hung_path.write_bytes(save_dir.joinpath('test_d2s.d2s').read_bytes()[:10])
+    hg502 = HG502(timeout=1)
+    try:
+        stats = hg502.get_hg502_stat(str(save_dir))
+    finally:
+        hg502.close()
+    assert stats == (total_stat_exp, set_stat_exp, unique_stat_exp)
+    assert hg502.get_file_errors() == {
+        str(hung_path): f'{hung_path}: not parsed in 1 s'
+    }
@@ -0,0 +1,112 @@
+import sqlite3
+import time
+
+import pytest
+
+from hg502_tracker.grail import GrailLayout
+from hg502_tracker.history import HistoryStore
+
+LAYOUT = GrailLayout(range(4), range(100, 104))
+DAY = 24 * 60 * 60
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    return str(tmp_path / 'history.db')
+
+
+@pytest.fixture
+def store(db_path):
+    history_store = HistoryStore(db_path, LAYOUT)
+    yield history_store
+    history_store.close()
+
+
+def _count_rows(db_path):
+    connection = sqlite3.connect(db_path)
+    try:
+        return connection.execute('SELECT COUNT(*) FROM changes').fetchone()[0]
+    finally:
+        connection.close()
+
+
+def test_history_record(store, db_path):
+    state = LAYOUT.make_state([0, 1], [100])
+    assert store.record('grail', state, 1000) == 3
+    assert store.record('grail', state, 2000) == 0
+    assert _count_rows(db_path) == 3
+
+    next_state = LAYOUT.make_state([1], [100, 103])
+    assert store.record('grail', next_state, 3000) == 2
+    assert _count_rows(db_path) == 5
+    assert store.get_state('grail') == next_state
+
+
+def test_history_get_state(store):
+    states = [
+        (1000, LAYOUT.make_state([0], [])),
+        (2000, LAYOUT.make_state([0, 2], [101])),
+        (3000, LAYOUT.make_state([2], [101, 102])),
+    ]
+    for timestamp, state in states:
+        store.record('grail', state, timestamp)
+
+    assert store.get_state('grail', 999) == LAYOUT.empty
+    for timestamp, state in states:
+        assert store.get_state('grail', timestamp) == state
+        assert store.get_state('grail', timestamp + 500) == state
+    assert store.get_state('other', 3000) == LAYOUT.empty
+
+
+def test_history_reopen(store, db_path):
+    state = LAYOUT.make_state([3], [103])
+    store.record('grail', state, 1000)
+    store.close()
+
+    reopened = HistoryStore(db_path, LAYOUT)
+    try:
+        assert reopened.get_state('grail') == state
+        assert reopened.record('grail', state) == 0
+        assert reopened.record('grail', LAYOUT.empty) == 2
+    finally:
+        reopened.close()
+
+
+def test_history_get_timeline(store):
+    start = time.mktime((2020, 5, 1, 12, 0, 0, 0, 0, -1))
+    store.record('grail', LAYOUT.make_state([0, 1], []), start)
+    store.record('grail', LAYOUT.make_state([0, 1, 2], []), start + 60)
+    store.record('grail', LAYOUT.make_state([1, 2], [100]), start + 2 * DAY)
+    store.record('other', LAYOUT.make_state([3], []), start)
+
+    assert store.get_timeline('grail') == [
+        ('2020-05-01', 3, 0),
+        ('2020-05-03', 1, 1),
+    ]
+    assert store.get_timeline('unknown') == []
+
+    # Items found again are not new finds.
+    store.record('grail', LAYOUT.make_state([1, 2, 3], []), start + 3 * DAY)
+    store.record('grail', LAYOUT.make_state([2, 3], [100]), start + 4 * DAY)
+    store.record('grail', LAYOUT.make_state([1, 2, 3], [100]), start + 5 * DAY)
+    assert store.get_timeline('grail')[2:] == [
+        ('2020-05-04', 1, 1),
+        ('2020-05-05', 0, 1),
+    ]
+
+
+def test_history_record_partial(store):
+    state = LAYOUT.make_state([0, 1], [100])
+    store.record('grail', state, 1000)
+    assert store.record('grail', LAYOUT.make_state([0], []), 2000, True) == 0
+    partial_state = LAYOUT.make_state([0, 2], [])
+    assert store.record('grail', partial_state, 3000, True) == 1
+    assert store.get_state('grail') == state | partial_state
+    assert store.record('grail', state, 4000) == 1
+
+
+def test_history_invalid_file(db_path):
+    with open(db_path, 'wb') as db_file:
+        db_file.write(b'not a database' * 100)
+    with pytest.raises(sqlite3.DatabaseError):
+        HistoryStore(db_path, LAYOUT)
@@ -0,0 +1,142 @@
+import json
+import pstats
+import threading
+
+from hg502_tracker.cli import main
+from hg502_tracker.hg502 import HG502
+from hg502_tracker.metrics import (
+    Metrics,
+    PrometheusSink,
+    TraceFileSink,
+    create_metrics,
+    format_details,
+    format_summary,
+    is_profiling,
+    profile_thread,
+    profiling,
+)
+
+SAVE_PATH = 'data'
+
+
+def test_metrics_report():
+    reports = []
+    metrics = Metrics([reports.append])
+    with metrics.measure('scan_folder'):
+        pass
+    with metrics.measure('scan_folder'):
+        pass
+    metrics.add_file('a.d2s', 0.5, 10)
+    metrics.add_file('b.d2s', 0.25, 5)
+
+    snapshot = metrics.report()
+    assert reports == [snapshot]
+    assert list(snapshot['phases']) == ['scan_folder', 'parse']
+    assert snapshot['phases']['scan_folder']['calls'] == 2
+    assert snapshot['phases']['parse'] == {
+        'calls': 2,
+        'seconds': 0.75,
+        'blocks': 15,
+    }
+    assert snapshot['files']['a.d2s'] == {'seconds': 0.5, 'blocks': 10}
+    assert format_summary(snapshot).endswith('parse 750.0 ms (2 files)')
+    assert format_details(snapshot, slowest=1).splitlines()[-1] == (
+        'a.d2s: 500.0 ms'
+    )
+
+    assert metrics.report()['phases'] == {}
+    assert len(reports) == 2
+
+
+def test_metrics_backend():
+    metrics = Metrics()
+    backend = HG502(metrics=metrics)
+    backend.get_hg502_stat(SAVE_PATH)
+    snapshot = metrics.report()
+    assert list(snapshot['phases']) == [
+        'scan_folder',
+        'parse',
+        'filter_items',
+        'collect_items',
+        'make_stat',
+    ]
+    assert len(snapshot['files']) == snapshot['phases']['parse']['calls'] > 0
+
+    # Nothing is parsed again, only the cached files are united.
+    backend.get_hg502_stat(SAVE_PATH)
+    snapshot = metrics.report()
+    assert 'parse' not in snapshot['phases']
+    assert snapshot['files'] == {}
+
+
+def test_metrics_sinks(tmp_path):
+    trace_path = tmp_path / 'trace.jsonl'
+    textfile_path = tmp_path / 'hg502.prom'
+    metrics = create_metrics(str(trace_path), str(textfile_path))
+    metrics.add_file('dir/quote".d2s', 0.5)
+    metrics.report()
+    metrics.add_file('dir/quote".d2s', 0.25)
+    metrics.report()
+
+    lines = trace_path.read_text().splitlines()
+    assert [
+        json.loads(line)['phases']['parse']['seconds'] for line in lines
+    ] == [0.5, 0.25]
+    textfile = textfile_path.read_text().splitlines()
+    assert 'hg502_phase_seconds_total{phase="parse"} 0.75' in textfile
+    assert 'hg502_phase_calls_total{phase="parse"} 2' in textfile
+    assert 'hg502_file_parse_seconds{file="dir/quote\\".d2s"} 0.25' in (
+        textfile
+    )
+    assert '# TYPE hg502_phase_seconds_total counter' in textfile
+    assert create_metrics() is None
+
+
+def test_metrics_sink_error(tmp_path):
+    reports = []
+    metrics = Metrics(
+        [TraceFileSink(str(tmp_path / 'missing' / 'trace.jsonl'))]
+    )
+    metrics.add_sink(PrometheusSink(str(tmp_path / 'missing' / 'x.prom')))
+    metrics.add_sink(reports.append)
+    metrics.report()
+    assert len(reports) == 1
+
+
+def test_profiling(tmp_path):
+    profile_path = str(tmp_path / 'hg502.prof')
+    tracemalloc_path = tmp_path / 'tracemalloc.txt'
+    with profiling(profile_path, str(tracemalloc_path)):
+        HG502().get_hg502_stat(SAVE_PATH)
+    assert pstats.Stats(profile_path).total_calls > 0
+    assert tracemalloc_path.read_text().startswith('peak: ')
+
+
+def test_profiling_threads(tmp_path):
+    profile_path = str(tmp_path / 'hg502.prof')
+    hg502 = HG502(timeout=60)
+
+    def refresh():
+        with profile_thread():
+            hg502.get_hg502_stat(SAVE_PATH)
+
+    with profiling(profile_path):
+        assert is_profiling()
+        thread = threading.Thread(target=refresh)
+        thread.start()
+        thread.join()
+    hg502.close()
+    assert not is_profiling()
+    func_names = {
+        func_name for _, _, func_name in pstats.Stats(profile_path).stats
+    }
+    # The refresh thread and the worker processes are profiled.
+    assert 'get_hg502_stat' in func_names
+    assert '_read_file' in func_names
+
+
+def test_cli_metrics(capsys, tmp_path):
+    trace_path = tmp_path / 'trace.jsonl'
+    assert main(['--trace', str(trace_path), SAVE_PATH]) == 0
+    (line,) = trace_path.read_text().splitlines()
+    assert 'parse' in json.loads(line)['phases']
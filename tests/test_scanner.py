@@ -0,0 +1,69 @@
+from pathlib import Path
+
+import pytest
+
+from benchmarks.saves import generate_save_folder
+from hg502_tracker.hg502 import _FILE_CLASSES, HG502, _read_items
+from hg502_tracker.scanner import ScanError, scan_items
+
+SAVE_PATH = 'data'
+FILE_PATHS = sorted(
+    str(path)
+    for path in Path(SAVE_PATH).iterdir()
+    if path.suffix in _FILE_CLASSES
+)
+
+
+@pytest.mark.parametrize('file_path', FILE_PATHS)
+def test_scan_items(file_path):
+    records = scan_items(file_path)
+    assert records
+    assert sorted(records) == sorted(_read_items(file_path))
+
+
+@pytest.mark.parametrize(
+    'seed,socketed_ratio', ((1, 0.0), (2, 0.5), (3, 1.0), (4, 0.3))
+)
+def test_scan_items_generated(tmp_path, seed, socketed_ratio):
+    file_paths = generate_save_folder(
+        tmp_path,
+        characters=2,
+        shared_pages=6,
+        personal_pages=3,
+        items_per_page=12,
+        socketed_ratio=socketed_ratio,
+        seed=seed,
+    )
+    for file_path in file_paths:
+        assert sorted(scan_items(file_path)) == sorted(_read_items(file_path))
+
+
+@pytest.mark.parametrize('file_path', FILE_PATHS)
+def test_scan_items_truncated(tmp_path, file_path):
+    data = Path(file_path).read_bytes()
+    truncated_path = tmp_path.joinpath(Path(file_path).name)
+    truncated_path.write_bytes(data[: len(data) // 2])
+    with pytest.raises(ScanError):
+        scan_items(str(truncated_path))
+
+
+@pytest.mark.parametrize('data', (b'', b'\x00' * 1024))
+def test_scan_items_invalid(tmp_path, data):
+    file_path = tmp_path.joinpath('test.d2s')
+    file_path.write_bytes(data)
+    with pytest.raises(ScanError):
+        scan_items(str(file_path))
+
+
+def test_read_items_fallback(monkeypatch):
+    def _scan_items(file_path):
+        raise ScanError
+
+    monkeypatch.setattr('hg502_tracker.hg502.scan_items', _scan_items)
+    for file_path in FILE_PATHS:
+        assert _read_items(file_path, fast_scan=True) == _read_items(file_path)
+
+
+def test_hg502_get_hg502_stat_fast_scan():
+    expected = HG502().get_hg502_stat(SAVE_PATH)
+    assert HG502(fast_scan=True).get_hg502_stat(SAVE_PATH) == expected
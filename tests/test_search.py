@@ -0,0 +1,107 @@
+import pytest
+
+from hg502_tracker.hg502 import HG502
+from hg502_tracker.search import SearchIndex
+
+
+@pytest.fixture(scope='module')
+def backend():
+    return HG502()
+
+
+@pytest.fixture(scope='module')
+def search_index(backend):
+    return SearchIndex(backend.get_item_names(), backend.get_item_aliases())
+
+
+@pytest.mark.parametrize(
+    'query,expected',
+    (
+        ('Windforce', {'Windforce'}),
+        ('  windFORCE ', {'Windforce'}),
+        ('wind', {'Carrion Wind', 'Frostwind', 'Windforce', 'Windhammer'}),
+        ('xyz', set()),
+        ('harlequin crst', set()),
+    ),
+)
+def test_search(search_index, query, expected):
+    assert search_index.search(query) == expected
+
+
+def test_search_short_query(backend, search_index):
+    names = backend.get_item_names()
+    expected = {name for name in names if 'ax' in name.lower()}
+    expected.update(
+        name
+        for base_name, name in backend.get_item_aliases()
+        if 'ax' in base_name.lower()
+    )
+    assert expected
+    assert search_index.search('Ax') == expected
+
+
+def test_search_empty_query(backend, search_index):
+    assert search_index.search('') == set(backend.get_item_names())
+
+
+@pytest.mark.parametrize(
+    'query,expected',
+    (
+        ('shako', {'Harlequin Crest'}),
+        ('SHAKO', {'Harlequin Crest'}),
+        ('lacquered plate', {"Tal Rasha's Guardianship"}),
+        (
+            'jewel',
+            {
+                'Rainbow Facet Lightning',
+                'Rainbow Facet Cold',
+                'Rainbow Facet Fire',
+                'Rainbow Facet Poison',
+            },
+        ),
+    ),
+)
+def test_search_alias(search_index, query, expected):
+    assert search_index.search(query) == expected
+    assert search_index.search(query, fuzzy=True) == expected
+
+
+def test_search_alias_of_unknown_name():
+    search_index = SearchIndex(['Sigil'], [('Shako', 'Harlequin Crest')])
+    assert search_index.search('shako') == set()
+
+
+@pytest.mark.parametrize(
+    'query', ('harlequin crst', 'harlequinn crest', 'harlekin crest')
+)
+def test_search_fuzzy(search_index, query):
+    assert search_index.search(query, fuzzy=True) == {'Harlequin Crest'}
+
+
+def test_search_fuzzy_alias(search_index):
+    assert search_index.search('shakp', fuzzy=True) == {'Harlequin Crest'}
+
+
+@pytest.mark.parametrize('query', ('sako', 'shkao', 'zod'))
+def test_search_fuzzy_short_query(search_index, query):
+    # Names that share a trigram with a short query are not similar.
+    assert search_index.search(query, fuzzy=True) == set()
+
+
+def test_search_fuzzy_best_only():
+    search_index = SearchIndex(['Sigon Visor', 'Sigon Guard', 'Visor'])
+    assert search_index.search('sigon visr', fuzzy=True) == {'Sigon Visor'}
+
+
+def test_search_fuzzy_exact_first(search_index):
+    assert search_index.search('sigon', fuzzy=True) == search_index.search(
+        'sigon'
+    )
+
+
+def test_search_incremental():
+    search_index = SearchIndex(['Sigon Visor', 'Sigil', 'Visor'])
+    assert search_index.search('si') == {'Sigon Visor', 'Sigil'}
+    assert search_index.search('sig') == {'Sigon Visor', 'Sigil'}
+    assert search_index.search('sigo') == {'Sigon Visor'}
+    assert search_index.search('vis') == {'Sigon Visor', 'Visor'}
@@ -0,0 +1,141 @@
+import json
+import shutil
+import threading
+from pathlib import Path
+from urllib.error import HTTPError
+from urllib.request import urlopen
+
+import pytest
+
+from hg502_tracker.hg502 import HG502
+from hg502_tracker.server import HG502Server
+
+SAVE_PATH = 'data'
+
+
+@pytest.fixture
+def save_dir(tmp_path):
+    for path in Path(SAVE_PATH).iterdir():
+        if path.suffix != '.json':
+            shutil.copy(path, tmp_path)
+    return tmp_path
+
+
+@pytest.fixture
+def serve():
+    servers = []
+
+    def start(save_paths, check_interval=1.0):
+        server = HG502Server(('127.0.0.1', 0), save_paths, check_interval)
+        thread = threading.Thread(target=server.serve_forever)
+        thread.start()
+        servers.append((server, thread))
+        return f'http://127.0.0.1:{server.server_port}'
+
+    yield start
+
+    for server, thread in servers:
+        server.shutdown()
+        thread.join()
+        server.server_close()
+
+
+def _get(url):
+    with urlopen(url) as response:
+        return json.load(response)
+
+
+def _get_error(url):
+    with pytest.raises(HTTPError) as exc_info:
+        urlopen(url)
+    return exc_info.value.code, json.load(exc_info.value)
+
+
+def test_server_shared_catalog():
+    assert HG502()._set_dict is HG502()._set_dict
+    assert HG502()._unique_dict is HG502()._unique_dict
+
+
+def test_server_stat(serve):
+    expected = HG502().get_hg502_stat(SAVE_PATH)
+    base_url = serve([SAVE_PATH])
+
+    assert _get(f'{base_url}/folders') == [SAVE_PATH]
+    stat = _get(f'{base_url}/stat')
+    assert list(stat) == ['total', 'set', 'unique']
+    for stat_dict, expected_dict in zip(stat.values(), expected):
+        assert stat_dict['total_found'] == expected_dict['total_found']
+        assert 'found_items' not in stat_dict
+    assert _get(f'{base_url}/stat?folder={SAVE_PATH}') == stat
+
+    _, set_stat, unique_stat = expected
+    items_url = f'{base_url}/items?type=set&list=found'
+    assert _get(items_url) == set_stat['found_items']
+    items_url = f'{base_url}/items?type=total&list=remaining'
+    assert _get(items_url) == sorted(
+        [*set_stat['remaining_items'], *unique_stat['remaining_items']]
+    )
+
+
+def test_server_errors(serve, tmp_path):
+    base_url = serve([SAVE_PATH, str(tmp_path)])
+
+    assert _get_error(f'{base_url}/stat')[0] == 404
+    assert _get_error(f'{base_url}/stat?folder={tmp_path}')[0] == 404
+    assert _get_error(f'{base_url}/unknown')[0] == 404
+    status, body = _get_error(
+        f'{base_url}/items?folder={SAVE_PATH}&type=set&list=all'
+    )
+    assert status == 400
+    assert 'list' in body['error']
+
+
+def test_server_refresh(serve, save_dir, monkeypatch):
+    read_files = []
+    original_read_files = HG502._read_files
+
+    def _read_files(self, file_paths):
+        read_files.extend(file_paths)
+        return original_read_files(self, file_paths)
+
+    monkeypatch.setattr(HG502, '_read_files', _read_files)
+    base_url = serve([str(save_dir)], check_interval=0)
+    stat = _get(f'{base_url}/stat')
+    assert len(read_files) == 3
+
+    read_files.clear()
+    assert _get(f'{base_url}/stat') == stat
+    assert not read_files
+
+    (save_dir / 'test_sss.sss').unlink()
+    changed_stat = _get(f'{base_url}/stat')
+    assert changed_stat != stat
+    assert not read_files
+
+
+def test_server_file_errors(serve, save_dir):
+    bad_path = save_dir / 'bad.d2s'
+    bad_path.write_bytes(b'\xff' * 1024)
+    base_url = serve([str(save_dir)])
+    total_stat = HG502().get_hg502_stat(SAVE_PATH)[0]
+    assert _get(f'{base_url}/stat')['total']['total_found'] == (
+        total_stat['total_found']
+    )
+    errors = _get(f'{base_url}/errors')
+    assert list(errors) == [str(bad_path)]
+
+
+def test_server_read_error(serve, save_dir, monkeypatch):
+    original_get_hg502_stat = HG502.get_hg502_stat
+
+    def _get_hg502_stat(self, save_path, *args, **kwargs):
+        raise PermissionError('Permission denied')
+
+    monkeypatch.setattr(HG502, 'get_hg502_stat', _get_hg502_stat)
+    base_url = serve([str(save_dir)], check_interval=0)
+    status, body = _get_error(f'{base_url}/stat')
+    assert status == 503
+    assert 'Permission denied' in body['error']
+
+    monkeypatch.setattr(HG502, 'get_hg502_stat', original_get_hg502_stat)
+    assert _get(f'{base_url}/stat')['total']['total_found']
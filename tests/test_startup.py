@@ -0,0 +1,37 @@
+import os
+import re
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest
+
+pytest.importorskip('PyQt5')
+pytest.importorskip('qdarkstyle')
+
+ROOT_PATH = Path(__file__).absolute().parent.parent
+# Time to the first paint of the main window that fails the test, it can be
+# changed for slow machines.
+STARTUP_BUDGET_MS = float(os.environ.get('HG502_STARTUP_BUDGET_MS', 2000))
+
+
+def test_startup_time(tmp_path):
+    env = dict(
+        os.environ,
+        HOME=str(tmp_path),
+        PYTHONPATH=str(ROOT_PATH),
+        QT_QPA_PLATFORM='offscreen',
+        HG502_STARTUP_TIME='exit',
+    )
+    result = subprocess.run(
+        [sys.executable, 'main.py'],
+        cwd=str(ROOT_PATH.joinpath('hg502_tracker')),
+        env=env,
+        stderr=subprocess.PIPE,
+        text=True,
+        timeout=60,
+    )
+    assert result.returncode == 0, result.stderr
+    match = re.search(r'time-to-first-paint: ([\d.]+) ms', result.stderr)
+    assert match, result.stderr
+    assert float(match.group(1)) < STARTUP_BUDGET_MS
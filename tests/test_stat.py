@@ -0,0 +1,74 @@
+import pytest
+
+from hg502_tracker.stat import (
+    GrailStat,
+    ItemNames,
+    ItemStat,
+    MergedNames,
+    make_name_order,
+)
+
+NAMES = {'a': 'Delta', 'b': 'Alpha', 'c': 'Charlie', 'd': 'Bravo'}
+ORDER = make_name_order(NAMES, ('a', 'b', 'c', 'd'), 2)
+
+
+def test_make_name_order():
+    assert ORDER == (('Alpha', 3), ('Bravo', 5), ('Charlie', 4), ('Delta', 2))
+
+
+def test_item_names():
+    names = ItemNames(ORDER, 0b011101, 3)
+    assert len(names) == 3
+    assert names._names is None
+    assert names == ['Alpha', 'Charlie', 'Delta']
+    assert names[0] == 'Alpha'
+    assert list(names) == ['Alpha', 'Charlie', 'Delta']
+    assert ['Alpha', 'Charlie', 'Delta'] == names
+
+
+def test_merged_names():
+    parts = (ItemNames(ORDER, 0b100100, 2), ('Beta', 'Echo'))
+    names = MergedNames(parts)
+    assert len(names) == 4
+    assert names == ('Beta', 'Bravo', 'Delta', 'Echo')
+
+
+def test_item_stat():
+    stat = ItemStat(4, 1, ('Alpha',), ('Bravo', 'Charlie', 'Delta'))
+    assert stat['progress'] == 25.0
+    assert stat.total_remaining == 3
+    assert 'duplicates' not in stat
+    assert dict(stat) == {
+        'total_items': 4,
+        'total_found': 1,
+        'total_remaining': 3,
+        'progress': 25.0,
+        'found_items': ('Alpha',),
+        'remaining_items': ('Bravo', 'Charlie', 'Delta'),
+    }
+    with pytest.raises(AttributeError):
+        stat.extra = None
+    with pytest.raises(AttributeError):
+        stat.total_found = 2
+    with pytest.raises(AttributeError):
+        del stat.progress
+
+    stat = ItemStat(duplicates={})
+    assert stat['duplicates'] == {}
+    with pytest.raises(TypeError):
+        stat['duplicates']['Alpha'] = 2
+    assert stat['found_items'] == []
+    assert len(stat) == 7
+
+
+def test_grail_stat():
+    set_stat = ItemStat(2, 1, ('Bravo',), ('Delta',))
+    unique_stat = ItemStat(2, 1, ('Alpha',), ('Charlie',))
+    total_stat = ItemStat(4, 2)
+    stats = GrailStat(None, total_stat, set_stat, unique_stat)
+    assert stats == (total_stat, set_stat, unique_stat)
+    assert stats[1] is set_stat
+    assert stats.all_found == ['Alpha', 'Bravo']
+    assert stats.all_remaining == ['Charlie', 'Delta']
+    with pytest.raises(AttributeError):
+        stats.set_stat = unique_stat